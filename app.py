@@ -1,42 +1,94 @@
+import time
+import uuid
+from contextlib import nullcontext
+from dataclasses import asdict
+
 import streamlit as st
-import numpy as np
 
 # Import functions from our custom modules
-from src.config import API_KEY, BASE_ENERGY_PER_COMPLEXITY, LLM_SIZE_MULTIPLIERS
-from src.optimization_logic import (
-    load_embedding_model,
-    get_prompt_embedding,
-    find_most_similar_example_prompt,
-    estimate_local_complexity,
-    perform_gemini_optimization
+from src.engine import MODE_COMPRESS, MODE_GEMINI, MODE_LOCAL
+from src.config import (
+    HISTORY_RECENT_LIMIT,
+    HISTORY_USER_HEADER,
+    INSTRUMENTATION_ENABLED,
+    LIVE_PREVIEW_DEBOUNCE_MS,
+    LONG_DOCUMENT_MIN_CHARS,
+    SCHEDULER_TENANT_HEADER,
 )
+from src.instrumentation import metrics, trace
+from src.scheduler import SchedulerRejectedError
 from src.ui_components import (
     set_page_config_and_css,
     render_sidebar,
     render_main_header,
-    render_results_section # NEW IMPORT
+    render_results_section, # NEW IMPORT
+    render_history_section,
+    render_document_sections,
+    render_live_preview,
+    live_prompt_input,
+    render_developer_panel
+)
+from utils.data_loader import (
+    load_embedding_service,
+    get_analysis_history,
+    get_prompt_optimizer,
+    get_live_analyzer,
+    example_optimized_prompts
 )
-from utils.data_loader import get_example_optimized_embeddings, example_optimized_prompts
 
-# --- Initialize Models and Data ---
-embedding_model = load_embedding_model()
-example_optimized_prompt_embeddings = get_example_optimized_embeddings(example_optimized_prompts, embedding_model)
+# Maps the optimization method labels shown in the UI to engine modes
+OPTIMIZATION_MODES = {
+    "Local Heuristic Optimization": MODE_LOCAL,
+    "Generative AI Optimization (Gemini API)": MODE_GEMINI,
+    "Local Compression (Rule-Based)": MODE_COMPRESS,
+}
+MODE_LABELS = {mode: label for label, mode in OPTIMIZATION_MODES.items()}
+
+PROMPT_PLACEHOLDER = "e.g., 'Generate a detailed report on the global climate change impacts of industrialization over the last two centuries, including socio-economic factors and future projections.'"
+
+def live_preview_panel(prompt: str, llm_size: str):
+    """Live local estimate; recomputed only when the prompt or LLM size changed since the last one."""
+    current = st.session_state.get('live_preview')
+    if current is None or current.prompt != prompt or current.llm_size != llm_size:
+        optimizer = get_prompt_optimizer(example_optimized_prompts, embedding_service)
+        current = get_live_analyzer(example_optimized_prompts, optimizer).preview(prompt, llm_size)
+        st.session_state['live_preview'] = current
+    render_live_preview(current)
 
 # --- Streamlit UI Setup ---
 set_page_config_and_css()
 render_sidebar()
 render_main_header()
 
+# --- Initialize Models and Data ---
+# Returns immediately; the embedding model warms up on a background thread while the page renders.
+# The example embeddings, index and engine are loaded on the first analysis.
+embedding_service = load_embedding_service()
+
+# Every analysis is appended to the shared history log; the session only keeps its id
+history = get_analysis_history()
+session_id = st.session_state.setdefault('session_id', uuid.uuid4().hex)
+analysis_failed = False
+
 # --- Input Section ---
 with st.container(border=False):
     st.markdown('<div class="input-section-bg">', unsafe_allow_html=True)
     st.markdown('<h3 style="color: #1e40af;"><img src="https://api.iconify.design/lucide/edit.svg?color=%231e40af" width="24" height="24" /> Your AI Prompt:</h3>', unsafe_allow_html=True)
-    user_prompt = st.text_area(
-        "Enter your prompt here:",
-        placeholder="e.g., 'Generate a detailed report on the global climate change impacts of industrialization over the last two centuries, including socio-economic factors and future projections.'",
-        height=150,
-        label_visibility="collapsed"
-    )
+    # The toggle below is rendered later, but its state already holds this run's value
+    live_preview = st.session_state.get('live_preview_enabled', False)
+    if live_preview:
+        # Reports the text after each pause in typing; the text carries over to the plain box
+        user_prompt = live_prompt_input(st.session_state.get('prompt_text', ''), PROMPT_PLACEHOLDER, 150,
+                                        LIVE_PREVIEW_DEBOUNCE_MS, key='live_prompt_input')
+        st.session_state['prompt_text'] = user_prompt
+    else:
+        user_prompt = st.text_area(
+            "Enter your prompt here:",
+            placeholder=PROMPT_PLACEHOLDER,
+            height=150,
+            key='prompt_text',
+            label_visibility="collapsed"
+        )
 
     st.markdown('<h3 style="color: #1e40af; margin-top: 1.5rem;"><img src="https://api.iconify.design/lucide/hard-drive.svg?color=%231e40af" width="24" height="24" /> Target LLM Size:</h3>', unsafe_allow_html=True)
     llm_size = st.selectbox(
@@ -53,61 +105,70 @@ with st.container(border=False):
     st.markdown('<h3 style="color: #1e40af; margin-top: 1.5rem;"><img src="https://api.iconify.design/lucide/settings.svg?color=%231e40af" width="24" height="24" /> Optimization Method:</h3>', unsafe_allow_html=True)
     optimization_mode = st.radio(
         "Choose how to optimize your prompt:",
-        ("Local Heuristic Optimization", "Generative AI Optimization (Gemini API)"),
+        tuple(OPTIMIZATION_MODES),
         index=0, # Default to local heuristic
         horizontal=True,
         label_visibility="collapsed"
     )
 
+    st.toggle("Live preview (local estimate while you type)", value=False, key='live_preview_enabled')
+    if live_preview and user_prompt.strip():
+        live_preview_panel(user_prompt, llm_size)
+
     if st.button("⚡ Analyze Energy & Optimize", use_container_width=True):
         if not user_prompt.strip():
             st.error("Please enter a prompt to analyze.")
         else:
             with st.spinner(f"Analyzing prompt and calculating energy estimates using {optimization_mode}..."):
                 try:
-                    original_energy_calc = 0.0
-                    optimized_energy_calc = 0.0
-                    most_similar_optimized_prompt = ""
-                    similarity_score = 0.0
-
-                    if optimization_mode == "Local Heuristic Optimization":
-                        user_prompt_embedding = get_prompt_embedding(user_prompt, embedding_model)
-                        most_similar_optimized_prompt, similarity_score = find_most_similar_example_prompt(
-                            user_prompt_embedding, example_optimized_prompt_embeddings, example_optimized_prompts
+                    optimizer = get_prompt_optimizer(example_optimized_prompts, embedding_service)
+                    user_id = st.context.headers.get(HISTORY_USER_HEADER)
+                    # Each click is one interactive request for the user's tenant: rate limited and fairly queued
+                    scheduled = (optimizer.scheduler.request(st.context.headers.get(SCHEDULER_TENANT_HEADER) or user_id)
+                                 if optimizer.scheduler is not None else nullcontext())
+                    start = time.perf_counter()
+                    with trace("analyze", mode=OPTIMIZATION_MODES[optimization_mode], llm_size=llm_size) as record, scheduled:
+                        # Long prompts also get a per-section cost breakdown, whose chunked encode
+                        # doubles as the prompt's embedding
+                        document = (optimizer.analyze_document(user_prompt, llm_size)
+                                    if len(user_prompt) > LONG_DOCUMENT_MIN_CHARS else None)
+                        result = optimizer.analyze(user_prompt, llm_size, OPTIMIZATION_MODES[optimization_mode],
+                                                   embedding=document.embedding if document is not None else None)
+                    duration_ms = (time.perf_counter() - start) * 1000
+                    if result.mode != OPTIMIZATION_MODES[optimization_mode]:
+                        st.warning("The Gemini API is currently unavailable, so the Local Heuristic Optimization result is shown instead.")
+
+                    # The result shown is the one just computed; the log only feeds the history panel
+                    st.session_state['latest_analysis'] = asdict(result)
+                    if history is not None:
+                        history.record(
+                            result, user_id=user_id, session_id=session_id,
+                            source="app", duration_ms=duration_ms, stages_ms=record["stages_ms"] if record else None,
+                            cache_hit=record["labels"].get("cache_hit", False) if record else None,
                         )
-                        original_prompt_complexity = estimate_local_complexity(user_prompt)
-                        optimized_prompt_complexity = estimate_local_complexity(most_similar_optimized_prompt)
-
-                    elif optimization_mode == "Generative AI Optimization (Gemini API)":
-                        # This mode uses Gemini API for generation and complexity estimation
-                        result = perform_gemini_optimization(user_prompt, example_optimized_prompts, API_KEY)
-                        
-                        most_similar_optimized_prompt = result["generatedOptimizedPrompt"]
-                        similarity_score = result["similarityScore"]
-                        original_prompt_complexity = result["originalPromptComplexity"]
-                        optimized_prompt_complexity = result["optimizedPromptComplexity"]
-                        
-                        if not all([most_similar_optimized_prompt, similarity_score is not None, original_prompt_complexity is not None, optimized_prompt_complexity is not None]):
-                             raise ValueError("Gemini API did not return all expected data.")
-
-                    # Calculate mock energy based on complexity and LLM size (common to both modes)
-                    original_energy_calc = (original_prompt_complexity / 100) * BASE_ENERGY_PER_COMPLEXITY * LLM_SIZE_MULTIPLIERS[llm_size]
-                    optimized_energy_calc = (optimized_prompt_complexity / 100) * BASE_ENERGY_PER_COMPLEXITY * LLM_SIZE_MULTIPLIERS[llm_size]
-
-                    st.session_state['original_energy'] = original_energy_calc
-                    st.session_state['optimized_prompt'] = most_similar_optimized_prompt
-                    st.session_state['optimized_energy'] = optimized_energy_calc
-                    st.session_state['similarity_score'] = float(similarity_score) # Cast to float
-                    st.session_state['llm_size_display'] = llm_size # Store for display
-                    st.session_state['optimization_mode_display'] = optimization_mode # Store for display
-                    
+                    st.session_state['latest_document'] = document.to_dict() if document is not None else None
+
+                except SchedulerRejectedError as e:
+                    st.warning(f"{e}")
+                    analysis_failed = True
                 except Exception as e:
                     st.error(f"An error occurred during analysis using {optimization_mode}: {e}. Please ensure API key is valid for Generative AI mode, or all libraries are installed for Local mode.")
-                    st.session_state['original_energy'] = None # Reset state on error
+                    analysis_failed = True # Hide the previous result on error
     st.markdown('</div>', unsafe_allow_html=True) # Close input-section-bg div
 
 
-render_results_section()
+latest_analysis = st.session_state.get('latest_analysis')
+if latest_analysis is not None and not analysis_failed:
+    render_results_section(latest_analysis, MODE_LABELS.get(latest_analysis['mode'], "Unknown Mode"))
+    if st.session_state.get('latest_document') is not None:
+        render_document_sections(st.session_state['latest_document'])
+recent_analyses = history.recent(session_id=session_id, limit=HISTORY_RECENT_LIMIT) if history is not None else []
+session_totals = history.totals(session_id=session_id) if recent_analyses else []
+if session_totals:
+    render_history_section(recent_analyses, session_totals[0])
+
+if INSTRUMENTATION_ENABLED:
+    render_developer_panel(metrics.recent_traces(), metrics.to_json())
 
 st.markdown("---")
 st.markdown(
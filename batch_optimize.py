@@ -0,0 +1,241 @@
+# batch_optimize.py
+"""
+Headless batch optimization for offline prompt corpora.
+
+Streams prompts from a JSONL or CSV file through a process pool, runs the Local Heuristic
+Optimization pipeline on each one and writes per-prompt energy and savings results. Memory
+stays bounded: input is read lazily in chunks and at most --max-in-flight chunks are queued.
+Progress is checkpointed after every written chunk, so an interrupted run resumes where it
+stopped. With --dedup, near-duplicate prompts are first collapsed into clusters (MinHash LSH,
+see src/near_duplicates.py) and only one representative per cluster is analysed; the
+clusters file maps every input id to the id whose result applies to it.
+
+Usage:
+    python batch_optimize.py prompts.jsonl results.jsonl --llm-size medium --workers 8
+    python batch_optimize.py prompts.csv results.csv --prompt-field text --resume
+    python batch_optimize.py prompts.jsonl results.jsonl --dedup --clusters clusters.jsonl
+"""
+
+import argparse
+import csv
+import itertools
+import json
+import multiprocessing
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from io import StringIO
+
+from src.config import LLM_SIZE_MULTIPLIERS, NEAR_DUPLICATE_MIN_JACCARD, PROMPT_LIBRARY_DIR
+
+RESULT_FIELDS = [
+    "id", "llm_size", "original_complexity", "optimized_prompt", "optimized_complexity",
+    "similarity_score", "original_energy_kwh", "optimized_energy_kwh", "savings_kwh", "savings_pct",
+    "original_tokens", "optimized_tokens",
+]
+
+# --- Input / Output ---
+
+def _detect_format(path: str, explicit: str | None) -> str:
+    if explicit:
+        return explicit
+    return "csv" if path.lower().endswith(".csv") else "jsonl"
+
+def iter_prompts(path: str, fmt: str, prompt_field: str, id_field: str):
+    """Lazily yields (id, prompt) pairs from a JSONL or CSV file, skipping blank prompts."""
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        if fmt == "csv":
+            records = csv.DictReader(f)
+        else:
+            records = (json.loads(line) for line in f if line.strip())
+        for line_no, record in enumerate(records):
+            prompt = (record.get(prompt_field) or "").strip()
+            if prompt:
+                yield record.get(id_field, line_no), prompt
+
+def _format_rows(results: list[dict], fmt: str) -> str:
+    if fmt == "csv":
+        buffer = StringIO()
+        csv.DictWriter(buffer, fieldnames=RESULT_FIELDS).writerows(results)
+        return buffer.getvalue()
+    return "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in results)
+
+# --- Deduplication ---
+
+def dedup_corpus(input_path: str, fmt: str, prompt_field: str, id_field: str,
+                 representatives_path: str, clusters_path: str, min_jaccard: float) -> tuple[int, int]:
+    """
+    Collapses near-duplicate prompts before any of them is analysed.
+
+    Reads the input twice: once to cluster the prompts, once to write the representatives
+    ({"id", "prompt"} JSONL, the input of the batch run) and one {"id", "representative",
+    "similarity"} line per prompt to the clusters file. Both files are written under
+    temporary names and renamed when complete, so a resumed run can trust them.
+
+    Returns:
+        (prompts read, clusters found).
+    """
+    from src.near_duplicates import cluster_near_duplicates
+
+    representatives, similarities = cluster_near_duplicates(
+        (prompt for _, prompt in iter_prompts(input_path, fmt, prompt_field, id_field)), min_jaccard)
+    representative_ids = {}
+    with open(representatives_path + ".tmp", "w", encoding="utf-8") as reps, \
+            open(clusters_path + ".tmp", "w", encoding="utf-8") as clusters:
+        for position, (record_id, prompt) in enumerate(iter_prompts(input_path, fmt, prompt_field, id_field)):
+            representative = int(representatives[position])
+            if representative == position:
+                representative_ids[position] = record_id
+                reps.write(json.dumps({"id": record_id, "prompt": prompt}, ensure_ascii=False) + "\n")
+            clusters.write(json.dumps({"id": record_id, "representative": representative_ids[representative],
+                                       "similarity": round(float(similarities[position]), 4)}, ensure_ascii=False) + "\n")
+    os.replace(clusters_path + ".tmp", clusters_path)
+    os.replace(representatives_path + ".tmp", representatives_path)
+    return len(representatives), len(representative_ids)
+
+# --- Checkpointing ---
+
+def load_checkpoint(path: str) -> dict:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"records_done": 0, "output_bytes": 0}
+
+def save_checkpoint(path: str, records_done: int, output_bytes: int):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"records_done": records_done, "output_bytes": output_bytes, "updated_at": time.time()}, f)
+    os.replace(tmp_path, path)
+
+# --- Worker Process ---
+
+_worker_state = {}
+
+def _init_worker(llm_size: str):
+    """Builds one warm PromptOptimizer per worker; the example store is memory-mapped and shared."""
+    from src.engine import PromptOptimizer
+
+    _worker_state.update(optimizer=PromptOptimizer.from_config(offline=True), llm_size=llm_size)
+
+def _process_chunk(chunk: list[tuple]) -> list[dict]:
+    results = _worker_state["optimizer"].analyze_many([prompt for _, prompt in chunk], _worker_state["llm_size"])
+    return [
+        {
+            "id": record_id,
+            "llm_size": result.llm_size,
+            "original_complexity": round(result.original_complexity, 4),
+            "optimized_prompt": result.optimized_prompt,
+            "optimized_complexity": round(result.optimized_complexity, 4),
+            "similarity_score": round(result.similarity_score, 4),
+            "original_energy_kwh": result.original_energy,
+            "optimized_energy_kwh": result.optimized_energy,
+            "savings_kwh": result.energy_savings,
+            "savings_pct": result.savings_percentage,
+            "original_tokens": result.original_tokens,
+            "optimized_tokens": result.optimized_tokens,
+        }
+        for (record_id, _), result in zip(chunk, results)
+    ]
+
+# --- Driver ---
+
+def run_batch(args) -> int:
+    from data.optimized_prompts import example_optimized_prompts
+    from src.embedding_backends import EMBEDDING_STORE_KEY, load_embedding_backend
+    from src.prompt_library import PromptLibrary, has_library
+    from utils.embedding_store import load_or_build_embeddings
+
+    input_path, prompt_field, id_field = args.input, args.prompt_field, args.id_field
+    in_fmt = _detect_format(args.input, args.input_format)
+    out_fmt = _detect_format(args.output, args.output_format)
+    checkpoint_path = args.checkpoint or args.output + ".ckpt"
+
+    if args.dedup:
+        representatives_path = args.output + ".representatives.jsonl"
+        if not (args.resume and os.path.exists(representatives_path)):
+            total, clusters = dedup_corpus(input_path, in_fmt, prompt_field, id_field, representatives_path,
+                                           args.clusters or args.output + ".clusters.jsonl", args.dedup_min_jaccard)
+            print(f"Collapsed {total} prompts into {clusters} near-duplicate clusters", file=sys.stderr)
+        # From here on the batch runs over one representative per cluster
+        input_path, in_fmt, prompt_field, id_field = representatives_path, "jsonl", "prompt", "id"
+
+    checkpoint = load_checkpoint(checkpoint_path) if args.resume else {"records_done": 0, "output_bytes": 0}
+    records_done = checkpoint["records_done"]
+
+    # Build the on-disk example stores once up front; workers then only memory-map them
+    model = load_embedding_backend()
+    if has_library(PROMPT_LIBRARY_DIR):
+        PromptLibrary(PROMPT_LIBRARY_DIR, model)
+    else:
+        load_or_build_embeddings(example_optimized_prompts, model, EMBEDDING_STORE_KEY)
+
+    output = open(args.output, "a+b" if args.resume else "wb")
+    try:
+        if args.resume:
+            # Drop any rows written after the last checkpoint, then continue from there
+            output.truncate(checkpoint["output_bytes"])
+            output.seek(checkpoint["output_bytes"])
+        if out_fmt == "csv" and output.tell() == 0:
+            output.write((",".join(RESULT_FIELDS) + "\r\n").encode("utf-8"))
+
+        prompts = itertools.islice(iter_prompts(input_path, in_fmt, prompt_field, id_field), records_done, None)
+        chunks = iter(lambda: list(itertools.islice(prompts, args.chunk_size)), [])
+
+        started = time.perf_counter()
+        processed = input_tokens = 0
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=args.workers, mp_context=context, initializer=_init_worker,
+                                 initargs=(args.llm_size,)) as pool:
+            in_flight = deque()
+            for chunk in itertools.chain(chunks, [None]):
+                if chunk is not None:
+                    in_flight.append((pool.submit(_process_chunk, chunk), len(chunk)))
+                # Results are written in input order, so the checkpoint is a simple record count
+                while in_flight and (chunk is None or len(in_flight) >= args.max_in_flight):
+                    future, size = in_flight.popleft()
+                    rows = future.result()
+                    output.write(_format_rows(rows, out_fmt).encode("utf-8"))
+                    output.flush()
+                    records_done += size
+                    processed += size
+                    input_tokens += sum(row["original_tokens"] for row in rows)
+                    save_checkpoint(checkpoint_path, records_done, output.tell())
+                    elapsed = time.perf_counter() - started
+                    print(f"\r{records_done} prompts done ({processed / elapsed:.1f}/s, "
+                          f"{input_tokens} input tokens this run)", end="", file=sys.stderr)
+        print(file=sys.stderr)
+    finally:
+        output.close()
+    return records_done
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("input", help="Input JSONL or CSV file of prompts.")
+    parser.add_argument("output", help="Output JSONL or CSV file for per-prompt results.")
+    parser.add_argument("--input-format", choices=["jsonl", "csv"], help="Defaults to the input file extension.")
+    parser.add_argument("--output-format", choices=["jsonl", "csv"], help="Defaults to the output file extension.")
+    parser.add_argument("--prompt-field", default="prompt", help="Field/column holding the prompt text.")
+    parser.add_argument("--id-field", default="id", help="Field/column copied to the result id (defaults to row number).")
+    parser.add_argument("--llm-size", choices=list(LLM_SIZE_MULTIPLIERS), default="medium")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--chunk-size", type=int, default=256, help="Prompts per worker task.")
+    parser.add_argument("--max-in-flight", type=int, default=None,
+                        help="Chunks queued at once; bounds memory (default 2 x workers).")
+    parser.add_argument("--checkpoint", help="Checkpoint file (default <output>.ckpt).")
+    parser.add_argument("--resume", action="store_true", help="Continue from the checkpoint instead of starting over.")
+    parser.add_argument("--dedup", action="store_true",
+                        help="Analyse one representative per cluster of near-duplicate prompts.")
+    parser.add_argument("--clusters", help="Where --dedup maps each id to its representative (default <output>.clusters.jsonl).")
+    parser.add_argument("--dedup-min-jaccard", type=float, default=NEAR_DUPLICATE_MIN_JACCARD,
+                        help="Estimated word-overlap similarity at which prompts are merged.")
+    args = parser.parse_args(argv)
+    args.max_in_flight = args.max_in_flight or 2 * args.workers
+
+    total = run_batch(args)
+    print(f"Wrote results for {total} prompts to {args.output}", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+# benchmarks/ann_recall.py
+"""
+Recall-vs-exact benchmark for the example prompt index.
+
+Builds a synthetic clustered embedding library, then compares IVF lookups at several
+n_probe settings against the exact FlatIndex scan, reporting recall@k and latency.
+
+Usage:
+    python -m benchmarks.ann_recall --size 1000000 --queries 200 --k 5
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from src.ann_index import FlatIndex, IVFIndex, normalise_rows
+
+def make_clustered_embeddings(size: int, dim: int, num_clusters: int, seed: int = 0) -> np.ndarray:
+    """Generates unit-length embeddings grouped around random topic centres, like a prompt library."""
+    rng = np.random.default_rng(seed)
+    centres = normalise_rows(rng.standard_normal((num_clusters, dim)))
+    labels = rng.integers(0, num_clusters, size)
+    # Per-dimension noise of 0.8/sqrt(dim) gives a noise vector of norm ~0.8 around each unit centre
+    noise = rng.standard_normal((size, dim)).astype(np.float32) * (0.8 / np.sqrt(dim))
+    return normalise_rows(centres[labels] + noise)
+
+def _time_queries(index, queries: np.ndarray, k: int, **search_kwargs) -> tuple[list, np.ndarray]:
+    results = []
+    latencies = np.empty(queries.shape[0])
+    for i, query in enumerate(queries):
+        start = time.perf_counter()
+        ids, _ = index.search(query, k, **search_kwargs)
+        latencies[i] = (time.perf_counter() - start) * 1000
+        results.append(ids)
+    return results, latencies
+
+def run(size: int, dim: int, num_queries: int, k: int, n_lists: int | None, probes: list[int]) -> list[dict]:
+    embeddings = make_clustered_embeddings(size, dim, num_clusters=max(8, size // 500))
+    rng = np.random.default_rng(1)
+    queries = normalise_rows(embeddings[rng.integers(0, size, num_queries)]
+                             + rng.standard_normal((num_queries, dim)).astype(np.float32) * 0.05)
+
+    flat = FlatIndex(dim)
+    flat.add(embeddings)
+    exact_ids, exact_latency = _time_queries(flat, queries, k)
+
+    start = time.perf_counter()
+    ivf = IVFIndex(dim, n_lists=n_lists)
+    ivf.add(embeddings)
+    build_seconds = time.perf_counter() - start
+
+    rows = [{
+        "index": "flat", "n_probe": None, "recall_at_k": 1.0,
+        "p50_ms": float(np.percentile(exact_latency, 50)), "p99_ms": float(np.percentile(exact_latency, 99)),
+    }]
+    for n_probe in probes:
+        approx_ids, latency = _time_queries(ivf, queries, k, n_probe=n_probe)
+        hits = sum(len(set(a.tolist()) & set(e.tolist())) for a, e in zip(approx_ids, exact_ids))
+        rows.append({
+            "index": f"ivf(n_lists={ivf.n_lists}, build={build_seconds:.1f}s)", "n_probe": n_probe,
+            "recall_at_k": hits / (k * num_queries),
+            "p50_ms": float(np.percentile(latency, 50)), "p99_ms": float(np.percentile(latency, 99)),
+        })
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=100_000, help="Number of library embeddings.")
+    parser.add_argument("--dim", type=int, default=384, help="Embedding dimension (MiniLM uses 384).")
+    parser.add_argument("--queries", type=int, default=200, help="Number of timed queries.")
+    parser.add_argument("--k", type=int, default=5, help="Neighbours per query.")
+    parser.add_argument("--n-lists", type=int, default=None, help="IVF list count (default ~4*sqrt(N)).")
+    parser.add_argument("--probes", type=int, nargs="+", default=[1, 4, 8, 16, 32, 64])
+    args = parser.parse_args()
+
+    print(f"{'index':<40} {'n_probe':>8} {'recall@k':>9} {'p50 ms':>8} {'p99 ms':>8}")
+    for row in run(args.size, args.dim, args.queries, args.k, args.n_lists, args.probes):
+        print(f"{row['index']:<40} {str(row['n_probe'] or '-'):>8} {row['recall_at_k']:>9.3f} "
+              f"{row['p50_ms']:>8.2f} {row['p99_ms']:>8.2f}")
+
+if __name__ == "__main__":
+    main()
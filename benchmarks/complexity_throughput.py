@@ -0,0 +1,59 @@
+# benchmarks/complexity_throughput.py
+"""
+Throughput benchmark for local complexity scoring: the scalar estimate_local_complexity
+loop vs the vectorized estimate_local_complexity_batch.
+
+Generates synthetic prompts from the example library's vocabulary, checks that both
+paths give identical scores, and reports prompts/sec for each at several batch sizes.
+
+Usage:
+    python -m benchmarks.complexity_throughput --prompts 200000 --batch-sizes 100 1000 10000
+"""
+
+import argparse
+import random
+import re
+import time
+
+import numpy as np
+
+from data.optimized_prompts import example_optimized_prompts
+from src.optimization_logic import estimate_local_complexity, estimate_local_complexity_batch
+
+def make_prompts(count: int, seed: int = 0) -> list[str]:
+    """Random prompts of 3-120 words drawn from the example library's vocabulary."""
+    rng = random.Random(seed)
+    vocabulary = re.findall(r"\S+", " ".join(example_optimized_prompts))
+    return [" ".join(rng.choices(vocabulary, k=rng.randint(3, 120))) for _ in range(count)]
+
+def run(num_prompts: int, batch_sizes: list[int]) -> list[dict]:
+    prompts = make_prompts(num_prompts)
+
+    start = time.perf_counter()
+    scalar = [estimate_local_complexity(p) for p in prompts]
+    scalar_rate = num_prompts / (time.perf_counter() - start)
+    rows = [{"method": "scalar", "batch_size": 1, "prompts_per_sec": scalar_rate, "speedup": 1.0}]
+
+    for batch_size in batch_sizes:
+        start = time.perf_counter()
+        scores = np.concatenate([
+            estimate_local_complexity_batch(prompts[i:i + batch_size]) for i in range(0, num_prompts, batch_size)
+        ])
+        rate = num_prompts / (time.perf_counter() - start)
+        if not np.array_equal(scores, scalar):
+            raise AssertionError(f"Batch scores differ from the scalar scores at batch size {batch_size}.")
+        rows.append({"method": "batch", "batch_size": batch_size, "prompts_per_sec": rate, "speedup": rate / scalar_rate})
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--prompts", type=int, default=100_000)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[100, 1000, 10000])
+    args = parser.parse_args()
+
+    print(f"{'method':>8} {'batch':>7} {'prompts/s':>12} {'speedup':>8}")
+    for row in run(args.prompts, args.batch_sizes):
+        print(f"{row['method']:>8} {row['batch_size']:>7} {row['prompts_per_sec']:>12,.0f} {row['speedup']:>7.2f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+# benchmarks/embedding_backends.py
+"""
+Latency / memory / agreement benchmark for the embedding inference backends.
+
+Each backend runs in a fresh interpreter, so its import cost and peak RSS are measured in
+isolation. The worker loads the model, times --queries single-prompt encodes (the
+interactive path) and one batched encode of the example library (the library-build path),
+and hands its library embeddings back to the parent, which compares them with the first
+backend listed (torch by default) using src.embedding_backends.embedding_agreement. A
+backend that cannot load here (e.g. onnxruntime is not installed) is reported and skipped.
+
+Usage:
+    python -m benchmarks.embedding_backends
+    python -m benchmarks.embedding_backends --backends torch onnx-int8 --threads 4
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+import numpy as np
+
+from src.embedding_backends import BACKENDS, embedding_agreement
+
+def _worker(backend: str, threads: int, queries: int, embeddings_path: str) -> dict:
+    import resource
+    import time
+
+    from data.optimized_prompts import example_optimized_prompts
+    from src.embedding_backends import load_embedding_backend
+
+    start = time.perf_counter()
+    model = load_embedding_backend(backend, threads=threads)
+    model.encode("warm-up")
+    load_s = time.perf_counter() - start
+
+    latencies = []
+    for i in range(queries):
+        prompt = example_optimized_prompts[i % len(example_optimized_prompts)]
+        start = time.perf_counter()
+        model.encode(prompt)
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    embeddings = np.asarray(model.encode(list(example_optimized_prompts)), dtype=np.float32)
+    batch_s = time.perf_counter() - start
+    np.save(embeddings_path, embeddings)
+
+    latencies_ms = np.asarray(latencies) * 1000
+    return {
+        "load_s": load_s,
+        "p50_ms": float(np.percentile(latencies_ms, 50)),
+        "p99_ms": float(np.percentile(latencies_ms, 99)),
+        "prompts_per_s": len(example_optimized_prompts) / batch_s,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,  # KiB on Linux
+    }
+
+def run(backends: list[str], threads: int, queries: int) -> list[dict]:
+    rows, reference = [], None
+    with tempfile.TemporaryDirectory() as scratch:
+        for backend in backends:
+            embeddings_path = os.path.join(scratch, f"{backend}.npy")
+            completed = subprocess.run(
+                [sys.executable, "-m", "benchmarks.embedding_backends", "--worker", backend,
+                 "--threads", str(threads), "--queries", str(queries), "--embeddings-out", embeddings_path],
+                capture_output=True, text=True,
+            )
+            if completed.returncode != 0:
+                error = (completed.stderr.strip().splitlines() or ["failed"])[-1]
+                rows.append({"backend": backend, "error": error})
+                continue
+            row = {"backend": backend, **json.loads(completed.stdout.strip().splitlines()[-1])}
+            embeddings = np.load(embeddings_path)
+            if reference is None:
+                reference = (backend, embeddings)
+            row.update(reference=reference[0], **embedding_agreement(reference[1], embeddings))
+            rows.append(row)
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", nargs="+", choices=tuple(BACKENDS), default=list(BACKENDS),
+                        help="Backends to compare; agreement is measured against the first one.")
+    parser.add_argument("--threads", type=int, default=0, help="Inference threads (0 = runtime default).")
+    parser.add_argument("--queries", type=int, default=200, help="Single-prompt encodes timed per backend.")
+    parser.add_argument("--json", action="store_true", help="Print the rows as JSON instead of a table.")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    parser.add_argument("--embeddings-out", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(_worker(args.worker, args.threads, args.queries, args.embeddings_out)))
+        return
+
+    rows = run(args.backends, args.threads, args.queries)
+    if args.json:
+        print(json.dumps(rows, indent=2))
+        return
+    print(f"{'backend':<11} {'load s':>7} {'p50 ms':>7} {'p99 ms':>7} {'prompts/s':>10} {'peak RSS MB':>12} {'min cos':>8} {'max diff':>9}")
+    for row in rows:
+        if "error" in row:
+            print(f"{row['backend']:<11} skipped: {row['error']}")
+            continue
+        print(f"{row['backend']:<11} {row['load_s']:>7.2f} {row['p50_ms']:>7.2f} {row['p99_ms']:>7.2f} "
+              f"{row['prompts_per_s']:>10.1f} {row['peak_rss_mb']:>12.1f} {row['min_cosine']:>8.5f} {row['max_abs_diff']:>9.2e}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+# benchmarks/gemini_payload.py
+"""
+Gemini request payload benchmark: the whole example library vs top-k few-shot selection.
+
+Builds the single-prompt and packed request texts for a set of sample prompts both ways
+and reports the mean request size in bytes and approximate tokens, plus the reduction.
+No Gemini calls are made; only the local embedding model is needed.
+
+Usage:
+    python -m benchmarks.gemini_payload --k 5 --pack-size 8
+"""
+
+import argparse
+import json
+
+import numpy as np
+
+from benchmarks.load_test import SAMPLE_PROMPTS
+from data.optimized_prompts import example_optimized_prompts
+from src.ann_index import build_example_index
+from src.config import GEMINI_FEW_SHOT_K, GEMINI_PACK_SIZE
+from src.gemini_client import approximate_token_count, build_gemini_batch_prompt, build_gemini_prompt
+from src.optimization_logic import get_prompt_embeddings, select_few_shot_examples
+
+def _sizes(texts: list) -> tuple[float, float]:
+    return (float(np.mean([len(t.encode("utf-8")) for t in texts])),
+            float(np.mean([approximate_token_count(t) for t in texts])))
+
+def _row(name: str, full_texts: list, top_k_texts: list) -> dict:
+    full_bytes, full_tokens = _sizes(full_texts)
+    top_k_bytes, top_k_tokens = _sizes(top_k_texts)
+    return {
+        "request": name,
+        "full_bytes": full_bytes,
+        "top_k_bytes": top_k_bytes,
+        "full_tokens": full_tokens,
+        "top_k_tokens": top_k_tokens,
+        "token_reduction_pct": 100 * (1 - top_k_tokens / full_tokens),
+    }
+
+def run(model, prompts: list, k: int, pack_size: int) -> list[dict]:
+    library = example_optimized_prompts
+    library_matrix = get_prompt_embeddings(library, model)
+    index = build_example_index(library_matrix, assume_normalised=True)
+    selected = [select_few_shot_examples(e, index, library, k) for e in get_prompt_embeddings(prompts, model)]
+
+    packs = [range(i, min(i + pack_size, len(prompts))) for i in range(0, len(prompts), pack_size)]
+    return [
+        _row("single",
+             [build_gemini_prompt(p, library) for p in prompts],
+             [build_gemini_prompt(p, examples) for p, examples in zip(prompts, selected)]),
+        _row(f"packed x{pack_size}",
+             [build_gemini_batch_prompt([prompts[i] for i in pack], library) for pack in packs],
+             [build_gemini_batch_prompt([prompts[i] for i in pack],
+                                        list(dict.fromkeys(e for i in pack for e in selected[i])))
+              for pack in packs]),
+    ]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--k", type=int, default=GEMINI_FEW_SHOT_K)
+    parser.add_argument("--pack-size", type=int, default=GEMINI_PACK_SIZE)
+    parser.add_argument("--json", action="store_true", help="Print the rows as JSON instead of a table.")
+    args = parser.parse_args()
+
+    from src.embedding_backends import load_embedding_backend
+    rows = run(load_embedding_backend(), SAMPLE_PROMPTS * 4, args.k, args.pack_size)
+    if args.json:
+        print(json.dumps(rows, indent=2))
+        return
+    print(f"{'request':>12} {'full B':>9} {'top-k B':>9} {'full tok':>9} {'top-k tok':>10} {'saved':>7}")
+    for row in rows:
+        print(f"{row['request']:>12} {row['full_bytes']:>9.0f} {row['top_k_bytes']:>9.0f} "
+              f"{row['full_tokens']:>9.0f} {row['top_k_tokens']:>10.0f} {row['token_reduction_pct']:>6.1f}%")
+
+if __name__ == "__main__":
+    main()
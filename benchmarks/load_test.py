@@ -0,0 +1,109 @@
+# benchmarks/load_test.py
+"""
+Local load test for the HTTP service (serve.py).
+
+Opens --concurrency keep-alive connections and sends --requests POST /analyze calls
+(or /analyze/batch with --batch-size > 1), then reports throughput, p50/p99 latency and
+the status-code mix, including 503s from backpressure.
+
+Usage:
+    python serve.py &
+    python -m benchmarks.load_test --url http://127.0.0.1:8080 --requests 2000 --concurrency 64
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+from collections import Counter
+from urllib.parse import urlparse
+
+import numpy as np
+
+SAMPLE_PROMPTS = [
+    "Generate a detailed report on the global climate change impacts of industrialization over the last two centuries.",
+    "Explain how data centers can reduce their carbon footprint using renewable energy.",
+    "Write a long essay about the ethics of large language models and their resource consumption.",
+    "Summarize the energy usage of GPT-style model inference compared to training.",
+    "List best practices for prompt engineering that minimise token usage.",
+]
+
+async def _send(reader, writer, host: str, path: str, payload: dict) -> int:
+    body = json.dumps(payload).encode("utf-8")
+    writer.write(
+        f"POST {path} HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/json\r\n"
+        f"Content-Length: {len(body)}\r\n\r\n".encode("latin-1") + body
+    )
+    await writer.drain()
+
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        if name.strip().lower() == "content-length":
+            length = int(value)
+    await reader.readexactly(length)
+    return status
+
+async def _client(host: str, port: int, path: str, jobs: asyncio.Queue, batch_size: int,
+                  latencies: list, statuses: Counter):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        while True:
+            try:
+                jobs.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            if batch_size > 1:
+                payload = {"prompts": random.choices(SAMPLE_PROMPTS, k=batch_size)}
+            else:
+                payload = {"prompt": random.choice(SAMPLE_PROMPTS)}
+            start = time.perf_counter()
+            statuses[await _send(reader, writer, host, path, payload)] += 1
+            latencies.append((time.perf_counter() - start) * 1000)
+    finally:
+        writer.close()
+
+async def run(url: str, total: int, concurrency: int, batch_size: int) -> dict:
+    parsed = urlparse(url)
+    path = "/analyze/batch" if batch_size > 1 else "/analyze"
+    jobs = asyncio.Queue()
+    for i in range(total):
+        jobs.put_nowait(i)
+
+    latencies, statuses = [], Counter()
+    start = time.perf_counter()
+    await asyncio.gather(*(
+        _client(parsed.hostname, parsed.port or 80, path, jobs, batch_size, latencies, statuses)
+        for _ in range(concurrency)
+    ))
+    elapsed = time.perf_counter() - start
+
+    latencies = np.array(latencies)
+    return {
+        "requests": total,
+        "prompts_per_request": batch_size,
+        "concurrency": concurrency,
+        "seconds": elapsed,
+        "requests_per_sec": total / elapsed,
+        "prompts_per_sec": total * batch_size / elapsed,
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p99_ms": float(np.percentile(latencies, 99)),
+        "statuses": dict(statuses),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:8080")
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--batch-size", type=int, default=1, help="Prompts per request (>1 uses /analyze/batch).")
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args.url, args.requests, args.concurrency, args.batch_size)), indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+# benchmarks/quantization_recall.py
+"""
+Memory / latency / recall benchmark for the quantised example indexes.
+
+Builds the same synthetic clustered library as benchmarks/ann_recall.py, then compares the
+float32 index with int8 and product-quantised codes at several rescoring shortlist sizes,
+using src.quantization.evaluate_recall against an exact scan. Set ANN_PQ_SUBVECTORS to
+change the product code size.
+
+Usage:
+    python -m benchmarks.quantization_recall --size 1000000 --rescore 0 256 1024
+    python -m benchmarks.quantization_recall --size 1000000 --index-type ivf
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from benchmarks.ann_recall import make_clustered_embeddings
+from src.ann_index import build_example_index, normalise_rows
+from src.quantization import evaluate_recall
+
+def run(size: int, dim: int, num_queries: int, k: int, index_type: str, rescore: list[int]) -> list[dict]:
+    embeddings = make_clustered_embeddings(size, dim, num_clusters=max(8, size // 500))
+    rng = np.random.default_rng(1)
+    queries = normalise_rows(embeddings[rng.integers(0, size, num_queries)]
+                             + rng.standard_normal((num_queries, dim)).astype(np.float32) * 0.05)
+
+    configurations = [("none", 0)] + [(q, r) for q in ("int8", "pq") for r in rescore]
+    rows, built = [], {}
+    for quantization, rescore_candidates in configurations:
+        if quantization not in built:
+            start = time.perf_counter()
+            index = build_example_index(embeddings, index_type, assume_normalised=True, quantization=quantization)
+            built[quantization] = (index, time.perf_counter() - start)
+        index, build_seconds = built[quantization]
+        if quantization != "none":
+            index.rescore_candidates = rescore_candidates
+        rows.append({"quantization": quantization, "rescore": rescore_candidates if quantization != "none" else None,
+                     "build_s": build_seconds, **evaluate_recall(index, embeddings, queries, k)})
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=200_000, help="Number of library embeddings.")
+    parser.add_argument("--dim", type=int, default=384, help="Embedding dimension (MiniLM uses 384).")
+    parser.add_argument("--queries", type=int, default=200, help="Number of timed queries.")
+    parser.add_argument("--k", type=int, default=5, help="Neighbours per query.")
+    parser.add_argument("--index-type", choices=("flat", "ivf"), default="flat")
+    parser.add_argument("--rescore", type=int, nargs="+", default=[0, 64, 256, 1024],
+                        help="Shortlist sizes rescored in full precision (0 = approximate scores only).")
+    args = parser.parse_args()
+
+    print(f"{'codes':<6} {'rescore':>7} {'recall@k':>9} {'top-1':>6} {'p50 ms':>8} {'p99 ms':>8} {'codes MB':>9} {'memory MB':>10} {'build s':>8}")
+    for row in run(args.size, args.dim, args.queries, args.k, args.index_type, args.rescore):
+        print(f"{row['quantization']:<6} {str(row['rescore'] if row['rescore'] is not None else '-'):>7} "
+              f"{row['recall_at_k']:>9.3f} {row['top1_agreement']:>6.3f} {row['p50_ms']:>8.2f} {row['p99_ms']:>8.2f} "
+              f"{row['code_bytes'] / 1e6:>9.1f} {row['memory_bytes'] / 1e6:>10.1f} {row['build_s']:>8.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+# benchmarks/scheduler_fairness.py
+"""
+Multi-tenant fairness benchmark for the request scheduler (src/scheduler.py).
+
+Runs the HTTP service's request path (OptimizerService.dispatch, no sockets) against local
+fakes only: the fake Gemini endpoint (utils/fake_gemini_server.py) and a hashing embedding
+model with an artificial CPU cost per text (utils/fake_embedding_model.py). For --seconds,
+one "bulk" tenant keeps --bulk-clients /analyze/batch requests of --batch-size prompts in
+flight while --tenants interactive tenants each send single /analyze prompts with a short
+think time. The run is repeated with the scheduler off and on, and per-tenant request
+counts, rejections and p50/p99 latency are reported.
+
+Usage:
+    python -m benchmarks.scheduler_fairness --seconds 10 --mode gemini --gemini-latency-ms 200
+    python -m benchmarks.scheduler_fairness --mode local --embed-ms 2 --workers 2 --rate 5 --burst 20
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+import numpy as np
+
+BULK_TENANT = "bulk"
+
+def _build_service(embed_ms: float, workers: int):
+    from data.optimized_prompts import example_optimized_prompts
+    from serve import OptimizerService
+    from src.ann_index import build_example_index
+    from src.engine import PromptOptimizer
+    from utils.embedding_store import load_or_build_embeddings
+    from utils.fake_embedding_model import HashingEmbeddingModel
+
+    model = HashingEmbeddingModel(latency_ms=embed_ms)
+    with tempfile.TemporaryDirectory() as cache_dir:
+        matrix = np.array(load_or_build_embeddings(example_optimized_prompts, model, model.store_key, cache_dir))
+    optimizer = PromptOptimizer(model, example_optimized_prompts, build_example_index(matrix, assume_normalised=True),
+                                api_key="benchmark", result_cache=None)
+    return optimizer, lambda: OptimizerService(optimizer, workers=workers, max_queue_depth=100_000)
+
+async def _tenant(service, tenant: str, path: str, make_payload, seconds: float, think_s: float, rows: dict):
+    from serve import HTTPError
+
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        try:
+            await service.dispatch("POST", path, json.dumps(make_payload()).encode("utf-8"), {"x-tenant": tenant})
+            rows[tenant]["latencies"].append(time.perf_counter() - start)
+        except HTTPError as e:
+            rows[tenant][f"http_{e.status.value}"] += 1
+            await asyncio.sleep(float(e.headers.get("Retry-After", think_s)))
+        if think_s:
+            await asyncio.sleep(think_s)
+
+async def run_scenario(service, prompts, args) -> dict:
+    """Runs one load mix against the service and returns {tenant: row}."""
+    counter = iter(range(10**9))
+
+    def next_prompt() -> str:
+        # Distinct prompts, so no tenant is served from another's cached work
+        i = next(counter)
+        return f"{prompts[i % len(prompts)]} (request {i})"
+
+    rows = defaultdict(lambda: defaultdict(int, latencies=[]))
+    batch = lambda: {"prompts": [next_prompt() for _ in range(args.batch_size)], "mode": args.mode}
+    single = lambda: {"prompt": next_prompt(), "mode": args.mode}
+    await asyncio.gather(
+        *(_tenant(service, BULK_TENANT, "/analyze/batch", batch, args.seconds, 0.0, rows) for _ in range(args.bulk_clients)),
+        *(_tenant(service, f"team-{t}", "/analyze", single, args.seconds, args.think_ms / 1000, rows)
+          for t in range(args.tenants)),
+    )
+    return rows
+
+def _summarise(rows: dict) -> list[dict]:
+    summary = []
+    for tenant in sorted(rows, key=lambda t: (t != BULK_TENANT, t)):
+        latencies = np.array(rows[tenant]["latencies"]) * 1000
+        summary.append({
+            "tenant": tenant,
+            "ok": len(latencies),
+            "rejected": sum(v for k, v in rows[tenant].items() if k.startswith("http_")),
+            "p50_ms": float(np.percentile(latencies, 50)) if len(latencies) else float("nan"),
+            "p99_ms": float(np.percentile(latencies, 99)) if len(latencies) else float("nan"),
+        })
+    return summary
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=10.0, help="Duration of each run.")
+    parser.add_argument("--mode", choices=("local", "gemini"), default="gemini")
+    parser.add_argument("--tenants", type=int, default=4, help="Interactive tenants.")
+    parser.add_argument("--think-ms", type=float, default=50.0, help="Pause between an interactive tenant's requests.")
+    parser.add_argument("--bulk-clients", type=int, default=8, help="Concurrent batch requests from the bulk tenant.")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Service worker threads.")
+    parser.add_argument("--embed-ms", type=float, default=1.0, help="Artificial CPU cost per embedded text.")
+    parser.add_argument("--gemini-latency-ms", type=float, default=200.0)
+    parser.add_argument("--rate", type=float, default=1000.0, help="Per-tenant prompts per second.")
+    parser.add_argument("--burst", type=float, default=1000.0)
+    args = parser.parse_args()
+
+    # The Gemini client reads its endpoint from src/config.py, so point it at the fake before importing src
+    from utils.fake_gemini_server import start_fake_server
+    server = start_fake_server(latency_ms=args.gemini_latency_ms)
+    os.environ["GEMINI_BASE_URL"] = f"http://127.0.0.1:{server.server_port}"
+    if "src.config" in sys.modules:
+        raise RuntimeError("The fake Gemini endpoint must be configured before src is imported.")
+
+    from benchmarks.complexity_throughput import make_prompts
+    from src.scheduler import RequestScheduler
+
+    optimizer, make_service = _build_service(args.embed_ms, args.workers)
+    prompts = make_prompts(1000)
+    print(f"{'scheduler':>9} {'tenant':>8} {'ok':>6} {'rejected':>8} {'p50 ms':>9} {'p99 ms':>9}")
+    for label, scheduler in (("off", None), ("on", RequestScheduler(rate=args.rate, burst=args.burst))):
+        optimizer.scheduler = scheduler
+        service = make_service()
+        for row in _summarise(asyncio.run(run_scenario(service, prompts, args))):
+            print(f"{label:>9} {row['tenant']:>8} {row['ok']:>6} {row['rejected']:>8} {row['p50_ms']:>9.1f} {row['p99_ms']:>9.1f}")
+        service.executor.shutdown()
+    server.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+# benchmarks/startup.py
+"""
+Startup benchmark: module import time and Streamlit time-to-first-render.
+
+Each measurement runs in a fresh interpreter, so nothing is already imported or cached,
+and reports the median over --repeats runs. Time-to-first-render runs app.py once
+through Streamlit's AppTest harness, which completes when the first page has rendered.
+With --with-model it also reports how long the background warm-up takes until the
+embedding model is ready.
+
+Usage:
+    python -m benchmarks.startup --repeats 5
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+IMPORT_TARGETS = ["src.optimization_logic", "src.engine", "utils.data_loader"]
+
+_IMPORT_SNIPPET = """
+import time
+start = time.perf_counter()
+import {module}
+print(time.perf_counter() - start)
+"""
+
+_FIRST_RENDER_SNIPPET = """
+import time
+from streamlit.testing.v1 import AppTest
+app = AppTest.from_file("app.py", default_timeout=600)
+start = time.perf_counter()
+app.run()
+assert not app.exception, app.exception
+print(time.perf_counter() - start)
+"""
+
+_MODEL_READY_SNIPPET = """
+import time
+start = time.perf_counter()
+from utils.data_loader import load_embedding_service
+service = load_embedding_service()
+service.encode("ready?")
+print(time.perf_counter() - start)
+"""
+
+def _measure(snippet: str, repeats: int) -> float:
+    timings = []
+    for _ in range(repeats):
+        completed = subprocess.run([sys.executable, "-c", snippet], capture_output=True, text=True, check=True)
+        timings.append(float(completed.stdout.strip().splitlines()[-1]))
+    return statistics.median(timings)
+
+def run(repeats: int, with_model: bool) -> dict:
+    results = {f"import {module}": _measure(_IMPORT_SNIPPET.format(module=module), repeats) for module in IMPORT_TARGETS}
+    results["first render (app.py)"] = _measure(_FIRST_RENDER_SNIPPET, repeats)
+    if with_model:
+        results["embedding model ready"] = _measure(_MODEL_READY_SNIPPET, repeats)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--with-model", action="store_true", help="Also time the background model warm-up.")
+    parser.add_argument("--json", action="store_true", help="Print the timings as JSON instead of a table.")
+    args = parser.parse_args()
+
+    results = run(args.repeats, args.with_model)
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    for name, seconds in results.items():
+        print(f"{name:>34}: {seconds * 1000:9.1f} ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,327 @@
+# benchmarks/suite.py
+"""
+Reproducible benchmark suite covering every optimization path.
+
+Runs a fixed set of benchmarks on seeded prompt corpora and writes one JSON report:
+
+    cold_start         fresh-interpreter import time and Streamlit time-to-first-render
+    embedding          single-prompt and batched embedding throughput
+    similarity_search  index lookup latency against library size
+    complexity         scalar and batched local complexity throughput
+    library_load       example embedding store build / reuse and index build (utils/data_loader.py path)
+    local              end-to-end local-mode latency (analyze) and throughput (analyze_many)
+    gemini             end-to-end Gemini-mode latency against the local fake endpoint
+
+Corpora are "synthetic" (random prompts over the example library's vocabulary) or "real"
+(the built-in example and sample prompts, repeated to the requested size); both are fixed
+for a given --seed. The result cache is not used, so every call does the full work.
+
+With --baseline, each metric is compared with a stored report and the run exits with
+status 1 if any metric is worse than the baseline by more than --tolerance.
+
+Usage:
+    python -m benchmarks.suite --out .cache/benchmarks/baseline.json
+    python -m benchmarks.suite --baseline .cache/benchmarks/baseline.json --out latest.json
+    python -m benchmarks.suite --only complexity similarity_search --corpus real --corpus-size 5000
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+BENCHMARKS = ("cold_start", "embedding", "similarity_search", "complexity", "library_load", "local", "compress", "gemini")
+REPORT_FORMAT_VERSION = 1
+
+# --- Corpora ---
+
+def make_corpus(kind: str, size: int, seed: int = 0) -> list[str]:
+    """Returns a fixed prompt corpus: 'synthetic' or 'real' (built-in prompts, repeated to size)."""
+    if kind == "synthetic":
+        from benchmarks.complexity_throughput import make_prompts
+        return make_prompts(size, seed)
+    if kind == "real":
+        from benchmarks.load_test import SAMPLE_PROMPTS
+        from data.optimized_prompts import example_optimized_prompts
+        source = list(SAMPLE_PROMPTS) + list(example_optimized_prompts)
+        np.random.default_rng(seed).shuffle(source)
+        return [source[i % len(source)] for i in range(size)]
+    raise ValueError(f"Unknown corpus '{kind}'. Expected 'synthetic' or 'real'.")
+
+# --- Measurement helpers ---
+
+def _metric(value: float, unit: str, better: str) -> dict:
+    return {"value": float(value), "unit": unit, "better": better}
+
+def _latency_metrics(prefix: str, latencies_s: list) -> dict:
+    latencies_ms = np.asarray(latencies_s) * 1000
+    return {
+        f"{prefix}_p50_ms": _metric(np.percentile(latencies_ms, 50), "ms", "lower"),
+        f"{prefix}_p99_ms": _metric(np.percentile(latencies_ms, 99), "ms", "lower"),
+    }
+
+def _rate(count: int, fn) -> float:
+    start = time.perf_counter()
+    fn()
+    return count / (time.perf_counter() - start)
+
+def _load_model():
+    from src.embedding_backends import load_embedding_backend
+
+    model = load_embedding_backend()
+    model.encode("warm-up")
+    return model
+
+def _build_optimizer(model):
+    from data.optimized_prompts import example_optimized_prompts
+    from src.ann_index import build_example_index
+    from src.embedding_backends import EMBEDDING_STORE_KEY
+    from src.engine import PromptOptimizer
+    from utils.embedding_store import load_or_build_embeddings
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        matrix = np.array(load_or_build_embeddings(example_optimized_prompts, model, EMBEDDING_STORE_KEY, cache_dir))
+    index = build_example_index(matrix, assume_normalised=True)
+    return PromptOptimizer(model, example_optimized_prompts, index, api_key="benchmark", result_cache=None)
+
+# --- Benchmarks ---
+
+def bench_cold_start(ctx: dict) -> dict:
+    from benchmarks import startup
+
+    timings = startup.run(ctx["repeats"], with_model=False)
+    return {
+        name.replace("import ", "import_").replace(".", "_").replace("first render (app_py)", "first_render") + "_s":
+            _metric(seconds, "s", "lower")
+        for name, seconds in timings.items()
+    }
+
+def bench_embedding(ctx: dict) -> dict:
+    model, corpus = ctx["model"], ctx["corpus"]
+    singles = corpus[:min(len(corpus), 200)]
+    return {
+        "single_prompts_per_s": _metric(_rate(len(singles), lambda: [model.encode(p) for p in singles]), "prompts/s", "higher"),
+        "batch_prompts_per_s": _metric(_rate(len(corpus), lambda: model.encode(corpus, batch_size=64)), "prompts/s", "higher"),
+    }
+
+def bench_similarity_search(ctx: dict) -> dict:
+    from benchmarks.ann_recall import make_clustered_embeddings
+    from src.ann_index import build_example_index
+
+    dim = len(np.asarray(ctx["model"].encode("dimension probe"))) if ctx.get("model") is not None else 384
+    queries = make_clustered_embeddings(ctx["queries"], dim, num_clusters=64, seed=ctx["seed"] + 1)
+    results = {}
+    for size in ctx["library_sizes"]:
+        index = build_example_index(make_clustered_embeddings(size, dim, num_clusters=64, seed=ctx["seed"]),
+                                    assume_normalised=True)
+        latencies = []
+        for query in queries:
+            start = time.perf_counter()
+            index.search(query[None, :], k=5)
+            latencies.append(time.perf_counter() - start)
+        results.update(_latency_metrics(f"search_{size}", latencies))
+    return results
+
+def bench_complexity(ctx: dict) -> dict:
+    from src.optimization_logic import estimate_local_complexity, estimate_local_complexity_batch
+
+    corpus = ctx["corpus"]
+    return {
+        "scalar_prompts_per_s": _metric(_rate(len(corpus), lambda: [estimate_local_complexity(p) for p in corpus]), "prompts/s", "higher"),
+        "batch_prompts_per_s": _metric(_rate(len(corpus), lambda: estimate_local_complexity_batch(corpus)), "prompts/s", "higher"),
+    }
+
+def bench_library_load(ctx: dict) -> dict:
+    from src.ann_index import build_example_index
+    from src.embedding_backends import EMBEDDING_STORE_KEY
+    from utils.embedding_store import load_or_build_embeddings
+
+    prompts = list(dict.fromkeys(ctx["corpus"]))
+    with tempfile.TemporaryDirectory() as cache_dir:
+        start = time.perf_counter()
+        load_or_build_embeddings(prompts, ctx["model"], EMBEDDING_STORE_KEY, cache_dir)
+        cold = time.perf_counter() - start
+        start = time.perf_counter()
+        matrix = np.array(load_or_build_embeddings(prompts, ctx["model"], EMBEDDING_STORE_KEY, cache_dir))
+        warm = time.perf_counter() - start
+    start = time.perf_counter()
+    build_example_index(matrix, assume_normalised=True)
+    index_build = time.perf_counter() - start
+    return {
+        "store_build_s": _metric(cold, "s", "lower"),
+        "store_reuse_s": _metric(warm, "s", "lower"),
+        "index_build_s": _metric(index_build, "s", "lower"),
+    }
+
+def bench_local(ctx: dict) -> dict:
+    from src.engine import MODE_LOCAL
+
+    optimizer, corpus = ctx["optimizer"], ctx["corpus"]
+    latencies = []
+    for prompt in corpus[:ctx["queries"]]:
+        start = time.perf_counter()
+        optimizer.analyze(prompt, "medium", MODE_LOCAL)
+        latencies.append(time.perf_counter() - start)
+    results = _latency_metrics("analyze", latencies)
+    results["analyze_many_prompts_per_s"] = _metric(
+        _rate(len(corpus), lambda: optimizer.analyze_many(corpus, "medium", MODE_LOCAL)), "prompts/s", "higher")
+    return results
+
+def bench_compress(ctx: dict) -> dict:
+    from src.engine import MODE_COMPRESS
+    from src.gemini_client import approximate_token_count
+
+    optimizer, corpus = ctx["optimizer"], ctx["corpus"]
+    latencies, original_tokens, compressed_tokens = [], 0, 0
+    for prompt in corpus[:ctx["queries"]]:
+        start = time.perf_counter()
+        result = optimizer.analyze(prompt, "medium", MODE_COMPRESS)
+        latencies.append(time.perf_counter() - start)
+        original_tokens += approximate_token_count(prompt)
+        compressed_tokens += approximate_token_count(result.optimized_prompt)
+    results = _latency_metrics("analyze", latencies)
+    results["token_reduction_pct"] = _metric(100 * (1 - compressed_tokens / max(1, original_tokens)), "%", "higher")
+    return results
+
+def bench_gemini(ctx: dict) -> dict:
+    from src.engine import MODE_GEMINI
+
+    optimizer, corpus = ctx["optimizer"], ctx["corpus"]
+    latencies = []
+    for prompt in corpus[:min(ctx["queries"], 50)]:
+        start = time.perf_counter()
+        result = optimizer.analyze(prompt, "medium", MODE_GEMINI)
+        latencies.append(time.perf_counter() - start)
+        if result.mode != MODE_GEMINI:
+            raise RuntimeError("Gemini benchmark fell back to local mode; is the fake endpoint reachable?")
+    results = _latency_metrics("analyze", latencies)
+    batch = corpus[:min(len(corpus), 200)]
+    results["analyze_many_prompts_per_s"] = _metric(
+        _rate(len(batch), lambda: optimizer.analyze_many(batch, "medium", MODE_GEMINI)), "prompts/s", "higher")
+    return results
+
+_RUNNERS = {name: globals()[f"bench_{name}"] for name in BENCHMARKS}
+
+# --- Suite ---
+
+def _git_commit() -> str | None:
+    try:
+        completed = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True)
+        return completed.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run(only: list, corpus_kind: str, corpus_size: int, library_sizes: list, queries: int, repeats: int,
+        seed: int, gemini_latency_ms: float) -> dict:
+    """
+    Runs the selected benchmarks and returns the report: {"meta": {...}, "metrics": {name: metric}},
+    where each metric is {"value", "unit", "better": "lower" | "higher"}.
+    """
+    if "gemini" in only:
+        # The Gemini client reads its endpoint from src/config.py, so point it at the fake before importing src
+        from utils.fake_gemini_server import start_fake_server
+        server = start_fake_server(latency_ms=gemini_latency_ms)
+        os.environ["GEMINI_BASE_URL"] = f"http://127.0.0.1:{server.server_port}"
+        if "src.config" in sys.modules:
+            raise RuntimeError("The Gemini benchmark must configure the endpoint before src is imported.")
+
+    ctx = {"corpus": make_corpus(corpus_kind, corpus_size, seed), "library_sizes": library_sizes,
+           "queries": queries, "repeats": repeats, "seed": seed}
+    if {"embedding", "similarity_search", "library_load", "local", "compress", "gemini"} & set(only):
+        ctx["model"] = _load_model()
+    if {"local", "compress", "gemini"} & set(only):
+        ctx["optimizer"] = _build_optimizer(ctx["model"])
+
+    metrics = {}
+    for name in BENCHMARKS:
+        if name not in only:
+            continue
+        print(f"Running {name}...", file=sys.stderr)
+        for metric, value in _RUNNERS[name](ctx).items():
+            metrics[f"{name}.{metric}"] = value
+
+    from src.config import EMBEDDING_BACKEND, EMBEDDING_THREADS
+
+    return {
+        "meta": {
+            "format_version": REPORT_FORMAT_VERSION,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "git_commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "numpy": np.__version__,
+            "config": {"corpus": corpus_kind, "corpus_size": corpus_size, "library_sizes": library_sizes,
+                       "queries": queries, "repeats": repeats, "seed": seed, "gemini_latency_ms": gemini_latency_ms,
+                       "embedding_backend": EMBEDDING_BACKEND, "embedding_threads": EMBEDDING_THREADS},
+        },
+        "metrics": metrics,
+    }
+
+def compare(report: dict, baseline: dict, tolerance: float) -> list[dict]:
+    """
+    Compares each metric with the baseline. change is the relative change in the metric's
+    "worse" direction (0.2 = 20% worse); a metric regresses when change exceeds tolerance.
+    Metrics missing from either report are skipped.
+    """
+    rows = []
+    for name, metric in report["metrics"].items():
+        base = baseline["metrics"].get(name)
+        if base is None or not base["value"]:
+            continue
+        ratio = metric["value"] / base["value"]
+        change = (ratio - 1) if metric["better"] == "lower" else (1 / ratio - 1 if ratio else float("inf"))
+        rows.append({"metric": name, "baseline": base["value"], "current": metric["value"], "unit": metric["unit"],
+                     "change": change, "regressed": change > tolerance})
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--only", nargs="+", choices=BENCHMARKS, default=list(BENCHMARKS))
+    parser.add_argument("--corpus", choices=("synthetic", "real"), default="synthetic")
+    parser.add_argument("--corpus-size", type=int, default=2000)
+    parser.add_argument("--library-sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    parser.add_argument("--queries", type=int, default=200, help="Timed single-prompt calls per latency metric.")
+    parser.add_argument("--repeats", type=int, default=3, help="Fresh-interpreter runs per cold-start metric (median).")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--gemini-latency-ms", type=float, default=0.0, help="Artificial latency of the fake endpoint.")
+    parser.add_argument("--out", help="Write the JSON report here.")
+    parser.add_argument("--baseline", help="Compare with this stored report; exit 1 on regression.")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="Allowed relative slowdown per metric.")
+    args = parser.parse_args()
+
+    report = run(args.only, args.corpus, args.corpus_size, args.library_sizes, args.queries, args.repeats,
+                 args.seed, args.gemini_latency_ms)
+    if args.out:
+        os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    if not args.baseline:
+        for name, metric in report["metrics"].items():
+            print(f"{name:>50} {metric['value']:>14,.3f} {metric['unit']}")
+        return
+
+    with open(args.baseline, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    if baseline["meta"]["config"] != report["meta"]["config"]:
+        print("Warning: the baseline was recorded with different suite settings; differences may not be regressions.",
+              file=sys.stderr)
+    rows = compare(report, baseline, args.tolerance)
+    print(f"{'metric':>50} {'baseline':>14} {'current':>14} {'change':>8}")
+    for row in rows:
+        flag = "  REGRESSED" if row["regressed"] else ""
+        print(f"{row['metric']:>50} {row['baseline']:>14,.3f} {row['current']:>14,.3f} {row['change']:>+8.1%}{flag}")
+    regressions = [row["metric"] for row in rows if row["regressed"]]
+    if regressions:
+        print(f"{len(regressions)} metric(s) regressed beyond {args.tolerance:.0%}: {', '.join(regressions)}", file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
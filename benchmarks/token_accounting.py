@@ -0,0 +1,76 @@
+# benchmarks/token_accounting.py
+"""
+Throughput benchmark for input token accounting (src/token_accounting.py).
+
+Counts synthetic prompts drawn from the example library's vocabulary one at a time and in
+batches, cold (empty cache) and warm, then times a long document counted whole vs through
+the sentence-piece path, before and after a one-sentence edit. Piece sums are checked
+against the whole-text count.
+
+Usage:
+    python -m benchmarks.token_accounting --prompts 100000 --batch-sizes 256 4096
+    python -m benchmarks.token_accounting --vocab path/to/vocab.txt --document-chars 2000000
+"""
+
+import argparse
+import time
+
+from benchmarks.complexity_throughput import make_prompts
+from src.config import TOKENIZER_VOCAB_PATH
+from src.token_accounting import TokenCounter, load_token_counter
+
+def _rate(count: int, seconds: float) -> float:
+    return count / max(seconds, 1e-9)
+
+def run_prompts(counter: TokenCounter, num_prompts: int, batch_sizes: list[int]) -> list[dict]:
+    prompts = make_prompts(num_prompts)
+    rows = []
+    for batch_size in [1] + batch_sizes:
+        fresh = TokenCounter(counter.tokenizer, counter.name)
+        for cache in ("cold", "warm"):
+            start = time.perf_counter()
+            tokens = sum(int(fresh.count_many(prompts[i:i + batch_size]).sum()) for i in range(0, num_prompts, batch_size))
+            rows.append({"batch_size": batch_size, "cache": cache,
+                         "prompts_per_sec": _rate(num_prompts, time.perf_counter() - start), "tokens": tokens})
+    return rows
+
+def run_document(counter: TokenCounter, document_chars: int) -> dict:
+    sentences = [p + "." for p in make_prompts(document_chars // 300 + 1, seed=1)]
+    document = " ".join(sentences)[:document_chars]
+    edited = document.replace(sentences[len(sentences) // 2], "An edited sentence in the middle.", 1)
+
+    start = time.perf_counter()
+    whole = len(counter.tokenizer.encode(document, add_special_tokens=False)) if counter.tokenizer else counter.count(document)
+    whole_s = time.perf_counter() - start
+    fresh = TokenCounter(counter.tokenizer, counter.name)
+    start = time.perf_counter()
+    pieces = fresh.count(document)
+    pieces_s = time.perf_counter() - start
+    start = time.perf_counter()
+    fresh.count(edited)
+    edit_s = time.perf_counter() - start
+    if counter.tokenizer is not None and pieces != whole:
+        raise AssertionError(f"Sentence pieces count {pieces} tokens, the whole document {whole}.")
+    return {"chars": len(document), "tokens": pieces, "whole_ms": whole_s * 1000,
+            "pieces_ms": pieces_s * 1000, "edit_ms": edit_s * 1000}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--prompts", type=int, default=100_000)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[256, 4096])
+    parser.add_argument("--document-chars", type=int, default=1_000_000)
+    parser.add_argument("--vocab", default=TOKENIZER_VOCAB_PATH, help="vocab.txt or tokenizer.json (default: the embedding model's).")
+    args = parser.parse_args()
+
+    counter = load_token_counter(vocab_path=args.vocab)
+    print(f"tokenizer: {counter.name}")
+    print(f"{'batch':>7} {'cache':>6} {'prompts/s':>12} {'tokens':>12}")
+    for row in run_prompts(counter, args.prompts, args.batch_sizes):
+        print(f"{row['batch_size']:>7} {row['cache']:>6} {row['prompts_per_sec']:>12,.0f} {row['tokens']:>12,}")
+
+    doc = run_document(counter, args.document_chars)
+    print(f"\n{doc['chars']:,}-char document, {doc['tokens']:,} tokens: whole {doc['whole_ms']:.1f} ms, "
+          f"sentence pieces {doc['pieces_ms']:.1f} ms, after a one-sentence edit {doc['edit_ms']:.1f} ms")
+
+if __name__ == "__main__":
+    main()
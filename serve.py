@@ -0,0 +1,336 @@
+# serve.py
+"""
+Asyncio HTTP service for the prompt optimizer.
+
+Loads the embedding model and the example embeddings once (the example library is then
+hot-reloaded from its shard directory), then serves:
+
+    POST /analyze        {"prompt": "...", "llm_size": "medium", "mode": "local"}
+    POST /analyze/batch  {"prompts": ["...", "..."], "llm_size": "medium", "mode": "local"}
+    POST /analyze/document {"text": "...", "llm_size": "medium"}  chunked long-document analysis
+    GET  /stats          queue depth, request counters, scheduler queues, embedding throughput and stage timings
+    GET  /metrics        pipeline stage histograms, counters and scheduler gauges in Prometheus text format
+    GET  /history/totals kWh saved from the analysis log, e.g. ?by=day&user=alice
+    GET  /healthz
+
+mode is "local" (nearest example prompt), "gemini" or "compress" (rule-based compression).
+CPU-bound analysis runs on a bounded thread pool. Requests beyond SERVICE_MAX_QUEUE_DEPTH
+are rejected with 503 and a Retry-After header instead of queueing without limit. Invalid
+requests get 400; a Gemini outage (with the local fallback disabled) gets 502, and any
+other failure 500.
+
+Requests are scheduled per tenant (the SCHEDULER_TENANT_HEADER header, else the
+HISTORY_USER_HEADER user) by src/scheduler.py: /analyze is interactive and goes ahead of
+/analyze/batch and /analyze/document, tenants share the workers and the Gemini budget
+fairly, and a tenant over its rate limit gets 429 with a Retry-After header.
+
+Usage:
+    python serve.py --host 0.0.0.0 --port 8080 --workers 4
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from urllib.parse import parse_qs
+
+from src.config import (
+    HISTORY_USER_HEADER,
+    LLM_SIZE_MULTIPLIERS,
+    SCHEDULER_TENANT_HEADER,
+    SERVICE_HOST,
+    SERVICE_MAX_BATCH,
+    SERVICE_MAX_BODY_BYTES,
+    SERVICE_MAX_QUEUE_DEPTH,
+    SERVICE_PORT,
+    SERVICE_WORKERS,
+)
+from src.engine import MODE_LOCAL, MODES, PromptOptimizer
+from src.gemini_client import GeminiUnavailableError
+from src.history import GROUP_COLUMNS, AnalysisHistory, open_history
+from src.instrumentation import metrics
+from src.long_documents import count_chunks
+from src.scheduler import BATCH, DEFAULT_TENANT, INTERACTIVE, QueueFullError, RateLimitedError, SchedulerRejectedError
+
+class HTTPError(Exception):
+    """An error that maps directly to an HTTP status and JSON error body."""
+
+    def __init__(self, status: HTTPStatus, message: str, headers: dict | None = None):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+        self.headers = headers or {}
+
+class ValidationError(HTTPError):
+    """A request the client must fix (400); only the service's own checks raise it."""
+
+    def __init__(self, message: str):
+        super().__init__(HTTPStatus.BAD_REQUEST, message)
+
+class OptimizerService:
+    """Routes HTTP requests to one shared, warm PromptOptimizer with admission control."""
+
+    def __init__(self, optimizer: PromptOptimizer, workers: int = SERVICE_WORKERS,
+                 max_queue_depth: int = SERVICE_MAX_QUEUE_DEPTH, max_batch: int = SERVICE_MAX_BATCH,
+                 history: AnalysisHistory | None = None):
+        self.optimizer = optimizer
+        self.history = history
+        self.scheduler = optimizer.scheduler
+        # With the scheduler, its local slots bound the CPU-bound work; requests hand their slot
+        # back while they wait on Gemini, so threads are sized for every admitted request
+        threads = workers if self.scheduler is None else max(workers, max_queue_depth)
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="optimizer")
+        self.max_queue_depth = max_queue_depth
+        self.max_batch = max_batch
+        self.in_flight = 0
+        self.counters = {"requests": 0, "rejected": 0, "rate_limited": 0, "errors": 0}
+        self.started_at = time.time()
+        # The scheduler's local slots are this service's CPU workers
+        if self.scheduler is not None:
+            self.scheduler.local.resize(workers)
+
+    # --- Request handling ---
+
+    async def _run(self, fn, *args, tenant: str | None = None, priority: int = INTERACTIVE, cost: int = 1):
+        """
+        Runs CPU-bound work on the bounded executor, rejecting work past the queue-depth limit.
+        Work for a tenant is admitted and ordered by the scheduler; tenant=None runs it directly.
+        """
+        if self.in_flight >= self.max_queue_depth:
+            self.counters["rejected"] += 1
+            raise HTTPError(HTTPStatus.SERVICE_UNAVAILABLE, "Server is at capacity, retry shortly.", {"Retry-After": "1"})
+        self.in_flight += 1
+        try:
+            if self.scheduler is None or tenant is None:
+                return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+            return await self.scheduler.run_async(self.executor, fn, *args, tenant=tenant, priority=priority, cost=cost)
+        except RateLimitedError as e:
+            self.counters["rate_limited"] += 1
+            raise HTTPError(HTTPStatus.TOO_MANY_REQUESTS, str(e), {"Retry-After": str(math.ceil(e.retry_after))})
+        except QueueFullError as e:
+            self.counters["rejected"] += 1
+            raise HTTPError(HTTPStatus.SERVICE_UNAVAILABLE, str(e), {"Retry-After": str(math.ceil(e.retry_after))})
+        except SchedulerRejectedError as e:
+            # No Gemini slot freed up in time (only raised when the local fallback is disabled)
+            self.counters["rejected"] += 1
+            raise HTTPError(HTTPStatus.SERVICE_UNAVAILABLE, str(e), {"Retry-After": "1"})
+        except GeminiUnavailableError as e:
+            self.counters["errors"] += 1
+            raise HTTPError(HTTPStatus.BAD_GATEWAY, f"The Gemini API is unavailable: {e}", {"Retry-After": "5"})
+        finally:
+            self.in_flight -= 1
+
+    @staticmethod
+    def _parse_options(payload: dict) -> tuple[str, str]:
+        llm_size = payload.get("llm_size", "medium")
+        mode = payload.get("mode", MODE_LOCAL)
+        if llm_size not in LLM_SIZE_MULTIPLIERS:
+            raise ValidationError(f"llm_size must be one of {sorted(LLM_SIZE_MULTIPLIERS)}.")
+        if mode not in MODES:
+            raise ValidationError(f"mode must be one of {list(MODES)}.")
+        return llm_size, mode
+
+    def _analyze_logged(self, analyze, prompts, llm_size: str, mode: str, user_id: str | None):
+        # Runs on the executor, so the history log's batched writes never block the event loop
+        start = time.perf_counter()
+        results = analyze(prompts, llm_size, mode)
+        if self.history is not None:
+            batch = results if isinstance(results, list) else [results]
+            duration_ms = (time.perf_counter() - start) * 1000 / len(batch)
+            self.history.record_many(batch, user_id=user_id, source="service", duration_ms=duration_ms)
+        return results
+
+    async def analyze(self, payload: dict, user_id: str | None = None, tenant: str = DEFAULT_TENANT) -> dict:
+        prompt = payload.get("prompt")
+        if not isinstance(prompt, str) or not prompt.strip():
+            raise ValidationError("'prompt' must be a non-empty string.")
+        llm_size, mode = self._parse_options(payload)
+        result = await self._run(self._analyze_logged, self.optimizer.analyze, prompt, llm_size, mode, user_id,
+                                 tenant=tenant)
+        return result.to_dict()
+
+    async def analyze_batch(self, payload: dict, user_id: str | None = None, tenant: str = DEFAULT_TENANT) -> dict:
+        prompts = payload.get("prompts")
+        if not isinstance(prompts, list) or not prompts or not all(isinstance(p, str) and p.strip() for p in prompts):
+            raise ValidationError("'prompts' must be a non-empty list of non-empty strings.")
+        if len(prompts) > self.max_batch:
+            raise HTTPError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, f"At most {self.max_batch} prompts per batch.")
+        llm_size, mode = self._parse_options(payload)
+        results = await self._run(self._analyze_logged, self.optimizer.analyze_many, prompts, llm_size, mode, user_id,
+                                  tenant=tenant, priority=BATCH, cost=len(prompts))
+        return {"results": [r.to_dict() for r in results]}
+
+    async def analyze_document(self, payload: dict, tenant: str = DEFAULT_TENANT) -> dict:
+        text = payload.get("text")
+        if not isinstance(text, str) or not text.strip():
+            raise ValidationError("'text' must be a non-empty string.")
+        llm_size, _ = self._parse_options(payload)
+        # A document is charged per chunk, so its size counts against the tenant's rate limit and fair
+        # share; counting words is O(size), so it runs off the event loop
+        chunks = await asyncio.get_running_loop().run_in_executor(self.executor, count_chunks, text)
+        analysis = await self._run(self.optimizer.analyze_document, text, llm_size, tenant=tenant, priority=BATCH,
+                                   cost=chunks)
+        return analysis.to_dict()
+
+    async def history_totals(self, query: dict) -> dict:
+        if self.history is None:
+            raise HTTPError(HTTPStatus.NOT_FOUND, "The analysis history log is disabled.")
+        options = {name: values[-1] for name, values in query.items()}
+        if options.get("by") is not None and options["by"] not in GROUP_COLUMNS:
+            raise ValidationError(f"by must be one of {list(GROUP_COLUMNS)}.")
+        totals = await self._run(self.history.totals, options.get("by"), options.get("user"), None,
+                                 options.get("since"), options.get("until"))
+        return {"totals": totals}
+
+    def stats(self) -> dict:
+        stats = {
+            "uptime_seconds": time.time() - self.started_at,
+            "in_flight": self.in_flight,
+            "max_queue_depth": self.max_queue_depth,
+            **self.counters,
+        }
+        if hasattr(self.optimizer.embedding_model, "stats"):
+            stats["embedding"] = self.optimizer.embedding_model.stats()
+        if self.optimizer.library is not None:
+            stats["library"] = self.optimizer.library.stats()
+        if self.optimizer.near_duplicates is not None:
+            stats["near_duplicates"] = self.optimizer.near_duplicates.stats()
+        if self.scheduler is not None:
+            stats["scheduler"] = self.scheduler.stats()
+        stats["pipeline"] = metrics.to_json()
+        return stats
+
+    async def dispatch(self, method: str, path: str, body: bytes, headers: dict | None = None,
+                       query: dict | None = None) -> dict | str:
+        if method == "GET" and path == "/healthz":
+            return {"status": "ok"}
+        if method == "GET" and path == "/stats":
+            return self.stats()
+        if method == "GET" and path == "/metrics":
+            return metrics.to_prometheus() + (self.scheduler.to_prometheus() if self.scheduler is not None else "")
+        if method == "GET" and path == "/history/totals":
+            return await self.history_totals(query or {})
+        if method == "POST" and path in ("/analyze", "/analyze/batch", "/analyze/document"):
+            try:
+                payload = json.loads(body or b"{}")
+            except ValueError:
+                raise ValidationError("Request body must be JSON.")
+            if not isinstance(payload, dict):
+                raise ValidationError("Request body must be a JSON object.")
+            self.counters["requests"] += 1
+            user_id = (headers or {}).get(HISTORY_USER_HEADER.lower())
+            tenant = (headers or {}).get(SCHEDULER_TENANT_HEADER.lower()) or user_id or DEFAULT_TENANT
+            if path == "/analyze":
+                return await self.analyze(payload, user_id, tenant)
+            if path == "/analyze/document":
+                return await self.analyze_document(payload, tenant)
+            return await self.analyze_batch(payload, user_id, tenant)
+        raise HTTPError(HTTPStatus.NOT_FOUND, f"No route for {method} {path}.")
+
+    # --- HTTP/1.1 transport ---
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Serves requests on one keep-alive connection until the client closes it."""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                try:
+                    method, target, version = request_line.decode("latin-1").split()
+                except ValueError:
+                    await self._respond(writer, HTTPStatus.BAD_REQUEST, {"error": "Malformed request line."}, keep_alive=False)
+                    break
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                keep_alive = headers.get("connection", "").lower() != "close" and version == "HTTP/1.1"
+                if headers.get("transfer-encoding", "identity").lower() != "identity":
+                    # Only Content-Length bodies are read; a chunked body would be misread as the next request
+                    await self._respond(writer, HTTPStatus.NOT_IMPLEMENTED,
+                                        {"error": "Transfer-Encoding is not supported; send a Content-Length body."},
+                                        keep_alive=False)
+                    break
+                try:
+                    length = int(headers.get("content-length", "0") or 0)
+                except ValueError:
+                    length = -1
+                if length < 0:
+                    # Without a valid length the body's end is unknown, so the connection cannot be reused
+                    await self._respond(writer, HTTPStatus.BAD_REQUEST, {"error": "Invalid Content-Length."}, keep_alive=False)
+                    break
+                if length > SERVICE_MAX_BODY_BYTES:
+                    await self._respond(writer, HTTPStatus.REQUEST_ENTITY_TOO_LARGE, {"error": "Request body too large."}, keep_alive=False)
+                    break
+                body = await reader.readexactly(length) if length else b""
+
+                extra_headers = {}
+                try:
+                    path, _, query = target.partition("?")
+                    status, response = HTTPStatus.OK, await self.dispatch(method, path, body, headers, parse_qs(query))
+                except HTTPError as e:
+                    status, response, extra_headers = e.status, {"error": e.message}, e.headers
+                except Exception as e:
+                    self.counters["errors"] += 1
+                    status, response = HTTPStatus.INTERNAL_SERVER_ERROR, {"error": f"An error occurred during analysis: {e}"}
+                await self._respond(writer, status, response, keep_alive, extra_headers)
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _respond(writer: asyncio.StreamWriter, status: HTTPStatus, payload: dict | str,
+                       keep_alive: bool, extra_headers: dict | None = None):
+        # Plain-text payloads are Prometheus exposition text; everything else is JSON
+        is_text = isinstance(payload, str)
+        body = (payload if is_text else json.dumps(payload)).encode("utf-8")
+        headers = {
+            "Content-Type": "text/plain; version=0.0.4" if is_text else "application/json",
+            "Content-Length": str(len(body)),
+            "Connection": "keep-alive" if keep_alive else "close",
+            **(extra_headers or {}),
+        }
+        head = f"HTTP/1.1 {status.value} {status.phrase}\r\n" + "".join(f"{k}: {v}\r\n" for k, v in headers.items())
+        writer.write(head.encode("latin-1") + b"\r\n" + body)
+        await writer.drain()
+
+async def serve(optimizer: PromptOptimizer, host: str = SERVICE_HOST, port: int = SERVICE_PORT,
+                workers: int = SERVICE_WORKERS, max_queue_depth: int = SERVICE_MAX_QUEUE_DEPTH,
+                history: AnalysisHistory | None = None):
+    """Starts the HTTP service and runs until cancelled."""
+    service = OptimizerService(optimizer, workers=workers, max_queue_depth=max_queue_depth, history=history)
+    server = await asyncio.start_server(service.handle_connection, host, port)
+    print(f"Prompt optimizer service listening on http://{host}:{port}")
+    async with server:
+        await server.serve_forever()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default=SERVICE_HOST)
+    parser.add_argument("--port", type=int, default=SERVICE_PORT)
+    parser.add_argument("--workers", type=int, default=SERVICE_WORKERS, help="Threads running CPU-bound analysis.")
+    parser.add_argument("--max-queue-depth", type=int, default=SERVICE_MAX_QUEUE_DEPTH,
+                        help="Requests admitted at once before new ones get 503.")
+    args = parser.parse_args(argv)
+
+    # Load the model and example embeddings once, before accepting traffic
+    optimizer = PromptOptimizer.from_config(watch_library=True)
+    try:
+        asyncio.run(serve(optimizer, args.host, args.port, args.workers, args.max_queue_depth, open_history()))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,403 @@
+# src/ann_index.py
+
+import mmap
+
+import numpy as np
+
+from src.config import (
+    ANN_EXACT_THRESHOLD,
+    ANN_INDEX_TYPE,
+    ANN_N_LISTS,
+    ANN_N_PROBE,
+    ANN_QUANTIZATION,
+    ANN_RESCORE_CANDIDATES,
+)
+
+# Training sample size per IVF list; more points give better centroids but slower builds
+KMEANS_POINTS_PER_LIST = 40
+# An IVF index retrains its lists once it holds this many times the rows it was trained on
+IVF_RETRAIN_GROWTH = 2
+
+# --- Shared Helpers ---
+
+def normalise_rows(matrix: np.ndarray) -> np.ndarray:
+    """Returns a C-contiguous float32 copy of the matrix with unit-length rows."""
+    matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+    if matrix.ndim == 1:
+        matrix = matrix.reshape(1, -1)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+def exact_top_k(matrix: np.ndarray, query: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Exact inner-product top-k over a normalised matrix.
+
+    Args:
+        matrix: A (N, D) float32 matrix with unit-length rows.
+        query: A unit-length float32 query vector of length D.
+        k: The number of results to return.
+
+    Returns:
+        A tuple of (row indices, cosine similarities), best match first.
+    """
+    scores = matrix @ query
+    top = top_k_positions(scores, k)
+    return top, scores[top]
+
+def top_k_positions(scores: np.ndarray, k: int) -> np.ndarray:
+    """Returns the positions of the k largest scores, highest first, via argpartition."""
+    k = min(k, scores.shape[0])
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    if k < scores.shape[0]:
+        top = np.argpartition(scores, -k)[-k:]
+    else:
+        top = np.arange(scores.shape[0])
+    return top[np.argsort(-scores[top], kind="stable")].astype(np.int64)
+
+def rescore_top_k(matrix: np.ndarray, candidates: np.ndarray, query: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Exact top-k among candidate rows of a full-precision matrix (e.g. the shortlist of a
+    quantised scan). Rows are read in ascending order, which keeps memory-mapped reads sequential.
+
+    Returns:
+        A tuple of (row indices into matrix, cosine similarities), best match first.
+    """
+    candidates = np.sort(candidates)
+    positions, similarities = exact_top_k(matrix[candidates], query, k)
+    return candidates[positions], similarities
+
+def is_memory_mapped(array: np.ndarray) -> bool:
+    """True when the array's data lives in a memory map (e.g. the on-disk embedding store), not in private memory."""
+    while array is not None:
+        if isinstance(array, (np.memmap, mmap.mmap)):
+            return True
+        array = getattr(array, "base", None)
+    return False
+
+class _GrowableMatrix:
+    """An append-only matrix with amortised O(1) row inserts."""
+
+    def __init__(self, dim: int, capacity: int = 64, dtype=np.float32):
+        self._data = np.empty((capacity, dim), dtype=dtype)
+        self._size = 0
+
+    @classmethod
+    def wrap(cls, matrix: np.ndarray) -> "_GrowableMatrix":
+        """Adopts an existing (possibly read-only, memory-mapped) matrix without copying it.
+        The first append copies it into a private, growable buffer."""
+        grown = cls(matrix.shape[1], capacity=0, dtype=matrix.dtype)
+        grown._data = matrix
+        grown._size = matrix.shape[0]
+        return grown
+
+    def append(self, rows: np.ndarray):
+        needed = self._size + rows.shape[0]
+        if needed > self._data.shape[0]:
+            grown = np.empty((max(needed, 2 * self._data.shape[0]), self._data.shape[1]), dtype=self._data.dtype)
+            grown[:self._size] = self._data[:self._size]
+            self._data = grown
+        self._data[self._size:needed] = rows
+        self._size = needed
+
+    @property
+    def view(self) -> np.ndarray:
+        return self._data[:self._size]
+
+    def __len__(self) -> int:
+        return self._size
+
+# --- Index Implementations ---
+
+class FlatIndex:
+    """
+    Exact cosine-similarity index backed by one contiguous normalised matrix.
+    Every search is a single matrix-vector product, so recall is always 1.0.
+    """
+
+    def __init__(self, dim: int):
+        self.dim = dim
+        self._vectors = _GrowableMatrix(dim)
+
+    @classmethod
+    def from_normalised(cls, matrix: np.ndarray) -> "FlatIndex":
+        """Wraps an already-normalised float32 matrix (e.g. a memory-mapped store) without copying."""
+        index = cls(matrix.shape[1])
+        index._vectors = _GrowableMatrix.wrap(matrix)
+        return index
+
+    def add(self, embeddings: np.ndarray) -> np.ndarray:
+        """Appends embeddings and returns their ids (positions in insertion order)."""
+        rows = normalise_rows(embeddings)
+        start = len(self._vectors)
+        self._vectors.append(rows)
+        return np.arange(start, start + rows.shape[0], dtype=np.int64)
+
+    def search(self, query: np.ndarray, k: int = 1) -> tuple[np.ndarray, np.ndarray]:
+        """Returns (ids, cosine similarities) of the k nearest stored embeddings."""
+        return exact_top_k(self._vectors.view, normalise_rows(query)[0], k)
+
+    def __len__(self) -> int:
+        return len(self._vectors)
+
+class IVFIndex:
+    """
+    Inverted-file approximate index implemented with NumPy.
+
+    Embeddings are partitioned into n_lists clusters by spherical k-means. A query is
+    compared against the centroids and only the n_probe closest lists are scanned,
+    so raising n_probe trades latency for recall.
+
+    With a quantizer (src/quantization.py) the lists hold compact codes instead of float32
+    rows; the probed codes are scored approximately and the best rescore_candidates are
+    rescored against the full-precision rows, kept in id order for that purpose only.
+
+    Centroids learnt from a small first batch would fit later inserts poorly, so the index
+    retrains on everything it holds whenever it has grown IVF_RETRAIN_GROWTH times past its
+    last training set (amortised O(1) per insert). With n_lists=None the list count is
+    re-picked for the new size.
+    """
+
+    def __init__(self, dim: int, n_lists: int | None = None, n_probe: int = ANN_N_PROBE,
+                 kmeans_iterations: int = 10, seed: int = 0, quantizer=None,
+                 rescore_candidates: int = ANN_RESCORE_CANDIDATES):
+        self.dim = dim
+        self.n_lists = n_lists
+        self._auto_lists = n_lists is None
+        self._requested_lists = n_lists
+        self.n_probe = n_probe
+        self.kmeans_iterations = kmeans_iterations
+        self.quantizer = quantizer
+        self._trains_quantizer = quantizer is not None and not quantizer.is_trained
+        self.rescore_candidates = rescore_candidates
+        self._rng = np.random.default_rng(seed)
+        self.centroids = None
+        self._list_vectors = []  # float32 rows, or codes with a quantizer
+        self._list_ids = []
+        self._full = _GrowableMatrix(dim) if quantizer is not None else None
+        self._size = 0
+        self._trained_rows = 0
+
+    @classmethod
+    def from_normalised(cls, matrix: np.ndarray, **kwargs) -> "IVFIndex":
+        """
+        Builds an index over an already-normalised float32 matrix. With a quantizer, the
+        matrix (e.g. a memory-mapped store) is kept for rescoring without being copied.
+        """
+        index = cls(matrix.shape[1], **kwargs)
+        if matrix.shape[0]:
+            index._add_rows(matrix, keep_full=False)
+        if index.quantizer is not None:
+            index._full = _GrowableMatrix.wrap(matrix)
+        return index
+
+    @property
+    def is_trained(self) -> bool:
+        return self.centroids is not None
+
+    def train(self, embeddings: np.ndarray):
+        """Learns the coarse quantiser (list centroids) from a sample of embeddings."""
+        rows = normalise_rows(embeddings)
+        n_lists = default_n_lists(rows.shape[0]) if self._auto_lists else self._requested_lists
+        n_lists = max(1, min(n_lists, rows.shape[0]))
+
+        sample_size = min(rows.shape[0], KMEANS_POINTS_PER_LIST * n_lists)
+        sample = rows[self._rng.choice(rows.shape[0], sample_size, replace=False)]
+        centroids = sample[self._rng.choice(sample_size, n_lists, replace=False)].copy()
+
+        for _ in range(self.kmeans_iterations):
+            assignment = np.argmax(sample @ centroids.T, axis=1)
+            order = np.argsort(assignment, kind="stable")
+            occupied, starts = np.unique(assignment[order], return_index=True)
+            sums = np.zeros_like(centroids)
+            sums[occupied] = np.add.reduceat(sample[order], starts, axis=0)
+            empty = ~sums.any(axis=1)
+            # Re-seed empty clusters with random points so every list stays useful
+            sums[empty] = sample[self._rng.choice(sample_size, int(empty.sum()))]
+            centroids = normalise_rows(sums)
+
+        self.n_lists = n_lists
+        self.centroids = centroids
+        self._trained_rows = rows.shape[0]
+        if self.quantizer is None:
+            self._list_vectors = [_GrowableMatrix(self.dim, capacity=16) for _ in range(n_lists)]
+        else:
+            if self._trains_quantizer:
+                self.quantizer.train(sample)
+            width = self.quantizer.code_width(self.dim)
+            self._list_vectors = [_GrowableMatrix(width, capacity=16, dtype=self.quantizer.code_dtype) for _ in range(n_lists)]
+        self._list_ids = [_GrowableMatrix(1, capacity=16, dtype=np.int64) for _ in range(n_lists)]
+
+    def add(self, embeddings: np.ndarray) -> np.ndarray:
+        """
+        Inserts embeddings incrementally. The first call trains the quantiser on its batch;
+        later calls are assigned to the existing lists until the index has grown
+        IVF_RETRAIN_GROWTH times past its training set, which retrains it on every row.
+        """
+        ids = self._add_rows(normalise_rows(embeddings), keep_full=True)
+        if self._size >= IVF_RETRAIN_GROWTH * self._trained_rows:
+            self._retrain()
+        return ids
+
+    def _stored_rows(self) -> np.ndarray:
+        """Every stored row in full precision, in id order."""
+        if self.quantizer is not None:
+            return self._full.view
+        rows = np.empty((self._size, self.dim), dtype=np.float32)
+        for vectors, ids in zip(self._list_vectors, self._list_ids):
+            rows[ids.view[:, 0]] = vectors.view
+        return rows
+
+    def _retrain(self):
+        rows = self._stored_rows()
+        self._size = 0
+        self.train(rows)
+        self._add_rows(rows, keep_full=False)
+
+    def _add_rows(self, rows: np.ndarray, keep_full: bool) -> np.ndarray:
+        if not self.is_trained:
+            self.train(rows)
+
+        ids = np.arange(self._size, self._size + rows.shape[0], dtype=np.int64)
+        assignment = np.argmax(rows @ self.centroids.T, axis=1)
+        order = np.argsort(assignment, kind="stable")
+        lists, starts = np.unique(assignment[order], return_index=True)
+        stored = rows if self.quantizer is None else self.quantizer.encode(rows)
+        for list_no, members in zip(lists, np.split(order, starts[1:])):
+            self._list_vectors[list_no].append(stored[members])
+            self._list_ids[list_no].append(ids[members].reshape(-1, 1))
+        if self.quantizer is not None and keep_full:
+            self._full.append(rows)
+        self._size += rows.shape[0]
+        return ids
+
+    def search(self, query: np.ndarray, k: int = 1, n_probe: int | None = None) -> tuple[np.ndarray, np.ndarray]:
+        """Returns (ids, cosine similarities) of the approximate k nearest stored embeddings."""
+        if not self.is_trained or self._size == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        query = normalise_rows(query)[0]
+        n_probe = min(max(1, self.n_probe if n_probe is None else n_probe), self.n_lists)
+        probe_lists = np.argpartition(self.centroids @ query, -n_probe)[-n_probe:]
+
+        candidate_vectors = []
+        candidate_ids = []
+        for list_no in probe_lists:
+            vectors = self._list_vectors[list_no].view
+            if vectors.shape[0]:
+                candidate_vectors.append(vectors)
+                candidate_ids.append(self._list_ids[list_no].view[:, 0])
+        if not candidate_vectors:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        ids = np.concatenate(candidate_ids)
+        if self.quantizer is None:
+            scores = np.concatenate([vectors @ query for vectors in candidate_vectors])
+        else:
+            # Codes are small, so the probed lists are gathered and scored in one pass
+            scores = self.quantizer.scorer(query)(np.concatenate(candidate_vectors))
+            if self.rescore_candidates > 0:
+                return rescore_top_k(self._full.view, ids[top_k_positions(scores, max(k, self.rescore_candidates))], query, k)
+        top = top_k_positions(scores, k)
+        return ids[top], scores[top]
+
+    @property
+    def code_bytes(self) -> int:
+        """Memory held by the list contents (codes with a quantizer, otherwise float32 rows)."""
+        return sum(vectors.view.nbytes for vectors in self._list_vectors)
+
+    @property
+    def memory_bytes(self) -> int:
+        """code_bytes plus the full-precision rows kept for rescoring, unless they are memory-mapped."""
+        full = self._full.view if self._full is not None else None
+        return self.code_bytes + (full.nbytes if full is not None and not is_memory_mapped(full) else 0)
+
+    def __len__(self) -> int:
+        return self._size
+
+class ShardedIndex:
+    """
+    Read-only view over one index per shard. Ids are positions in the concatenation of the
+    shards, in order; a search asks every shard for its own top k and merges the results.
+    Shards are held by reference, so a reload can reuse the indexes of unchanged shards.
+    """
+
+    def __init__(self, shards: list):
+        self.shards = list(shards)
+        self._offsets = np.cumsum([0] + [len(shard) for shard in self.shards])
+
+    def search(self, query: np.ndarray, k: int = 1) -> tuple[np.ndarray, np.ndarray]:
+        """Returns (ids, cosine similarities) of the k nearest embeddings across all shards."""
+        ids, scores = [], []
+        for offset, shard in zip(self._offsets, self.shards):
+            shard_ids, shard_scores = shard.search(query, k)
+            ids.append(shard_ids + offset)
+            scores.append(shard_scores)
+        if not ids:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        ids, scores = np.concatenate(ids), np.concatenate(scores)
+        top = top_k_positions(scores, k)
+        return ids[top], scores[top]
+
+    def __len__(self) -> int:
+        return int(self._offsets[-1])
+
+# --- Factory ---
+
+def default_n_lists(num_embeddings: int) -> int:
+    """Rule-of-thumb list count (about 4 * sqrt(N)) for an IVF index."""
+    return max(1, int(4 * np.sqrt(num_embeddings)))
+
+def build_example_index(embeddings: np.ndarray, index_type: str = ANN_INDEX_TYPE,
+                        n_lists: int | None = ANN_N_LISTS, n_probe: int = ANN_N_PROBE,
+                        assume_normalised: bool = False, quantization: str = ANN_QUANTIZATION,
+                        rescore_candidates: int = ANN_RESCORE_CANDIDATES):
+    """
+    Builds a nearest-neighbour index over the example prompt embeddings.
+
+    Args:
+        embeddings: A (N, D) matrix whose rows follow the example prompt list.
+        index_type: "flat" for an exact scan, "ivf" for the approximate index, or "auto"
+            to switch to IVF once the library exceeds ANN_EXACT_THRESHOLD entries.
+        n_lists: Number of IVF lists (None picks about 4 * sqrt(N)).
+        n_probe: Number of IVF lists scanned per query.
+        assume_normalised: Set when the rows are already unit-length float32 (e.g. from the
+            on-disk embedding store), so a flat index can share the matrix instead of copying it.
+        quantization: "none", or "int8" / "pq" to scan compact codes instead of the float32
+            rows (see src/quantization.py), in a flat scan or inside the IVF lists.
+        rescore_candidates: Approximate matches rescored in full precision per quantised query.
+
+    Returns:
+        A FlatIndex, IVFIndex or QuantizedIndex exposing add() and search().
+    """
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    dim = embeddings.shape[1]
+
+    if index_type == "auto":
+        index_type = "ivf" if embeddings.shape[0] > ANN_EXACT_THRESHOLD else "flat"
+    if index_type not in ("flat", "ivf"):
+        raise ValueError(f"Unknown index type '{index_type}'. Expected 'auto', 'flat' or 'ivf'.")
+
+    quantizer = None
+    if quantization != "none":
+        from src.quantization import QuantizedIndex, make_quantizer
+        quantizer = make_quantizer(quantization)
+
+    if index_type == "ivf":
+        ivf_options = {"n_lists": n_lists, "n_probe": n_probe, "quantizer": quantizer, "rescore_candidates": rescore_candidates}
+        if assume_normalised:
+            return IVFIndex.from_normalised(embeddings, **ivf_options)
+        index = IVFIndex(dim, **ivf_options)
+    elif quantizer is not None and assume_normalised:
+        return QuantizedIndex.from_normalised(embeddings, quantizer, rescore_candidates)
+    elif quantizer is not None:
+        index = QuantizedIndex(dim, quantizer, rescore_candidates)
+    elif assume_normalised:
+        return FlatIndex.from_normalised(embeddings)
+    else:
+        index = FlatIndex(dim)
+
+    if embeddings.shape[0]:
+        index.add(embeddings)
+    return index
@@ -0,0 +1,191 @@
+# src/compression.py
+"""
+Rule-based local prompt compression: drops filler phrases, redundant sentences and, past
+COMPRESSION_TOKEN_BUDGET, the least relevant sentences, leaving code and line structure intact.
+"""
+
+import re
+from collections import defaultdict
+
+import numpy as np
+
+from src.ann_index import normalise_rows
+from src.config import COMPRESSION_REDUNDANCY_THRESHOLD, COMPRESSION_TOKEN_BUDGET
+from src.gemini_client import approximate_token_count
+
+_NEGATION = re.compile(r"\b(?:not|no|never|nothing|hardly|without)\b|n't\b", re.IGNORECASE)
+
+def _drop_unless_negated(match: re.Match) -> str:
+    # "not actually true" means something else without the hedge
+    return match.group(0) if _NEGATION.search(match.string, 0, match.start()) else ""
+
+# (pattern, replacement string or function), applied in order to each sentence, case-insensitively
+FILLER_RULES = [
+    # Greetings and thanks only as a clause of their own ("Hi!", "..., thanks in advance."),
+    # never inside one ("hello world program", "a thank you note", "thanks to the rain")
+    (r"^(?:hi|hello|hey)(?: there)?\s*(?:[,!.]+|$)", ""),
+    # Request openers only at the start of a sentence ("what can you do?" keeps its words)
+    (r"^\W*i was wondering if you could\b", ""),
+    (r"^\W*(?:could|can|would|will) you (?:please |kindly )?", ""),
+    (r"\bi (?:would like|want|need) you to\b", ""),
+    (r"\bas an ai(?: language model)?\b,?", ""),
+    (r"\bit is (?:important|worth) (?:to note|noting|to remember) that\b", ""),
+    (r"^(?:thank you|thanks)(?: (?:so|very) much)?(?: in advance)?(?: for (?:your|the) help)?\s*(?:[,.!]+|$)", ""),
+    (r"[,;]\s*(?:thank you|thanks)(?: (?:so|very) much)?(?: in advance)?(?: for (?:your|the) help)?(?=\s*[.!]*$)", ""),
+    # Not when part of a compound ("a please-and-thank-you sign")
+    (r",?\s*(?<![\w-])(?:please|kindly)(?![\w-])(?:\s*,)?", ""),
+    (r"\b(?:basically|actually|literally)\b", _drop_unless_negated),
+    (r"\bin order to\b", "to"),
+    (r"\bdue to the fact that\b", "because"),
+    (r"\bat this point in time\b", "now"),
+    (r"\bin the event that\b", "if"),
+    (r"\bfor the purpose of\b", "for"),
+    (r"\b(?:with regard to|with respect to|in relation to)\b", "about"),
+    (r"\ba (?:large|great) number of\b", "many"),
+]
+_FILLER_PATTERNS = [(re.compile(pattern, re.IGNORECASE), replacement) for pattern, replacement in FILLER_RULES]
+# Sentence ends, but not the "1." of an inline numbered step
+_SENTENCE_SPLIT = re.compile(r"(?<=[.!?])(?<!\d\.)\s+")
+_FENCE = re.compile(r"^\s*(```|~~~)")
+_INDENTED_CODE = re.compile(r"^(?: {4}|\t)")
+_LIST_MARKER = re.compile(r"^\s*(?:[-*+]|\d+[.)])\s+")
+_INLINE_CODE = re.compile(r"`[^`\n]*`")
+
+# --- Rules ---
+
+def _tidy(text: str) -> str:
+    text = re.sub(r"\s+", " ", text)
+    text = re.sub(r"\s+([,.;:!?])", r"\1", text)
+    text = re.sub(r"([,;:])(?:\s*[,;:])+", r"\1", text)  # Punctuation left stacked by a removal
+    return re.sub(r"^[\s,;:.!?]+", "", text).strip()
+
+def remove_fillers(text: str) -> str:
+    """
+    Applies FILLER_RULES to one sentence and tidies the spacing and punctuation left behind;
+    inline code spans are left as they are. A sentence that started with a capital letter
+    still does after a removal at its start.
+    """
+    spans = _INLINE_CODE.findall(text)
+    stripped = _INLINE_CODE.sub(lambda m, n=iter(range(len(spans))): f"\x00{next(n)}\x00", text)
+    for pattern, replacement in _FILLER_PATTERNS:
+        stripped = pattern.sub(replacement, stripped)
+    stripped = _tidy(stripped)
+    if text[:1].isupper() and stripped[:1].islower():
+        stripped = stripped[:1].upper() + stripped[1:]
+    return re.sub(r"\x00(\d+)\x00", lambda m: spans[int(m.group(1))], stripped)
+
+def split_sentences(text: str) -> list[str]:
+    """Sentences of one line of prose."""
+    return [s.strip() for s in _SENTENCE_SPLIT.split(text) if s.strip()]
+
+def parse_lines(text: str) -> list[tuple[str, str | None]]:
+    """
+    Splits a prompt into lines: (marker, prose) for a line of text, where marker is its
+    indentation and list marker ("  - ", "2. "), and (line, None) for code, fences and blank
+    lines, which are kept verbatim.
+    """
+    lines, fence = [], None
+    for line in text.splitlines():
+        fence_match = _FENCE.match(line)
+        if fence is not None:
+            lines.append((line, None))
+            if fence_match and fence_match.group(1) == fence:
+                fence = None
+        elif fence_match:
+            fence = fence_match.group(1)
+            lines.append((line, None))
+        elif not line.strip() or (_INDENTED_CODE.match(line) and not _LIST_MARKER.match(line)):
+            lines.append((line.rstrip(), None))
+        else:
+            marker = _LIST_MARKER.match(line)
+            prefix = marker.group(0) if marker else line[:len(line) - len(line.lstrip())]
+            lines.append((prefix, line[len(prefix):].strip()))
+    return lines
+
+def _join_lines(lines: list, sentences: list, owners: list, kept: list) -> str:
+    kept_by_line = defaultdict(list)
+    for i in kept:
+        kept_by_line[owners[i]].append(sentences[i])
+    out = []
+    for n, (prefix, prose) in enumerate(lines):
+        if prose is not None:
+            if kept_by_line[n]:
+                out.append(prefix + " ".join(kept_by_line[n]))
+        elif prefix or (out and out[-1]):  # One blank line at most where text was dropped
+            out.append(prefix)
+    while out and not out[-1]:
+        out.pop()
+    return "\n".join(out)
+
+# --- Embedding passes ---
+
+def prune_redundant(sentences: list, embeddings: np.ndarray, threshold: float = COMPRESSION_REDUNDANCY_THRESHOLD) -> list[int]:
+    """Positions of the sentences kept, in order; a sentence this similar to a kept one is dropped."""
+    kept = []
+    for i in range(len(sentences)):
+        if not kept or float(np.max(embeddings[kept] @ embeddings[i])) < threshold:
+            kept.append(i)
+    return kept
+
+def trim_to_budget(sentences: list, relevance: np.ndarray, budget: int, reserved: int = 0) -> list[int]:
+    """
+    Drops the least relevant sentences (never the first) until the rest, plus `reserved`
+    tokens of code that is always kept, fit in `budget` tokens.
+    """
+    kept = list(range(len(sentences)))
+    tokens = [approximate_token_count(s) for s in sentences]
+    total = reserved + sum(tokens)
+    for i in sorted(range(1, len(sentences)), key=lambda i: relevance[i]):
+        if total <= budget:
+            break
+        kept.remove(i)
+        total -= tokens[i]
+    return kept
+
+def compress_prompt(prompt: str, model, prompt_embedding: np.ndarray | None = None,
+                    redundancy_threshold: float = COMPRESSION_REDUNDANCY_THRESHOLD,
+                    token_budget: int = COMPRESSION_TOKEN_BUDGET) -> tuple[str, float]:
+    """
+    Compresses a prompt with the filler, redundancy and token-budget passes.
+
+    Args:
+        prompt: The user's original prompt.
+        model: The embedding model or BatchEmbeddingService.
+        prompt_embedding: The prompt's embedding, if already computed.
+        redundancy_threshold: Cosine similarity at which a sentence counts as a repeat.
+        token_budget: Approximate token limit for the result (0 disables trimming).
+
+    Returns:
+        (compressed prompt, cosine similarity between the original and compressed
+        embeddings, 0-1).
+    """
+    lines = parse_lines(prompt)
+    sentences, owners = [], []  # Prose sentences and the line each came from
+    for n, (_, prose) in enumerate(lines):
+        for sentence in split_sentences(prose or ""):
+            sentence = remove_fillers(sentence)
+            if sentence:
+                sentences.append(sentence)
+                owners.append(n)
+    if not sentences:
+        return prompt.strip(), 1.0
+    kept = list(range(len(sentences)))
+
+    # One batch: the whole prompt (unless given) plus every sentence
+    texts = ([] if prompt_embedding is not None else [prompt]) + (sentences if len(sentences) > 1 else [])
+    encoded = normalise_rows(np.asarray(model.encode(texts))) if texts else np.empty((0, 0), dtype=np.float32)
+    original = normalise_rows(prompt_embedding)[0] if prompt_embedding is not None else encoded[0]
+    if len(sentences) > 1:
+        sentence_embeddings = encoded[-len(sentences):]
+        kept = prune_redundant(sentences, sentence_embeddings, redundancy_threshold)
+        if token_budget > 0:
+            code_tokens = sum(approximate_token_count(line) for line, prose in lines if prose is None)
+            positions = trim_to_budget([sentences[i] for i in kept], sentence_embeddings[kept] @ original,
+                                       token_budget, code_tokens)
+            kept = [kept[p] for p in positions]
+
+    compressed = _join_lines(lines, sentences, owners, kept)
+    if compressed == prompt.strip():
+        return compressed, 1.0
+    similarity = float(normalise_rows(np.asarray(model.encode(compressed)))[0] @ original)
+    return compressed, max(0.0, min(1.0, similarity))
@@ -13,8 +13,134 @@ API_KEY = os.getenv("GEMINI_API_KEY")
 
 # Base energy factors (mock values - replace with real data/models in a production system)
 BASE_ENERGY_PER_COMPLEXITY = 0.08  # kWh per unit of complexity (0-100)
+ENERGY_PER_INPUT_TOKEN = float(os.getenv("ENERGY_PER_INPUT_TOKEN", "0.0001"))  # kWh per prompt token, before the size multiplier
 LLM_SIZE_MULTIPLIERS = {
     'small': 0.8,
     'medium': 1.5,
     'large': 2.5,
 }
+
+# Nearest-neighbour index over the example prompt library.
+# "auto" uses an exact scan for small libraries and an IVF index above the threshold.
+ANN_INDEX_TYPE = os.getenv("ANN_INDEX_TYPE", "auto")
+ANN_EXACT_THRESHOLD = int(os.getenv("ANN_EXACT_THRESHOLD", "50000"))
+ANN_N_LISTS = int(os.getenv("ANN_N_LISTS")) if os.getenv("ANN_N_LISTS") else None  # None = ~4*sqrt(N)
+ANN_N_PROBE = int(os.getenv("ANN_N_PROBE", "16"))  # Higher = better recall, slower queries
+# Compact codes for large libraries: "none", "int8" (scalar, 4x smaller) or "pq" (product codes).
+# Quantised indexes scan the codes and rescore the best candidates against the float32 store.
+ANN_QUANTIZATION = os.getenv("ANN_QUANTIZATION", "none")
+ANN_PQ_SUBVECTORS = int(os.getenv("ANN_PQ_SUBVECTORS", "48"))  # Bytes per PQ code; must divide the embedding size
+ANN_RESCORE_CANDIDATES = int(os.getenv("ANN_RESCORE_CANDIDATES", "256"))  # Approximate matches rescored exactly
+
+# Local embedding model and its persistent on-disk embedding store
+EMBEDDING_MODEL_NAME = os.getenv("EMBEDDING_MODEL_NAME", "all-MiniLM-L6-v2")
+EMBEDDING_CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR", ".embedding_cache")
+EMBEDDING_CACHE_KEEP = int(os.getenv("EMBEDDING_CACHE_KEEP", "3"))  # Store versions kept per model
+# Inference backend: "torch" (default), "torch-int8" (dynamically quantised Linear layers),
+# "onnx" (ONNX Runtime) or "onnx-int8" (dynamically quantised ONNX export). Quantised backends
+# keep their own embedding store, so the example library is always encoded by the query model.
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+EMBEDDING_THREADS = int(os.getenv("EMBEDDING_THREADS", "0"))  # CPU threads for inference; 0 = runtime default
+EMBEDDING_ONNX_DIR = os.getenv("EMBEDDING_ONNX_DIR", ".cache/onnx")  # Local ONNX exports
+EMBEDDING_ONNX_QUANTIZATION = os.getenv("EMBEDDING_ONNX_QUANTIZATION", "avx2")  # arm64, avx2, avx512 or avx512_vnni
+
+# Batched embedding pipeline
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "128"))  # Prompts per forward pass for library encoding
+EMBEDDING_COALESCE_WINDOW_MS = float(os.getenv("EMBEDDING_COALESCE_WINDOW_MS", "5"))  # Wait for concurrent requests
+EMBEDDING_COALESCE_MAX_BATCH = int(os.getenv("EMBEDDING_COALESCE_MAX_BATCH", "64"))
+
+# HTTP service mode (serve.py)
+SERVICE_HOST = os.getenv("SERVICE_HOST", "127.0.0.1")
+SERVICE_PORT = int(os.getenv("SERVICE_PORT", "8080"))
+SERVICE_WORKERS = int(os.getenv("SERVICE_WORKERS", str(os.cpu_count() or 1)))  # Threads for CPU-bound analysis
+SERVICE_MAX_QUEUE_DEPTH = int(os.getenv("SERVICE_MAX_QUEUE_DEPTH", "256"))  # Admitted requests before 503
+SERVICE_MAX_BATCH = int(os.getenv("SERVICE_MAX_BATCH", "1024"))  # Prompts per /analyze/batch request
+SERVICE_MAX_BODY_BYTES = int(os.getenv("SERVICE_MAX_BODY_BYTES", str(8 * 1024 * 1024)))
+
+# Multi-tenant scheduler (src/scheduler.py): per-tenant rate limits, interactive-before-batch
+# priorities and fair sharing of the Gemini concurrency budget and the local analysis workers
+SCHEDULER_ENABLED = os.getenv("SCHEDULER_ENABLED", "1") == "1"
+SCHEDULER_TENANT_HEADER = os.getenv("SCHEDULER_TENANT_HEADER", "X-Tenant")  # Falls back to the history user header
+SCHEDULER_RATE_PER_SECOND = float(os.getenv("SCHEDULER_RATE_PER_SECOND", "20"))  # Prompts per second per tenant
+SCHEDULER_BURST = float(os.getenv("SCHEDULER_BURST", "100"))  # Token bucket size per tenant
+SCHEDULER_TENANT_LIMITS = os.getenv("SCHEDULER_TENANT_LIMITS", "")  # Overrides, e.g. "team-a=50:200,bulk=2:20" (rate:burst)
+SCHEDULER_LOCAL_SLOTS = int(os.getenv("SCHEDULER_LOCAL_SLOTS", str(SERVICE_WORKERS)))  # Concurrent local analyses
+SCHEDULER_MAX_WAITING = int(os.getenv("SCHEDULER_MAX_WAITING", "1024"))  # Queued requests per resource before rejection
+SCHEDULER_MAX_WAIT_SECONDS = float(os.getenv("SCHEDULER_MAX_WAIT_SECONDS", "30"))  # Longest queue wait or batch throttle
+SCHEDULER_MAX_INTERACTIVE_STREAK = int(os.getenv("SCHEDULER_MAX_INTERACTIVE_STREAK", "8"))  # Grants before waiting batch work gets one
+
+# Analysis result cache: in-process LRU plus an optional SQLite tier shared by workers
+RESULT_CACHE_ENABLED = os.getenv("RESULT_CACHE_ENABLED", "1") == "1"
+RESULT_CACHE_MAX_ENTRIES = int(os.getenv("RESULT_CACHE_MAX_ENTRIES", "10000"))
+RESULT_CACHE_TTL_SECONDS = float(os.getenv("RESULT_CACHE_TTL_SECONDS", str(24 * 3600)))
+RESULT_CACHE_DB_PATH = os.getenv("RESULT_CACHE_DB_PATH", ".cache/results.sqlite")  # Empty disables the disk tier
+RESULT_CACHE_PRUNE_SECONDS = float(os.getenv("RESULT_CACHE_PRUNE_SECONDS", "600"))  # Interval between expired-row sweeps
+
+# Input token accounting (src/token_accounting.py). Counts use a local vocab file: a WordPiece
+# vocab.txt or a tokenizer.json; empty = the embedding model's own files from the local Hugging
+# Face cache. Without either, counts fall back to words plus punctuation marks.
+TOKENIZER_VOCAB_PATH = os.getenv("TOKENIZER_VOCAB_PATH", "")
+TOKENIZER_LOWERCASE = os.getenv("TOKENIZER_LOWERCASE", "1") == "1"  # For a bare vocab.txt (uncased models like MiniLM)
+TOKEN_COUNT_CACHE_SIZE = int(os.getenv("TOKEN_COUNT_CACHE_SIZE", "65536"))  # Memoised per-text counts
+TOKEN_COUNT_CHUNK_CHARS = int(os.getenv("TOKEN_COUNT_CHUNK_CHARS", "2048"))  # Longer texts are counted in sentence pieces
+
+# Long prompts and documents (src/long_documents.py): text is embedded as overlapping word
+# windows, since the embedding model truncates long inputs (256 word pieces for MiniLM)
+LONG_DOCUMENT_MIN_CHARS = int(os.getenv("LONG_DOCUMENT_MIN_CHARS", "1000"))  # Longer prompts are embedded chunk by chunk
+LONG_DOCUMENT_CHUNK_WORDS = int(os.getenv("LONG_DOCUMENT_CHUNK_WORDS", "150"))  # Words per chunk; fits the model's window
+LONG_DOCUMENT_OVERLAP_WORDS = int(os.getenv("LONG_DOCUMENT_OVERLAP_WORDS", "30"))  # Words repeated from the previous chunk
+LONG_DOCUMENT_BATCH_CHUNKS = int(os.getenv("LONG_DOCUMENT_BATCH_CHUNKS", "32"))  # Chunks per encode() call
+LONG_DOCUMENT_TOP_SECTIONS = int(os.getenv("LONG_DOCUMENT_TOP_SECTIONS", "5"))  # Costliest sections reported
+
+# Rule-based compression mode (src/compression.py)
+COMPRESSION_REDUNDANCY_THRESHOLD = float(os.getenv("COMPRESSION_REDUNDANCY_THRESHOLD", "0.85"))  # Cosine of a repeated sentence
+COMPRESSION_TOKEN_BUDGET = int(os.getenv("COMPRESSION_TOKEN_BUDGET", "200"))  # Approximate tokens kept; 0 = no trimming
+
+# Near-duplicate reuse: a prompt whose words overlap an earlier one's by NEAR_DUPLICATE_MIN_JACCARD
+# (MinHash estimate), or whose embedding reaches NEAR_DUPLICATE_MIN_COSINE before a Gemini call,
+# reuses the earlier prompt's optimization result
+NEAR_DUPLICATE_ENABLED = os.getenv("NEAR_DUPLICATE_ENABLED", "1") == "1"
+NEAR_DUPLICATE_MIN_JACCARD = float(os.getenv("NEAR_DUPLICATE_MIN_JACCARD", "0.8"))
+NEAR_DUPLICATE_MIN_COSINE = float(os.getenv("NEAR_DUPLICATE_MIN_COSINE", "0.95"))
+NEAR_DUPLICATE_MAX_ENTRIES = int(os.getenv("NEAR_DUPLICATE_MAX_ENTRIES", "10000"))
+
+# Gemini client: concurrency, timeouts, retries and circuit breaker
+GEMINI_MODEL_NAME = os.getenv("GEMINI_MODEL_NAME", "gemini-2.5-flash-preview-05-20")
+GEMINI_BASE_URL = os.getenv("GEMINI_BASE_URL")  # Set to use the REST endpoint (e.g. the local fake server)
+GEMINI_MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", "8"))
+GEMINI_TIMEOUT_SECONDS = float(os.getenv("GEMINI_TIMEOUT_SECONDS", "30"))
+GEMINI_MAX_RETRIES = int(os.getenv("GEMINI_MAX_RETRIES", "3"))
+GEMINI_BACKOFF_BASE_SECONDS = float(os.getenv("GEMINI_BACKOFF_BASE_SECONDS", "0.5"))
+GEMINI_BACKOFF_MAX_SECONDS = float(os.getenv("GEMINI_BACKOFF_MAX_SECONDS", "8"))
+GEMINI_BREAKER_FAILURE_THRESHOLD = int(os.getenv("GEMINI_BREAKER_FAILURE_THRESHOLD", "5"))
+GEMINI_BREAKER_RESET_SECONDS = float(os.getenv("GEMINI_BREAKER_RESET_SECONDS", "30"))
+GEMINI_PACK_SIZE = int(os.getenv("GEMINI_PACK_SIZE", "8"))  # User prompts packed into one batch request
+GEMINI_FEW_SHOT_K = int(os.getenv("GEMINI_FEW_SHOT_K", "5"))  # Most relevant library examples sent per request (0 = all)
+GEMINI_TEMPLATE_CACHE_SIZE = int(os.getenv("GEMINI_TEMPLATE_CACHE_SIZE", "1024"))  # Memoised few-shot example blocks
+
+# Learned energy model (src/energy_model.py); the heuristic above is used when no fitted model exists
+ENERGY_MODEL_PATH = os.getenv("ENERGY_MODEL_PATH", "models/energy_model.npz")
+ENERGY_MODEL_RIDGE_ALPHA = float(os.getenv("ENERGY_MODEL_RIDGE_ALPHA", "0.001"))
+
+# Live preview (src/live_preview.py)
+LIVE_PREVIEW_DEBOUNCE_MS = float(os.getenv("LIVE_PREVIEW_DEBOUNCE_MS", "400"))  # Pause in typing before the live preview updates
+LIVE_PREVIEW_CHUNK_CACHE_SIZE = int(os.getenv("LIVE_PREVIEW_CHUNK_CACHE_SIZE", "4096"))  # Cached sentence chunks
+
+# File-backed example prompt library (src/prompt_library.py)
+PROMPT_LIBRARY_DIR = os.getenv("PROMPT_LIBRARY_DIR", "data/library")  # Directory of *.jsonl shards
+PROMPT_LIBRARY_POLL_SECONDS = float(os.getenv("PROMPT_LIBRARY_POLL_SECONDS", "2"))  # Watcher poll interval
+
+# Instrumentation (src/instrumentation.py)
+INSTRUMENTATION_ENABLED = os.getenv("INSTRUMENTATION_ENABLED", "1") == "1"
+INSTRUMENTATION_RECENT_TRACES = int(os.getenv("INSTRUMENTATION_RECENT_TRACES", "50"))  # Traces kept for the developer panel
+PROFILE_MODE = os.getenv("PROFILE_MODE", "")  # "cprofile" (per request), "sample" (stack sampler) or empty
+PROFILE_DIR = os.getenv("PROFILE_DIR", ".cache/profiles")
+PROFILE_SAMPLE_INTERVAL_MS = float(os.getenv("PROFILE_SAMPLE_INTERVAL_MS", "5"))
+
+# Analysis history log (src/history.py)
+HISTORY_DB_PATH = os.getenv("HISTORY_DB_PATH", ".cache/history.sqlite")  # Empty disables the history log
+HISTORY_BATCH_SIZE = int(os.getenv("HISTORY_BATCH_SIZE", "64"))  # Buffered rows written per transaction
+HISTORY_FLUSH_SECONDS = float(os.getenv("HISTORY_FLUSH_SECONDS", "2"))  # Max age of a buffered row
+HISTORY_MAX_BUFFERED_ROWS = int(os.getenv("HISTORY_MAX_BUFFERED_ROWS", "10000"))  # Kept while writes fail; oldest dropped beyond
+HISTORY_USER_HEADER = os.getenv("HISTORY_USER_HEADER", "X-Forwarded-User")  # Request header naming the user
+HISTORY_RECENT_LIMIT = int(os.getenv("HISTORY_RECENT_LIMIT", "20"))  # Analyses listed per session in the app
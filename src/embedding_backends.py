@@ -0,0 +1,142 @@
+# src/embedding_backends.py
+"""
+Embedding model backends (torch, torch-int8, onnx, onnx-int8), selected by EMBEDDING_BACKEND.
+The ONNX backends need the extras in requirements-optional.txt.
+"""
+
+import os
+import re
+from dataclasses import dataclass
+
+import numpy as np
+
+from src.config import (
+    EMBEDDING_BACKEND,
+    EMBEDDING_MODEL_NAME,
+    EMBEDDING_ONNX_DIR,
+    EMBEDDING_ONNX_QUANTIZATION,
+    EMBEDDING_THREADS,
+)
+
+@dataclass(frozen=True)
+class EmbeddingBackend:
+    name: str
+    loader: object  # loader(model_name, threads) -> model
+    shares_float32_store: bool  # True when embeddings match PyTorch's to float32 precision
+
+    def store_key(self, model_name: str) -> str:
+        return model_name if self.shares_float32_store else f"{model_name}@{self.name}"
+
+# --- Loaders ---
+
+def _set_torch_threads(threads: int):
+    if threads > 0:
+        import torch
+        torch.set_num_threads(threads)  # Process-wide: also applies to any other torch work
+
+def _load_torch(model_name: str, threads: int):
+    from sentence_transformers import SentenceTransformer
+
+    _set_torch_threads(threads)
+    return SentenceTransformer(model_name, device="cpu")
+
+def _load_torch_int8(model_name: str, threads: int):
+    import torch
+
+    model = _load_torch(model_name, threads)
+    # Weights are stored as int8; activations are quantised on the fly per batch
+    return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+
+def _onnx_model_kwargs(threads: int, file_name: str | None = None) -> dict:
+    try:
+        import onnxruntime
+    except ImportError:
+        raise RuntimeError('The ONNX embedding backends need onnxruntime: pip install -r requirements-optional.txt.') from None
+    session_options = onnxruntime.SessionOptions()
+    if threads > 0:
+        session_options.intra_op_num_threads = threads
+    kwargs = {"provider": "CPUExecutionProvider", "session_options": session_options}
+    if file_name:
+        kwargs["file_name"] = file_name
+    return kwargs
+
+def _load_onnx(model_name: str, threads: int):
+    from sentence_transformers import SentenceTransformer
+
+    return SentenceTransformer(model_name, device="cpu", backend="onnx", model_kwargs=_onnx_model_kwargs(threads))
+
+def _load_onnx_int8(model_name: str, threads: int):
+    from sentence_transformers import SentenceTransformer, export_dynamic_quantized_onnx_model
+
+    model_kwargs = _onnx_model_kwargs(threads)
+    export_dir = os.path.join(EMBEDDING_ONNX_DIR, re.sub(r"[^A-Za-z0-9_.-]", "_", model_name))
+    file_name = f"onnx/model_qint8_{EMBEDDING_ONNX_QUANTIZATION}.onnx"
+    if not os.path.exists(os.path.join(export_dir, file_name)):
+        # One-off: export the float32 graph, then write its quantised copy next to it
+        exported = SentenceTransformer(model_name, device="cpu", backend="onnx", model_kwargs=model_kwargs)
+        exported.save_pretrained(export_dir)
+        export_dynamic_quantized_onnx_model(exported, EMBEDDING_ONNX_QUANTIZATION, export_dir)
+    return SentenceTransformer(export_dir, device="cpu", backend="onnx", model_kwargs={**model_kwargs, "file_name": file_name})
+
+BACKENDS = {
+    "torch": EmbeddingBackend("torch", _load_torch, shares_float32_store=True),
+    "torch-int8": EmbeddingBackend("torch-int8", _load_torch_int8, shares_float32_store=False),
+    "onnx": EmbeddingBackend("onnx", _load_onnx, shares_float32_store=True),
+    "onnx-int8": EmbeddingBackend("onnx-int8", _load_onnx_int8, shares_float32_store=False),
+}
+
+def get_backend(name: str = EMBEDDING_BACKEND) -> EmbeddingBackend:
+    try:
+        return BACKENDS[name]
+    except KeyError:
+        raise ValueError(f"Unknown embedding backend '{name}'. Expected one of: {', '.join(BACKENDS)}.") from None
+
+# --- Public API ---
+
+def load_embedding_backend(name: str = EMBEDDING_BACKEND, model_name: str = EMBEDDING_MODEL_NAME,
+                           threads: int = EMBEDDING_THREADS):
+    """
+    Loads the embedding model on the given inference backend.
+
+    Args:
+        name: A key of BACKENDS.
+        model_name: The sentence-transformers model name or local path.
+        threads: CPU threads used for inference (0 leaves the runtime default).
+
+    Returns:
+        A SentenceTransformer-compatible model.
+    """
+    return get_backend(name).loader(model_name, threads)
+
+def embedding_store_key(name: str = EMBEDDING_BACKEND, model_name: str = EMBEDDING_MODEL_NAME) -> str:
+    """The key under which utils/embedding_store.py keeps embeddings produced by this backend."""
+    return get_backend(name).store_key(model_name)
+
+def model_store_key(model) -> str:
+    """
+    The store key for embeddings produced by a given model object. Models that are not the
+    configured backend (e.g. utils/fake_embedding_model.py) declare their own store_key;
+    anything else, including a BatchEmbeddingService around the configured backend, gets
+    EMBEDDING_STORE_KEY.
+    """
+    model = getattr(model, "model", model)  # Unwraps a BatchEmbeddingService
+    return getattr(model, "store_key", None) or EMBEDDING_STORE_KEY
+
+def embedding_agreement(reference: np.ndarray, candidate: np.ndarray) -> dict:
+    """
+    Row-wise cosine similarity between two backends' embeddings of the same prompts.
+
+    Returns:
+        A dict with the mean and minimum cosine similarity and the largest absolute
+        element difference after L2 normalisation.
+    """
+    reference = reference / np.linalg.norm(reference, axis=1, keepdims=True)
+    candidate = candidate / np.linalg.norm(candidate, axis=1, keepdims=True)
+    cosines = np.einsum("nd,nd->n", reference, candidate)
+    return {
+        "mean_cosine": float(cosines.mean()),
+        "min_cosine": float(cosines.min()),
+        "max_abs_diff": float(np.abs(reference - candidate).max()),
+    }
+
+EMBEDDING_STORE_KEY = embedding_store_key()
@@ -0,0 +1,173 @@
+# src/embedding_service.py
+
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+import numpy as np
+
+from src.config import EMBEDDING_BATCH_SIZE, EMBEDDING_COALESCE_MAX_BATCH, EMBEDDING_COALESCE_WINDOW_MS
+
+class BatchEmbeddingService:
+    """
+    Batching front-end for a SentenceTransformer-style model.
+
+    - encode_library() encodes large prompt lists in length-sorted batches, so each
+      forward pass pads to similar lengths.
+    - encode(str) / submit() coalesce single-prompt requests that arrive within a small
+      time window into one forward pass, run on a background thread.
+    - stats() exposes throughput and latency counters.
+
+    encode() mirrors SentenceTransformer.encode for a single string or a list, so the
+    service can be passed anywhere the raw model was used.
+    """
+
+    def __init__(self, model, batch_size: int = EMBEDDING_BATCH_SIZE,
+                 coalesce_window_ms: float = EMBEDDING_COALESCE_WINDOW_MS,
+                 max_coalesced_batch: int = EMBEDDING_COALESCE_MAX_BATCH,
+                 latency_window: int = 1024):
+        self.model = model
+        self.batch_size = batch_size
+        self.coalesce_window = coalesce_window_ms / 1000
+        self.max_coalesced_batch = max_coalesced_batch
+
+        self._requests = queue.Queue()
+        self._lock = threading.Lock()
+        self._latencies_ms = deque(maxlen=latency_window)
+        self._batch_sizes = deque(maxlen=latency_window)
+        self._embeddings_total = 0
+        self._forward_passes = 0
+        self._encode_seconds = 0.0
+        self._requests_total = 0
+
+        self._closed = False
+        self._worker = threading.Thread(target=self._coalesce_loop, name="embedding-coalescer", daemon=True)
+        self._worker.start()
+
+    # --- Model access ---
+
+    def _forward(self, texts: list) -> np.ndarray:
+        start = time.perf_counter()
+        embeddings = np.asarray(self.model.encode(texts, batch_size=max(1, min(len(texts), self.batch_size))))
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self._embeddings_total += len(texts)
+            self._forward_passes += 1
+            self._encode_seconds += elapsed
+            self._batch_sizes.append(len(texts))
+        return embeddings
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.model.get_sentence_embedding_dimension()
+
+    # --- Bulk encoding ---
+
+    def encode_library(self, prompts: list, batch_size: int | None = None) -> np.ndarray:
+        """
+        Encodes many prompts in length-sorted batches and returns rows in the input order.
+
+        Args:
+            prompts: The prompt strings to encode.
+            batch_size: Prompts per forward pass (defaults to EMBEDDING_BATCH_SIZE).
+
+        Returns:
+            A (N, D) float32 matrix; row i belongs to prompts[i].
+        """
+        if not prompts:
+            return np.empty((0, self.get_sentence_embedding_dimension()), dtype=np.float32)
+
+        batch_size = batch_size or self.batch_size
+        order = np.argsort([len(p) for p in prompts], kind="stable")
+        result = None
+        for start in range(0, len(order), batch_size):
+            batch_positions = order[start:start + batch_size]
+            embeddings = self._forward([prompts[i] for i in batch_positions])
+            if result is None:
+                result = np.empty((len(prompts), embeddings.shape[1]), dtype=np.float32)
+            result[batch_positions] = embeddings
+        return result
+
+    # --- Coalesced single-prompt encoding ---
+
+    def submit(self, prompt: str) -> Future:
+        """Queues one prompt for the next coalesced forward pass and returns a Future of its embedding."""
+        if self._closed:
+            raise RuntimeError("BatchEmbeddingService is closed.")
+        future = Future()
+        self._requests.put((prompt, future, time.perf_counter()))
+        return future
+
+    def encode(self, prompts, **kwargs) -> np.ndarray:
+        """
+        SentenceTransformer-compatible encode: a single string is coalesced with concurrent
+        requests, a list is encoded as a length-sorted library batch.
+        """
+        if isinstance(prompts, str):
+            return self.submit(prompts).result()
+        return self.encode_library(list(prompts), batch_size=kwargs.get("batch_size"))
+
+    def _coalesce_loop(self):
+        while True:
+            first = self._requests.get()
+            if first is None:
+                return
+            pending = [first]
+            deadline = time.perf_counter() + self.coalesce_window
+            while len(pending) < self.max_coalesced_batch:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._requests.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._requests.put(None)  # Let the outer loop exit after this batch
+                    break
+                pending.append(item)
+
+            try:
+                embeddings = self._forward([prompt for prompt, _, _ in pending])
+            except Exception as e:
+                for _, future, _ in pending:
+                    future.set_exception(e)
+                continue
+
+            finished = time.perf_counter()
+            with self._lock:
+                self._requests_total += len(pending)
+                self._latencies_ms.extend((finished - submitted) * 1000 for _, _, submitted in pending)
+            for (_, future, _), embedding in zip(pending, embeddings):
+                future.set_result(embedding)
+
+    def close(self):
+        """Stops the coalescing thread once queued requests are served."""
+        if not self._closed:
+            self._closed = True
+            self._requests.put(None)
+            self._worker.join()
+
+    # --- Metrics ---
+
+    def stats(self) -> dict:
+        """
+        Returns throughput and latency counters.
+
+        Keys: embeddings_total, forward_passes, mean_batch_size, embeddings_per_sec (model time
+        only), coalesced_requests, queue_depth, latency_p50_ms and latency_p99_ms (submit to
+        result for coalesced requests over the recent window).
+        """
+        with self._lock:
+            latencies = np.array(self._latencies_ms) if self._latencies_ms else None
+            return {
+                "embeddings_total": self._embeddings_total,
+                "forward_passes": self._forward_passes,
+                "mean_batch_size": float(np.mean(self._batch_sizes)) if self._batch_sizes else 0.0,
+                "embeddings_per_sec": self._embeddings_total / self._encode_seconds if self._encode_seconds else 0.0,
+                "coalesced_requests": self._requests_total,
+                "queue_depth": self._requests.qsize(),
+                "latency_p50_ms": float(np.percentile(latencies, 50)) if latencies is not None else 0.0,
+                "latency_p99_ms": float(np.percentile(latencies, 99)) if latencies is not None else 0.0,
+            }
@@ -0,0 +1,269 @@
+# src/energy_model.py
+"""
+Learned per-LLM-size energy model, fitted from measured runs.
+
+Fit a model from measured runs (columns: prompt, llm_size, energy_kwh[, output_tokens]):
+    python -m src.energy_model runs.csv --out models/energy_model.npz
+"""
+
+import argparse
+import csv
+import hashlib
+import os
+
+import numpy as np
+
+from src.config import ENERGY_MODEL_PATH, ENERGY_MODEL_RIDGE_ALPHA
+from src.optimization_logic import complexity_from_features, local_complexity_features
+from src.token_accounting import APPROXIMATE, load_token_counter
+
+MODEL_FORMAT_VERSION = 1
+
+PROMPT_FEATURES = ("num_chars", "num_tokens", "num_words", "num_unique_words", "avg_word_length", "complexity")
+OUTPUT_FEATURE = "expected_output_tokens"
+
+# --- Features ---
+
+def prompt_feature_matrix(prompts: list, complexities=None, token_counts=None) -> np.ndarray:
+    """
+    Builds the (len(prompts), len(PROMPT_FEATURES)) feature matrix in one batched pass.
+
+    Args:
+        prompts: The prompt strings.
+        complexities: Optional complexity scores to use instead of the local heuristic
+            (e.g. the scores Gemini returned).
+        token_counts: Optional tokenizer counts (src/token_accounting.py) to use instead of
+            the word-and-punctuation approximation.
+
+    Returns:
+        A float64 matrix; columns follow PROMPT_FEATURES.
+    """
+    features = local_complexity_features(prompts)
+    num_chars = np.fromiter(map(len, prompts), dtype=np.float64, count=len(prompts))
+    if token_counts is None:
+        non_space_chars = np.fromiter((len("".join(p.split())) for p in prompts), dtype=np.float64, count=len(prompts))
+        # Words plus punctuation marks, like gemini_client.approximate_token_count
+        num_tokens = features["num_words"] + np.maximum(non_space_chars - features["total_word_length"], 0)
+    else:
+        num_tokens = np.asarray(token_counts, dtype=np.float64)
+    if complexities is None:
+        complexities = complexity_from_features(features)
+    return np.column_stack([
+        num_chars, num_tokens, features["num_words"], features["num_unique_words"],
+        features["avg_word_length"], np.asarray(complexities, dtype=np.float64),
+    ])
+
+def _ridge(X: np.ndarray, y: np.ndarray, alpha: float) -> np.ndarray:
+    # Closed-form ridge; the bias column (last) is not penalised
+    penalty = alpha * np.eye(X.shape[1])
+    penalty[-1, -1] = 0.0
+    return np.linalg.solve(X.T @ X + penalty, X.T @ y)
+
+# --- Model ---
+
+class EnergyModel:
+    """
+    Per-LLM-size linear energy model over standardised prompt features.
+
+    Each size class has its own weights, so model-specific throughput is learned from the
+    measured runs rather than a fixed multiplier. predict() accepts thousands of prompts
+    per call; all work is matrix arithmetic after one batched feature pass.
+    """
+
+    def __init__(self, size_classes: list, feature_mean: np.ndarray, feature_scale: np.ndarray,
+                 energy_weights: np.ndarray, output_weights: np.ndarray | None = None,
+                 tokenizer: str = APPROXIMATE):
+        self.size_classes = list(size_classes)
+        self.feature_mean = feature_mean
+        self.feature_scale = feature_scale
+        self.energy_weights = energy_weights  # (sizes, features + bias)
+        self.output_weights = output_weights  # (sizes, prompt features + bias) or None
+        self.tokenizer = tokenizer  # TokenCounter.name behind the num_tokens feature
+        self._size_index = {size: i for i, size in enumerate(self.size_classes)}
+
+    def fingerprint(self) -> str:
+        """Short hash of the fitted weights, size classes and tokenizer (results priced by another model differ)."""
+        digest = hashlib.sha256("\0".join(self.size_classes + [self.tokenizer]).encode("utf-8"))
+        for array in (self.feature_mean, self.feature_scale, self.energy_weights, self.output_weights):
+            if array is not None:
+                digest.update(np.ascontiguousarray(array, dtype=np.float64).tobytes())
+        return digest.hexdigest()[:16]
+
+    @property
+    def feature_names(self) -> tuple:
+        return PROMPT_FEATURES + ((OUTPUT_FEATURE,) if self.output_weights is not None else ())
+
+    def _size_ids(self, llm_sizes, count: int) -> np.ndarray:
+        if isinstance(llm_sizes, str):
+            llm_sizes = [llm_sizes] * count
+        try:
+            return np.fromiter((self._size_index[s] for s in llm_sizes), dtype=np.int64, count=count)
+        except KeyError as e:
+            raise ValueError(f"Unknown LLM size {e}. Expected one of {self.size_classes}.") from None
+
+    @staticmethod
+    def _with_bias(X: np.ndarray) -> np.ndarray:
+        return np.column_stack([X, np.ones(len(X))])
+
+    def _design_matrix(self, prompt_features: np.ndarray, size_ids: np.ndarray) -> np.ndarray:
+        n_prompt = len(PROMPT_FEATURES)
+        X = (prompt_features - self.feature_mean[:n_prompt]) / self.feature_scale[:n_prompt]
+        if self.output_weights is not None:
+            expected_output = np.einsum("ij,ij->i", self._with_bias(X), self.output_weights[size_ids])
+            X = np.column_stack([X, (expected_output - self.feature_mean[-1]) / self.feature_scale[-1]])
+        return self._with_bias(X)
+
+    def predict(self, prompts: list, llm_sizes, complexities=None, token_counts=None) -> np.ndarray:
+        """
+        Predicts energy (kWh) for each prompt.
+
+        Args:
+            prompts: The prompt strings.
+            llm_sizes: One size class for all prompts, or one per prompt.
+            complexities: Optional complexity scores overriding the local heuristic.
+            token_counts: Optional input token counts from the tokenizer named by
+                self.tokenizer (the approximation is used otherwise).
+
+        Returns:
+            A float64 array of non-negative energy estimates, one per prompt.
+        """
+        if not len(prompts):
+            return np.zeros(0)
+        size_ids = self._size_ids(llm_sizes, len(prompts))
+        X = self._design_matrix(prompt_feature_matrix(prompts, complexities, token_counts), size_ids)
+        return np.maximum(np.einsum("ij,ij->i", X, self.energy_weights[size_ids]), 0.0)
+
+    def expected_output_tokens(self, prompts: list, llm_sizes, token_counts=None) -> np.ndarray:
+        """Predicted response length in tokens (requires runs with output_tokens at fit time)."""
+        if self.output_weights is None:
+            raise ValueError("This energy model was fitted without output_tokens.")
+        size_ids = self._size_ids(llm_sizes, len(prompts))
+        return self._design_matrix(prompt_feature_matrix(prompts, token_counts=token_counts), size_ids)[:, -2] * self.feature_scale[-1] + self.feature_mean[-1]
+
+    # --- Fitting ---
+
+    @classmethod
+    def fit(cls, prompts: list, llm_sizes: list, energy_kwh, output_tokens=None,
+            ridge_alpha: float = ENERGY_MODEL_RIDGE_ALPHA, token_counter=None) -> "EnergyModel":
+        """
+        Fits per-size ridge regressions.
+
+        Args:
+            prompts: The measured prompts.
+            llm_sizes: The size class each run used.
+            energy_kwh: The measured energy per run.
+            output_tokens: Optional measured response lengths; when given, an expected output
+                length model is fitted first and its prediction becomes an energy feature.
+            ridge_alpha: L2 penalty on the standardised weights.
+            token_counter: The src.token_accounting.TokenCounter behind the num_tokens
+                feature (the approximation when None).
+
+        Returns:
+            The fitted EnergyModel.
+        """
+        energy_kwh = np.asarray(energy_kwh, dtype=np.float64)
+        size_classes = sorted(set(llm_sizes))
+        size_ids = np.array([size_classes.index(s) for s in llm_sizes])
+        token_counts = token_counter.count_many(prompts) if token_counter is not None else None
+        prompt_features = prompt_feature_matrix(prompts, token_counts=token_counts)
+        for i, size in enumerate(size_classes):
+            if np.count_nonzero(size_ids == i) <= prompt_features.shape[1]:
+                raise ValueError(f"Need more than {prompt_features.shape[1]} measured runs for LLM size '{size}'.")
+
+        mean = prompt_features.mean(axis=0)
+        scale = prompt_features.std(axis=0)
+        scale[scale == 0] = 1.0
+        X = cls._with_bias((prompt_features - mean) / scale)
+
+        output_weights = None
+        if output_tokens is not None:
+            output_tokens = np.asarray(output_tokens, dtype=np.float64)
+            output_weights = np.stack([
+                _ridge(X[size_ids == i], output_tokens[size_ids == i], ridge_alpha) for i in range(len(size_classes))
+            ])
+            # Train on the predicted (not measured) output length, as predict() will see it
+            expected_output = np.einsum("ij,ij->i", X, output_weights[size_ids])
+            mean = np.append(mean, expected_output.mean())
+            scale = np.append(scale, expected_output.std() or 1.0)
+            X = np.column_stack([X[:, :-1], (expected_output - mean[-1]) / scale[-1], X[:, -1]])
+
+        energy_weights = np.stack([
+            _ridge(X[size_ids == i], energy_kwh[size_ids == i], ridge_alpha) for i in range(len(size_classes))
+        ])
+        return cls(size_classes, mean, scale, energy_weights, output_weights,
+                   token_counter.name if token_counter is not None else APPROXIMATE)
+
+    @classmethod
+    def from_csv(cls, path: str, ridge_alpha: float = ENERGY_MODEL_RIDGE_ALPHA, token_counter=None) -> "EnergyModel":
+        """Fits a model from a CSV of measured runs (prompt, llm_size, energy_kwh[, output_tokens])."""
+        with open(path, newline="", encoding="utf-8") as f:
+            rows = list(csv.DictReader(f))
+        if not rows:
+            raise ValueError(f"{path} contains no measured runs.")
+        output_tokens = [float(r["output_tokens"]) for r in rows] if "output_tokens" in rows[0] else None
+        return cls.fit(
+            [r["prompt"] for r in rows], [r["llm_size"] for r in rows],
+            [float(r["energy_kwh"]) for r in rows], output_tokens, ridge_alpha, token_counter,
+        )
+
+    # --- Serialisation ---
+
+    def save(self, path: str = ENERGY_MODEL_PATH):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        arrays = {
+            "format_version": np.array(MODEL_FORMAT_VERSION),
+            "size_classes": np.array(self.size_classes),
+            "feature_mean": self.feature_mean,
+            "feature_scale": self.feature_scale,
+            "energy_weights": self.energy_weights,
+            "tokenizer": np.array(self.tokenizer),
+        }
+        if self.output_weights is not None:
+            arrays["output_weights"] = self.output_weights
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(tmp_path, **arrays)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str = ENERGY_MODEL_PATH) -> "EnergyModel":
+        with np.load(path, allow_pickle=False) as data:
+            if int(data["format_version"]) != MODEL_FORMAT_VERSION:
+                raise ValueError(f"{path} has energy model format {int(data['format_version'])}, expected {MODEL_FORMAT_VERSION}.")
+            return cls(
+                [str(s) for s in data["size_classes"]], data["feature_mean"], data["feature_scale"],
+                data["energy_weights"], data["output_weights"] if "output_weights" in data else None,
+                # Models saved before token accounting were fitted on the approximation
+                str(data["tokenizer"]) if "tokenizer" in data else APPROXIMATE,
+            )
+
+def load_energy_model(path: str = ENERGY_MODEL_PATH) -> EnergyModel | None:
+    """Loads the fitted energy model configured in src/config.py, or None if none has been fitted."""
+    if not path or not os.path.exists(path):
+        return None
+    return EnergyModel.load(path)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("runs_csv", help="CSV of measured runs: prompt, llm_size, energy_kwh[, output_tokens].")
+    parser.add_argument("--out", default=ENERGY_MODEL_PATH)
+    parser.add_argument("--ridge-alpha", type=float, default=ENERGY_MODEL_RIDGE_ALPHA)
+    args = parser.parse_args()
+
+    token_counter = load_token_counter()
+    model = EnergyModel.from_csv(args.runs_csv, args.ridge_alpha, token_counter)
+    model.save(args.out)
+
+    with open(args.runs_csv, newline="", encoding="utf-8") as f:
+        rows = list(csv.DictReader(f))
+    prompts = [r["prompt"] for r in rows]
+    measured = np.array([float(r["energy_kwh"]) for r in rows])
+    predicted = model.predict(prompts, [r["llm_size"] for r in rows], token_counts=token_counter.count_many(prompts))
+    r2 = 1 - np.sum((measured - predicted) ** 2) / max(np.sum((measured - measured.mean()) ** 2), 1e-12)
+    print(f"Fitted on {len(rows)} runs ({', '.join(model.size_classes)}); "
+          f"features: {', '.join(model.feature_names)}; tokenizer: {model.tokenizer}")
+    print(f"Training MAE {np.mean(np.abs(measured - predicted)):.5f} kWh, R^2 {r2:.3f}; saved to {args.out}")
+
+if __name__ == "__main__":
+    main()
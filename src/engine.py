@@ -0,0 +1,548 @@
+# src/engine.py
+
+from contextlib import nullcontext
+from dataclasses import asdict, dataclass, fields, replace
+
+import numpy as np
+
+from src.ann_index import build_example_index
+from src.config import (
+    API_KEY,
+    BASE_ENERGY_PER_COMPLEXITY,
+    LLM_SIZE_MULTIPLIERS,
+    LONG_DOCUMENT_MIN_CHARS,
+    PROMPT_LIBRARY_DIR,
+    RESULT_CACHE_DB_PATH,
+)
+from src.optimization_logic import (
+    estimate_energy,
+    estimate_local_complexity,
+    estimate_local_complexity_batch,
+    find_most_similar_example_prompt,
+    get_prompt_embedding,
+    get_prompt_embeddings,
+    perform_gemini_optimization,
+    perform_gemini_optimization_many,
+    select_few_shot_examples,
+)
+from src.compression import compress_prompt
+from src.gemini_client import GeminiUnavailableError
+from src.instrumentation import annotate, metrics, stage, trace
+from src.long_documents import DocumentAnalysis, analyze_document, embed_document
+from src.scheduler import SchedulerRejectedError
+from src.token_accounting import TokenCounter
+
+MODE_LOCAL = "local"
+MODE_GEMINI = "gemini"
+MODE_COMPRESS = "compress"
+MODES = (MODE_LOCAL, MODE_GEMINI, MODE_COMPRESS)
+
+@dataclass
+class AnalysisResult:
+    """The outcome of analysing one prompt: the optimized suggestion plus its energy numbers."""
+    original_prompt: str
+    optimized_prompt: str
+    similarity_score: float  # 0-100
+    original_complexity: float  # 0-100
+    optimized_complexity: float  # 0-100
+    original_energy: float  # kWh
+    optimized_energy: float  # kWh
+    llm_size: str
+    mode: str
+    # Input tokens of each prompt (src/token_accounting.py)
+    original_tokens: int = 0
+    optimized_tokens: int = 0
+    # Gemini payload accounting (zero in local mode)
+    request_bytes: int = 0
+    request_tokens: int = 0
+    few_shot_examples: int = 0
+
+    @property
+    def energy_savings(self) -> float:
+        return self.original_energy - self.optimized_energy
+
+    @property
+    def savings_percentage(self) -> float:
+        return (self.energy_savings / self.original_energy) * 100 if self.original_energy else 0.0
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "AnalysisResult":
+        """Rebuilds a result from to_dict() output, ignoring the derived savings keys."""
+        return cls(**{f.name: data[f.name] for f in fields(cls) if f.name in data})
+
+    def to_dict(self) -> dict:
+        """Plain-dict form (including derived savings) for JSON output."""
+        data = asdict(self)
+        data["energy_savings"] = self.energy_savings
+        data["savings_percentage"] = self.savings_percentage
+        return data
+
+class PromptOptimizer:
+    """
+    Stateless analysis engine shared by the Streamlit UI, the batch CLI and services.
+
+    One instance owns the warm embedding model, the example prompt index and the energy
+    model (a fitted EnergyModel, or the complexity heuristic when energy_model is None or
+    was not fitted on the requested LLM size); analyze() and analyze_many() keep no
+    per-request state, so a single instance can serve many callers. With gemini_fallback, Gemini outages degrade
+    to the local heuristic (the result's mode is then MODE_LOCAL). With near_duplicates
+    (a src.near_duplicates.NearDuplicateCache), prompts close to an earlier one reuse its
+    result instead of being embedded, searched or sent to Gemini again. Input tokens are
+    counted by token_counter (a src.token_accounting.TokenCounter; the word-and-punctuation
+    approximation when None) and priced into every energy estimate. With scheduler (a
+    src.scheduler.RequestScheduler), Gemini calls wait for a fair share of the Gemini
+    concurrency budget on behalf of the calling tenant; a call that cannot get one in time
+    degrades to the local heuristic like an outage.
+    """
+
+    def __init__(self, embedding_model, example_prompts: list, example_index,
+                 api_key: str | None = API_KEY,
+                 base_energy: float = BASE_ENERGY_PER_COMPLEXITY,
+                 size_multipliers: dict = LLM_SIZE_MULTIPLIERS,
+                 result_cache=None,
+                 gemini_fallback: bool = True,
+                 energy_model=None,
+                 near_duplicates=None,
+                 token_counter=None,
+                 scheduler=None):
+        self.embedding_model = embedding_model
+        # Prompts and index are read and swapped together, so a query never mixes two libraries
+        self.example_library = (example_prompts, example_index)
+        self.api_key = api_key
+        self.base_energy = base_energy
+        self.size_multipliers = size_multipliers
+        self.result_cache = result_cache
+        self.gemini_fallback = gemini_fallback
+        self.energy_model = energy_model
+        self.near_duplicates = near_duplicates
+        self.token_counter = token_counter if token_counter is not None else TokenCounter()
+        self.scheduler = scheduler
+        self.library = None
+
+    @classmethod
+    def from_config(cls, example_prompts: list | None = None, embedding_model=None,
+                    watch_library: bool = False, offline: bool = False) -> "PromptOptimizer":
+        """
+        Builds an engine from src/config.py: loads the embedding model (behind a batching
+        service) unless one is given, loads the example library, the local tokenizer and the
+        fitted energy model if one exists, and sets up the multi-tenant scheduler. Stored
+        embeddings and cached results are keyed on the given model's store key (see
+        src.embedding_backends.model_store_key), so a stand-in model never shares them.
+
+        Without explicit example_prompts the library comes from the PROMPT_LIBRARY_DIR shards
+        (hot-reloaded when watch_library is set), falling back to the built-in prompt list.
+
+        offline builds an engine for batch jobs (batch_optimize.py workers): no scheduler,
+        since there are no tenants to share with, and only the in-memory result cache, since
+        many processes writing one SQLite file would only contend for its lock.
+        """
+        from src.embedding_backends import load_embedding_backend, model_store_key
+        from src.embedding_service import BatchEmbeddingService
+        from src.energy_model import load_energy_model
+        from src.near_duplicates import build_near_duplicate_cache
+        from src.prompt_library import PromptLibrary, has_library
+        from src.result_cache import build_result_cache, pipeline_fingerprint
+        from src.scheduler import build_scheduler
+        from src.token_accounting import load_token_counter
+        from utils.embedding_store import load_or_build_embeddings
+
+        if embedding_model is None:
+            embedding_model = BatchEmbeddingService(load_embedding_backend())
+        store_key = model_store_key(embedding_model)
+
+        library = None
+        if example_prompts is None and has_library(PROMPT_LIBRARY_DIR):
+            library = PromptLibrary(PROMPT_LIBRARY_DIR, embedding_model, store_key)
+            example_prompts, example_index = library.snapshot.prompts, library.snapshot.index
+        else:
+            if example_prompts is None:
+                from data.optimized_prompts import example_optimized_prompts
+                example_prompts = example_optimized_prompts
+            example_matrix = load_or_build_embeddings(example_prompts, embedding_model, store_key)
+            example_index = build_example_index(example_matrix, assume_normalised=True)
+
+        energy_model, token_counter = load_energy_model(), load_token_counter()
+        pipeline = pipeline_fingerprint(store_key, energy_model, token_counter.name)
+        optimizer = cls(embedding_model, example_prompts, example_index,
+                        result_cache=build_result_cache(example_prompts, pipeline, "" if offline else RESULT_CACHE_DB_PATH),
+                        energy_model=energy_model, near_duplicates=build_near_duplicate_cache(), token_counter=token_counter,
+                        scheduler=None if offline else build_scheduler())
+        if library is not None:
+            optimizer.attach_library(library)
+            if watch_library:
+                library.watch()
+        return optimizer
+
+    # --- Example library ---
+
+    @property
+    def example_prompts(self) -> list:
+        return self.example_library[0]
+
+    @property
+    def example_index(self):
+        return self.example_library[1]
+
+    def swap_library(self, example_prompts: list, example_index):
+        """
+        Atomically replaces the example library. In-flight analyses keep the library they
+        started with; cached results are moved to the new library's namespace.
+        """
+        self.example_library = (example_prompts, example_index)
+        if self.result_cache is not None:
+            self.result_cache.invalidate(example_prompts)
+        if self.near_duplicates is not None:
+            self.near_duplicates.clear()
+
+    def attach_library(self, library):
+        """Follows a src.prompt_library.PromptLibrary: every reload swaps in its new snapshot."""
+        self.library = library
+        snapshot = library.snapshot
+        if self.example_library[0] is not snapshot.prompts:
+            self.swap_library(snapshot.prompts, snapshot.index)
+        library.subscribe(lambda snapshot: self.swap_library(snapshot.prompts, snapshot.index))
+
+    # --- Energy model ---
+
+    def estimate_energy(self, complexity: float, llm_size: str, input_tokens: int = 0) -> float:
+        """Mock energy (kWh) for a prompt of the given complexity and length on the chosen LLM size."""
+        if llm_size not in self.size_multipliers:
+            raise ValueError(f"Unknown LLM size '{llm_size}'. Expected one of {sorted(self.size_multipliers)}.")
+        return estimate_energy(complexity, llm_size, self.base_energy, self.size_multipliers, input_tokens)
+
+    def count_tokens(self, prompts: list) -> np.ndarray:
+        """Input tokens per prompt, from the memoised token counter."""
+        with stage("tokens"):
+            return self.token_counter.count_many(prompts)
+
+    def estimate_energies(self, prompts: list, complexities, llm_size: str, token_counts=None) -> np.ndarray:
+        """
+        Energy (kWh) for many prompts on the chosen LLM size in one call: the fitted energy
+        model when one is configured and was fitted on llm_size, otherwise the complexity
+        and input-token heuristic. Token counts are computed when not given.
+        """
+        if llm_size not in self.size_multipliers:
+            raise ValueError(f"Unknown LLM size '{llm_size}'. Expected one of {sorted(self.size_multipliers)}.")
+        if token_counts is None:
+            token_counts = self.count_tokens(prompts)
+        if self.energy_model is not None and llm_size in self.energy_model.size_classes:
+            # A model fitted with another tokenizer recomputes its own approximate counts
+            same_tokenizer = self.energy_model.tokenizer == self.token_counter.name
+            return self.energy_model.predict(prompts, llm_size, complexities, token_counts if same_tokenizer else None)
+        return estimate_energy(np.asarray(complexities, dtype=np.float64), llm_size, self.base_energy, self.size_multipliers,
+                               np.asarray(token_counts, dtype=np.float64))
+
+    def _build_result(self, prompt: str, optimized_prompt: str, similarity_score: float,
+                      original_complexity: float, optimized_complexity: float,
+                      llm_size: str, mode: str, energies=None, token_counts=None) -> AnalysisResult:
+        if token_counts is None:
+            token_counts = self.count_tokens([prompt, optimized_prompt])
+        if energies is None:
+            with stage("energy"):
+                energies = self.estimate_energies([prompt, optimized_prompt], [original_complexity, optimized_complexity],
+                                                  llm_size, token_counts)
+        return AnalysisResult(
+            original_prompt=prompt,
+            optimized_prompt=optimized_prompt,
+            similarity_score=float(similarity_score),
+            original_complexity=float(original_complexity),
+            optimized_complexity=float(optimized_complexity),
+            original_energy=float(energies[0]),
+            optimized_energy=float(energies[1]),
+            llm_size=llm_size,
+            mode=mode,
+            original_tokens=int(token_counts[0]),
+            optimized_tokens=int(token_counts[1]),
+        )
+
+    # --- Analysis ---
+
+    def _embed(self, prompt: str) -> np.ndarray:
+        if len(prompt) > LONG_DOCUMENT_MIN_CHARS:
+            # The model truncates long inputs, so embed overlapping chunks instead
+            return embed_document(prompt, self.embedding_model)
+        return get_prompt_embedding(prompt, self.embedding_model)
+
+    def _embed_many(self, prompts: list) -> np.ndarray:
+        long_positions = [i for i, p in enumerate(prompts) if len(p) > LONG_DOCUMENT_MIN_CHARS]
+        if not long_positions:
+            return get_prompt_embeddings(prompts, self.embedding_model)
+        short_positions = [i for i, p in enumerate(prompts) if len(p) <= LONG_DOCUMENT_MIN_CHARS]
+        long_embeddings = [embed_document(prompts[i], self.embedding_model) for i in long_positions]
+        embeddings = np.empty((len(prompts), len(long_embeddings[0])), dtype=np.float32)
+        embeddings[long_positions] = long_embeddings
+        if short_positions:
+            embeddings[short_positions] = get_prompt_embeddings([prompts[i] for i in short_positions], self.embedding_model)
+        return embeddings
+
+    def _analyze_local(self, prompt: str, embedding: np.ndarray, llm_size: str) -> AnalysisResult:
+        example_prompts, example_index = self.example_library
+        with stage("similarity_search"):
+            optimized_prompt, similarity_score = find_most_similar_example_prompt(embedding, example_index, example_prompts)
+        with stage("complexity"):
+            original_complexity = estimate_local_complexity(prompt)
+            optimized_complexity = estimate_local_complexity(optimized_prompt)
+        return self._build_result(
+            prompt, optimized_prompt, similarity_score, original_complexity, optimized_complexity,
+            llm_size, MODE_LOCAL,
+        )
+
+    def _analyze_local_many(self, prompts: list, embeddings: np.ndarray, llm_size: str) -> list[AnalysisResult]:
+        example_prompts, example_index = self.example_library
+        with stage("similarity_search"):
+            matches = [find_most_similar_example_prompt(e, example_index, example_prompts) for e in embeddings]
+        # One vectorized pass each scores and prices the prompts and their matched examples together
+        texts = list(prompts) + [optimized for optimized, _ in matches]
+        with stage("complexity"):
+            complexities = estimate_local_complexity_batch(texts)
+        token_counts = self.count_tokens(texts)
+        with stage("energy"):
+            energies = self.estimate_energies(texts, complexities, llm_size, token_counts)
+        n = len(prompts)
+        return [
+            self._build_result(prompt, optimized_prompt, similarity_score,
+                               complexities[i], complexities[n + i], llm_size, MODE_LOCAL,
+                               energies=(energies[i], energies[n + i]),
+                               token_counts=(token_counts[i], token_counts[n + i]))
+            for i, (prompt, (optimized_prompt, similarity_score)) in enumerate(zip(prompts, matches))
+        ]
+
+    def _analyze_compress(self, prompt: str, embedding: np.ndarray, llm_size: str) -> AnalysisResult:
+        with stage("compression"):
+            compressed, similarity = compress_prompt(prompt, self.embedding_model, embedding)
+        with stage("complexity"):
+            original_complexity = estimate_local_complexity(prompt)
+            optimized_complexity = estimate_local_complexity(compressed)
+        return self._build_result(
+            prompt, compressed, similarity * 100, original_complexity, optimized_complexity,
+            llm_size, MODE_COMPRESS,
+        )
+
+    def _gemini_result(self, prompt: str, result: dict, llm_size: str) -> AnalysisResult:
+        optimized_prompt = result.get("generatedOptimizedPrompt")
+        similarity_score = result.get("similarityScore")
+        original_complexity = result.get("originalPromptComplexity")
+        optimized_complexity = result.get("optimizedPromptComplexity")
+        if not all([optimized_prompt, similarity_score is not None, original_complexity is not None, optimized_complexity is not None]):
+            raise ValueError("Gemini API did not return all expected data.")
+
+        return replace(
+            self._build_result(
+                prompt, optimized_prompt, similarity_score, original_complexity, optimized_complexity,
+                llm_size, MODE_GEMINI,
+            ),
+            request_bytes=int(result.get("requestBytes", 0)),
+            request_tokens=int(result.get("requestTokens", 0)),
+            few_shot_examples=int(result.get("fewShotExamples", 0)),
+        )
+
+    def _few_shot_examples(self, embedding: np.ndarray) -> list:
+        # Only the nearest library entries go to Gemini, not the whole library
+        example_prompts, example_index = self.example_library
+        with stage("few_shot_selection"):
+            return select_few_shot_examples(embedding, example_index, example_prompts)
+
+    def _gemini_slot(self):
+        if self.scheduler is None:
+            return nullcontext()
+        return self.scheduler.gemini_slot()
+
+    def _analyze_gemini(self, prompt: str, embedding: np.ndarray, llm_size: str) -> AnalysisResult:
+        examples = self._few_shot_examples(embedding)
+        try:
+            with self._gemini_slot(), stage("gemini"):
+                result = perform_gemini_optimization(prompt, examples, self.api_key)
+            return self._gemini_result(prompt, result, llm_size)
+        except (GeminiUnavailableError, SchedulerRejectedError, ValueError):
+            if not self.gemini_fallback:
+                raise
+            metrics.increment("gemini_fallbacks")
+            # Gemini is down, the breaker is open, no Gemini slot freed up or the response was
+            # incomplete: answer with the local heuristic instead
+            return self._analyze_local(prompt, embedding, llm_size)
+
+    def _analyze_gemini_many(self, prompts: list, misses: list, embeddings: np.ndarray, llm_size: str) -> list[AnalysisResult]:
+        responses = ()
+        try:
+            examples_per_prompt = [self._few_shot_examples(e) for e in embeddings]
+            if self.scheduler is not None:
+                self.scheduler.release_local_slot()
+            # Packs several prompts into each Gemini request; each pack takes its own Gemini slot
+            with stage("gemini"):
+                responses = perform_gemini_optimization_many(
+                    [prompts[i] for i in misses], self.example_prompts, self.api_key,
+                    examples_per_prompt=examples_per_prompt,
+                    pack_slot=self.scheduler.gemini_pack_slots() if self.scheduler is not None else None,
+                )
+        except (GeminiUnavailableError, SchedulerRejectedError):
+            if not self.gemini_fallback:
+                raise
+        computed = [None] * len(misses)
+        for position, (i, response) in enumerate(zip(misses, responses)):
+            # A failed pack or an incomplete item only sends its own prompts to the fallback
+            try:
+                if isinstance(response, Exception):
+                    raise response
+                computed[position] = self._gemini_result(prompts[i], response, llm_size)
+            except (GeminiUnavailableError, SchedulerRejectedError, ValueError):
+                if not self.gemini_fallback:
+                    raise
+        fallback = [position for position, result in enumerate(computed) if result is None]
+        if fallback:
+            metrics.increment("gemini_fallbacks", len(fallback))
+            local = self._analyze_local_many([prompts[misses[p]] for p in fallback], embeddings[fallback], llm_size)
+            for position, result in zip(fallback, local):
+                computed[position] = result
+        return computed
+
+    def _cached(self, prompt: str, llm_size: str, mode: str) -> AnalysisResult | None:
+        if self.result_cache is None:
+            return None
+        with stage("cache_lookup"):
+            cached = self.result_cache.get(prompt, llm_size, mode)
+        if cached is None:
+            return None
+        # A local-mode key is the normalised prompt, so echo back the caller's exact text
+        return replace(AnalysisResult.from_dict(cached), original_prompt=prompt)
+
+    def _near_duplicate(self, prompt: str, llm_size: str, mode: str, embedding: np.ndarray | None = None) -> AnalysisResult | None:
+        # Compression rewrites the prompt's own words, so another prompt's output does not carry over
+        if self.near_duplicates is None or mode == MODE_COMPRESS:
+            return None
+        with stage("near_duplicate_lookup"):
+            if embedding is None:
+                found = self.near_duplicates.find_text(prompt, llm_size, mode)
+            else:
+                found = self.near_duplicates.find_embedding(prompt, embedding, llm_size, mode)
+        if found is None:
+            return None
+        annotate(cache_hit=True, near_duplicate=True)
+        metrics.increment("near_duplicate_hits")
+        result = replace(AnalysisResult.from_dict(found[0]), original_prompt=prompt)
+        # The optimized side carries over; this prompt's own cost is cheap to price exactly. Gemini's
+        # complexity judgement is kept, since only another Gemini call could re-score the prompt
+        complexity = estimate_local_complexity(prompt) if result.mode == MODE_LOCAL else result.original_complexity
+        tokens = self.count_tokens([prompt])
+        energy = self.estimate_energies([prompt], [complexity], llm_size, tokens)[0]
+        return replace(result, original_complexity=float(complexity), original_energy=float(energy),
+                       original_tokens=int(tokens[0]))
+
+    def _store(self, result: AnalysisResult, embedding: np.ndarray | None = None):
+        if self.result_cache is None and self.near_duplicates is None:
+            return
+        with stage("cache_store"):
+            value = asdict(result)
+            if self.result_cache is not None:
+                self.result_cache.set(result.original_prompt, result.llm_size, result.mode, value)
+            if self.near_duplicates is not None and result.mode != MODE_COMPRESS:
+                # Only Gemini results are matched by embedding: a local result is one index lookup away
+                self.near_duplicates.add(result.original_prompt, result.llm_size, result.mode, value,
+                                         embedding if result.mode == MODE_GEMINI else None)
+
+    def analyze(self, prompt: str, llm_size: str = "medium", mode: str = MODE_LOCAL,
+                embedding: np.ndarray | None = None) -> AnalysisResult:
+        """
+        Analyses one prompt: finds or generates an optimized version and estimates both energies.
+        Results are served from the result cache when an equivalent prompt was seen before,
+        or reused from a near-duplicate prompt when near-duplicate detection is enabled.
+
+        Args:
+            prompt: The user's original prompt.
+            llm_size: The target LLM size ('small', 'medium', 'large').
+            mode: MODE_LOCAL (nearest example prompt), MODE_GEMINI (generated by the Gemini API) or
+                MODE_COMPRESS (the prompt itself, compressed by src/compression.py).
+            embedding: The prompt's embedding when it is already known (e.g. the embedding of
+                an analyze_document() result for the same text), so it is not encoded again.
+
+        Returns:
+            An AnalysisResult.
+        """
+        if not prompt.strip():
+            raise ValueError("Please enter a prompt to analyze.")
+        with trace("analyze", mode=mode, llm_size=llm_size):
+            if mode not in MODES:
+                raise ValueError(f"Unknown optimization mode '{mode}'.")
+            cached = self._cached(prompt, llm_size, mode)
+            if cached is not None:
+                annotate(cache_hit=True)
+                return cached
+            reused = self._near_duplicate(prompt, llm_size, mode)
+            if reused is not None:
+                return reused
+
+            if embedding is None:
+                with stage("embedding"):
+                    embedding = self._embed(prompt)
+            if mode == MODE_LOCAL:
+                result = self._analyze_local(prompt, embedding, llm_size)
+            elif mode == MODE_COMPRESS:
+                result = self._analyze_compress(prompt, embedding, llm_size)
+            else:
+                # A paraphrase of an earlier prompt can still skip the Gemini round-trip
+                reused = self._near_duplicate(prompt, llm_size, mode, embedding)
+                if reused is not None:
+                    return reused
+                result = self._analyze_gemini(prompt, embedding, llm_size)
+            self._store(result, embedding)
+            return result
+
+    def analyze_many(self, prompts: list, llm_size: str = "medium", mode: str = MODE_LOCAL) -> list[AnalysisResult]:
+        """
+        Analyses many prompts. Only cache misses that are not near-duplicates of earlier
+        prompts are computed: in local mode they are embedded in one batched call, in Gemini
+        mode they are packed into multi-prompt requests.
+
+        Returns:
+            One AnalysisResult per prompt, in input order.
+        """
+        for i, prompt in enumerate(prompts):
+            if not prompt.strip():
+                raise ValueError(f"Please enter a prompt to analyze (prompt {i + 1} is empty).")
+        if mode not in MODES:
+            raise ValueError(f"Unknown optimization mode '{mode}'.")
+
+        with trace("analyze_many", mode=mode, llm_size=llm_size, prompts=len(prompts)):
+            results = [self._cached(p, llm_size, mode) for p in prompts]
+            for i, result in enumerate(results):
+                if result is None:
+                    results[i] = self._near_duplicate(prompts[i], llm_size, mode)
+            misses = [i for i, r in enumerate(results) if r is None]
+            if not misses:
+                return results
+
+            # Embeddings drive both the local matches and Gemini's few-shot example selection
+            with stage("embedding"):
+                embeddings = self._embed_many([prompts[i] for i in misses])
+            computed = None
+            if mode == MODE_COMPRESS:
+                computed = [self._analyze_compress(prompts[i], e, llm_size) for i, e in zip(misses, embeddings)]
+            elif mode == MODE_GEMINI:
+                for i, embedding in zip(misses, embeddings):
+                    results[i] = self._near_duplicate(prompts[i], llm_size, mode, embedding)
+                remaining = [position for position, i in enumerate(misses) if results[i] is None]
+                misses, embeddings = [misses[p] for p in remaining], embeddings[remaining]
+                if not misses:
+                    return results
+                computed = self._analyze_gemini_many(prompts, misses, embeddings, llm_size)
+            if computed is None:
+                computed = self._analyze_local_many([prompts[i] for i in misses], embeddings, llm_size)
+
+            for i, result, embedding in zip(misses, computed, embeddings):
+                results[i] = result
+                self._store(result, embedding)
+            return results
+
+    def analyze_document(self, source, llm_size: str = "medium") -> DocumentAnalysis:
+        """
+        Streams a long document (a string, text file object or iterable of text blocks) in
+        overlapping chunks and reports its aggregate energy and costliest sections; memory
+        stays bounded whatever the input size. See src/long_documents.py.
+        """
+        return analyze_document(self, source, llm_size)
+
+    def invalidate_cache(self):
+        """Drops cached results; call after the example prompt library changes."""
+        if self.result_cache is not None:
+            self.result_cache.invalidate(self.example_prompts)
+        if self.near_duplicates is not None:
+            self.near_duplicates.clear()
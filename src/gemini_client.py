@@ -0,0 +1,424 @@
+# src/gemini_client.py
+
+import asyncio
+import contextlib
+import json
+import random
+import re
+import threading
+import time
+import urllib.error
+import urllib.request
+from functools import lru_cache
+
+from src.config import (
+    GEMINI_BACKOFF_BASE_SECONDS,
+    GEMINI_BACKOFF_MAX_SECONDS,
+    GEMINI_BASE_URL,
+    GEMINI_BREAKER_FAILURE_THRESHOLD,
+    GEMINI_BREAKER_RESET_SECONDS,
+    GEMINI_MAX_CONCURRENCY,
+    GEMINI_MAX_RETRIES,
+    GEMINI_MODEL_NAME,
+    GEMINI_PACK_SIZE,
+    GEMINI_TEMPLATE_CACHE_SIZE,
+    GEMINI_TIMEOUT_SECONDS,
+)
+
+# --- Structured output schemas ---
+
+GEMINI_RESULT_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "generatedOptimizedPrompt": {"type": "STRING"},
+        "similarityScore": {"type": "NUMBER"},
+        "originalPromptComplexity": {"type": "NUMBER"},
+        "optimizedPromptComplexity": {"type": "NUMBER"}
+    },
+}
+
+# Packed requests return one result per prompt, tagged with the prompt's position
+GEMINI_BATCH_SCHEMA = {
+    "type": "ARRAY",
+    "items": {
+        "type": "OBJECT",
+        "properties": {"index": {"type": "INTEGER"}, **GEMINI_RESULT_SCHEMA["properties"]},
+    },
+}
+
+# --- Prompt templates ---
+
+# Templates are formatted once per request; only the few-shot example block varies, and its
+# JSON rendering is memoised in _render_examples.
+# The prompt now asks Gemini to GENERATE the optimized prompt
+_SINGLE_PROMPT_TEMPLATE = """Given the user prompt: "{user_prompt}".
+
+    Your task is to generate a concise and energy-efficient version of this prompt.
+    Also, provide:
+    1.  A 'complexity score' for the user's original prompt (a number between 0 and 100, where higher complexity generally implies more computational effort and thus higher energy consumption).
+    2.  A 'complexity score' for the generated optimized prompt (a number between 0 and 100).
+    3.  A 'similarity score' between the original prompt and your generated optimized prompt (a number between 0 and 100, where 100 is identical).
+
+    Return the results in JSON format.
+
+    Example of desired optimized prompts are: {examples}.
+    """
+
+_BATCH_PROMPT_TEMPLATE = """Given the following numbered user prompts:
+    {numbered_prompts}
+
+    For EACH prompt, generate a concise and energy-efficient version of it.
+    Also, provide for each one:
+    1.  A 'complexity score' for the user's original prompt (a number between 0 and 100, where higher complexity generally implies more computational effort and thus higher energy consumption).
+    2.  A 'complexity score' for the generated optimized prompt (a number between 0 and 100).
+    3.  A 'similarity score' between the original prompt and your generated optimized prompt (a number between 0 and 100, where 100 is identical).
+
+    Return a JSON array with one object per prompt, including its number in the 'index' field.
+
+    Example of desired optimized prompts are: {examples}.
+    """
+
+@lru_cache(maxsize=GEMINI_TEMPLATE_CACHE_SIZE)
+def _render_examples(examples: tuple) -> str:
+    return json.dumps(list(examples))
+
+def build_gemini_prompt(user_prompt: str, example_optimized_prompts: list) -> str:
+    """Builds the single-prompt optimization request text."""
+    return _SINGLE_PROMPT_TEMPLATE.format(
+        user_prompt=user_prompt, examples=_render_examples(tuple(example_optimized_prompts))
+    )
+
+def build_gemini_batch_prompt(user_prompts: list, example_optimized_prompts: list) -> str:
+    """Builds one request text that asks for results for several user prompts at once."""
+    numbered = "\n".join(f"{i}. {json.dumps(p)}" for i, p in enumerate(user_prompts))
+    return _BATCH_PROMPT_TEMPLATE.format(
+        numbered_prompts=numbered, examples=_render_examples(tuple(example_optimized_prompts))
+    )
+
+_TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+def approximate_token_count(text: str) -> int:
+    """Rough token count (words and punctuation marks) used for payload accounting."""
+    return len(_TOKEN_PATTERN.findall(text))
+
+# --- Errors ---
+
+class GeminiUnavailableError(RuntimeError):
+    """Raised when Gemini cannot be reached (after retries) or the circuit breaker is open."""
+
+class CircuitOpenError(GeminiUnavailableError):
+    """Raised without calling Gemini while the circuit breaker is open."""
+
+class GeminiRequestError(GeminiUnavailableError):
+    """Raised without retrying when Gemini rejects the request (4xx) or its response is unusable."""
+
+def is_transient(error: BaseException) -> bool:
+    """Whether a failed attempt is worth retrying: timeouts, connection errors, 429 and 5xx."""
+    if isinstance(error, (TimeoutError, asyncio.TimeoutError, ConnectionError)):
+        return True
+    # urllib's HTTPError and the google-api-core errors both carry the HTTP status as .code
+    code = getattr(error, "code", None)
+    if isinstance(code, int):
+        return code == 429 or code >= 500
+    return isinstance(error, urllib.error.URLError)  # Unreachable host, refused connection, ...
+
+# --- Transports ---
+
+class GenAITransport:
+    """Calls Gemini through the google-generativeai SDK. Configures the API key once."""
+
+    def __init__(self, api_key: str | None, model_name: str = GEMINI_MODEL_NAME):
+        import google.generativeai as genai
+
+        genai.configure(api_key=api_key)
+        self._genai = genai
+        self._models = {}
+        self.model_name = model_name
+
+    def _model(self, schema: dict):
+        key = json.dumps(schema, sort_keys=True)
+        if key not in self._models:
+            self._models[key] = self._genai.GenerativeModel(
+                self.model_name,
+                generation_config={"response_mime_type": "application/json", "response_schema": schema},
+            )
+        return self._models[key]
+
+    async def generate(self, text: str, schema: dict) -> str:
+        response = await self._model(schema).generate_content_async(text)
+        # Extract the JSON string from the response
+        return response.candidates[0].content.parts[0].text
+
+class HTTPTransport:
+    """
+    Calls the Gemini REST generateContent endpoint at base_url. Point GEMINI_BASE_URL at
+    utils/fake_gemini_server.py to run everything against a local fake.
+    """
+
+    def __init__(self, base_url: str, api_key: str | None, model_name: str = GEMINI_MODEL_NAME):
+        self.url = f"{base_url.rstrip('/')}/v1beta/models/{model_name}:generateContent?key={api_key or ''}"
+
+    def _post(self, body: bytes, timeout: float) -> dict:
+        request = urllib.request.Request(self.url, data=body, headers={"Content-Type": "application/json"})
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return json.loads(response.read())
+
+    async def generate(self, text: str, schema: dict, timeout: float = GEMINI_TIMEOUT_SECONDS) -> str:
+        body = json.dumps({
+            "contents": [{"parts": [{"text": text}]}],
+            "generationConfig": {"responseMimeType": "application/json", "responseSchema": schema},
+        }).encode("utf-8")
+        payload = await asyncio.to_thread(self._post, body, timeout)
+        return payload["candidates"][0]["content"]["parts"][0]["text"]
+
+# --- Resilience ---
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures and rejects calls for
+    `reset_timeout` seconds; then lets one trial call through (half-open) and closes
+    again on success. A trial that ends without an outcome (cancelled, or a request error
+    that says nothing about availability) must call release_trial().
+    """
+
+    def __init__(self, failure_threshold: int = GEMINI_BREAKER_FAILURE_THRESHOLD,
+                 reset_timeout: float = GEMINI_BREAKER_RESET_SECONDS, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state()
+
+    def _state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if self._clock() - self._opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def before_call(self):
+        """Raises CircuitOpenError if the call should not be attempted."""
+        with self._lock:
+            state = self._state()
+            if state == "open" or (state == "half_open" and self._trial_in_flight):
+                raise CircuitOpenError("Gemini circuit breaker is open; using the local fallback.")
+            if state == "half_open":
+                self._trial_in_flight = True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def release_trial(self):
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_in_flight = False
+            if self._failures >= self.failure_threshold or self._opened_at is not None:
+                self._opened_at = self._clock()
+
+# --- Client ---
+
+class AsyncGeminiClient:
+    """
+    Asynchronous Gemini client with a concurrency limit, per-attempt timeouts, exponential
+    backoff with full jitter and a circuit breaker. optimize_many() can pack several user
+    prompts into one structured-output request.
+
+    Synchronous callers (Streamlit, worker threads) use run_sync(), which executes the
+    coroutine on the client's own background event loop so the concurrency limit is shared.
+    """
+
+    def __init__(self, transport, max_concurrency: int = GEMINI_MAX_CONCURRENCY,
+                 timeout: float = GEMINI_TIMEOUT_SECONDS, max_retries: int = GEMINI_MAX_RETRIES,
+                 backoff_base: float = GEMINI_BACKOFF_BASE_SECONDS, backoff_max: float = GEMINI_BACKOFF_MAX_SECONDS,
+                 breaker: CircuitBreaker | None = None):
+        self.transport = transport
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker = breaker or CircuitBreaker()
+        self.metrics = {"requests": 0, "retries": 0, "failures": 0, "rejected_by_breaker": 0, "request_bytes": 0}
+        self._loop = None
+        self._loop_lock = threading.Lock()
+        self._semaphore = None
+
+    # --- Event loop plumbing ---
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        with self._loop_lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, name="gemini-client", daemon=True).start()
+            return self._loop
+
+    def run_sync(self, coro):
+        """Runs a client coroutine from synchronous code and returns its result."""
+        return asyncio.run_coroutine_threadsafe(coro, self._ensure_loop()).result()
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        # Created lazily so it belongs to whichever loop first awaits on the client
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    # --- Calls ---
+
+    async def _call(self, text: str, schema: dict) -> tuple[object, dict]:
+        """
+        One logical request: breaker check, bounded concurrency, timeout and retries. Only
+        transient failures (is_transient) are retried and count towards the circuit breaker;
+        any other failure raises GeminiRequestError at once.
+
+        Returns:
+            The parsed JSON response and a usage dict with the request and response sizes.
+        """
+        try:
+            self.breaker.before_call()
+        except CircuitOpenError:
+            self.metrics["rejected_by_breaker"] += 1
+            raise
+
+        settled = False
+        try:
+            last_error = None
+            for attempt in range(self.max_retries + 1):
+                if attempt:
+                    self.metrics["retries"] += 1
+                    delay = min(self.backoff_max, self.backoff_base * (2 ** (attempt - 1)))
+                    await asyncio.sleep(random.uniform(0, delay))
+                try:
+                    async with self._get_semaphore():
+                        self.metrics["requests"] += 1
+                        text_response = await asyncio.wait_for(self.transport.generate(text, schema), self.timeout)
+                except Exception as e:
+                    if not is_transient(e):
+                        self.metrics["failures"] += 1
+                        raise GeminiRequestError(f"Gemini rejected the request: {type(e).__name__}: {e}") from e
+                    last_error = e
+                    continue
+                try:
+                    parsed = json.loads(text_response)
+                except ValueError as e:
+                    self.metrics["failures"] += 1
+                    raise GeminiRequestError(f"Gemini returned invalid JSON: {e}") from e
+                self.breaker.record_success()
+                settled = True
+                usage = {
+                    "requestBytes": len(text.encode("utf-8")),
+                    "requestTokens": approximate_token_count(text),
+                    "responseBytes": len(text_response.encode("utf-8")),
+                }
+                self.metrics["request_bytes"] += usage["requestBytes"]
+                return parsed, usage
+
+            self.metrics["failures"] += 1
+            self.breaker.record_failure()
+            settled = True
+            raise GeminiUnavailableError(
+                f"Gemini request failed after {self.max_retries + 1} attempts: {type(last_error).__name__}: {last_error}"
+            ) from last_error
+        finally:
+            if not settled:
+                # Cancelled, or failed in a way that says nothing about Gemini's health
+                self.breaker.release_trial()
+
+    async def optimize(self, user_prompt: str, example_optimized_prompts: list) -> dict:
+        """
+        Returns generatedOptimizedPrompt, similarityScore and both complexity scores for one
+        prompt, plus payload accounting: requestBytes, requestTokens, responseBytes and
+        fewShotExamples (the number of examples sent).
+        """
+        parsed, usage = await self._call(build_gemini_prompt(user_prompt, example_optimized_prompts), GEMINI_RESULT_SCHEMA)
+        return {**parsed, **usage, "fewShotExamples": len(example_optimized_prompts)}
+
+    async def optimize_many(self, user_prompts: list, example_optimized_prompts: list,
+                            pack_size: int = GEMINI_PACK_SIZE,
+                            examples_per_prompt: list[list] | None = None, pack_slot=None) -> list[dict]:
+        """
+        Optimizes many prompts, packing up to pack_size prompts into each request. Packs run
+        concurrently (bounded by the concurrency limit); a pack whose response does not
+        cover every prompt is retried one prompt per request. A failed pack does not fail the
+        others: its prompts get the error in place of a result, and only when every prompt
+        failed is the first error raised.
+
+        pack_slot(prompts), when given, is an async context manager held around each request
+        (e.g. RequestScheduler.gemini_pack_slots()), so packs are admitted one at a time.
+
+        When examples_per_prompt is given, each pack sends the union of its prompts' few-shot
+        examples instead of example_optimized_prompts. Payload accounting for a pack is split
+        evenly across the prompts in it.
+        """
+        def examples_for(positions: range) -> list:
+            if examples_per_prompt is None:
+                return example_optimized_prompts
+            return list(dict.fromkeys(e for i in positions for e in examples_per_prompt[i]))
+
+        async def run_pack(positions: range) -> list[dict]:
+            pack = [user_prompts[i] for i in positions]
+            examples = examples_for(positions)
+            async with pack_slot(len(pack)) if pack_slot is not None else contextlib.nullcontext():
+                if len(pack) == 1:
+                    return [await self.optimize(pack[0], examples)]
+                items, usage = await self._call(build_gemini_batch_prompt(pack, examples), GEMINI_BATCH_SCHEMA)
+            by_index = {item.get("index"): item for item in items if isinstance(item, dict)} if isinstance(items, list) else {}
+            if set(by_index) != set(range(len(pack))):
+                return _settled(await asyncio.gather(*(run_pack(range(i, i + 1)) for i in positions), return_exceptions=True))
+            shared_usage = {key: value // len(pack) for key, value in usage.items()}
+            return [
+                {**{k: v for k, v in by_index[i].items() if k != "index"}, **shared_usage, "fewShotExamples": len(examples)}
+                for i in range(len(pack))
+            ]
+
+        step = max(1, pack_size)
+        packs = [range(i, min(i + step, len(user_prompts))) for i in range(0, len(user_prompts), step)]
+        outcomes = _settled(await asyncio.gather(*(run_pack(positions) for positions in packs), return_exceptions=True))
+        results = [result for positions, outcome in zip(packs, outcomes)
+                   for result in ([outcome] * len(positions) if isinstance(outcome, Exception) else outcome)]
+        if results and all(isinstance(result, Exception) for result in results):
+            raise results[0]
+        return results
+
+    def stats(self) -> dict:
+        return {**self.metrics, "breaker_state": self.breaker.state}
+
+def _settled(outcomes: list) -> list:
+    # gather(return_exceptions=True) also returns cancellations; those propagate, while
+    # errors (Gemini failures, a pack slot that never freed up) become per-prompt results
+    for outcome in outcomes:
+        if isinstance(outcome, BaseException) and not isinstance(outcome, Exception):
+            raise outcome
+    return outcomes
+
+# --- Factory ---
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+def get_gemini_client(api_key: str | None) -> AsyncGeminiClient:
+    """
+    Returns the process-wide client for this API key, created on first use. Uses the REST
+    transport when GEMINI_BASE_URL is set (e.g. a local fake server), otherwise the SDK.
+    """
+    with _clients_lock:
+        if api_key not in _clients:
+            if GEMINI_BASE_URL:
+                transport = HTTPTransport(GEMINI_BASE_URL, api_key)
+            else:
+                transport = GenAITransport(api_key)
+            _clients[api_key] = AsyncGeminiClient(transport)
+        return _clients[api_key]
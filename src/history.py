@@ -0,0 +1,334 @@
+# src/history.py
+"""
+Append-only SQLite log of analyses, with aggregate queries and streaming export.
+
+Query or export the log from the command line:
+    python -m src.history totals --by day
+    python -m src.history export history.csv --since 2025-01-01
+"""
+
+import argparse
+import atexit
+import csv
+import json
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+from src.config import HISTORY_BATCH_SIZE, HISTORY_DB_PATH, HISTORY_FLUSH_SECONDS, HISTORY_MAX_BUFFERED_ROWS
+
+EXPORT_FETCH_ROWS = 1000  # Rows fetched per cursor round-trip while exporting
+ANONYMOUS_USER = "anonymous"
+logger = logging.getLogger(__name__)
+
+GROUP_COLUMNS = {"day": "day", "user": "user_id", "session": "session_id", "mode": "mode", "llm_size": "llm_size"}
+
+COLUMNS = (
+    "created_at", "day", "user_id", "session_id", "source", "mode", "llm_size",
+    "original_prompt", "optimized_prompt", "similarity_score",
+    "original_complexity", "optimized_complexity", "original_energy", "optimized_energy", "energy_saved",
+    "request_tokens", "cache_hit", "duration_ms", "stages_ms", "original_tokens", "optimized_tokens",
+)
+# Columns added after the first release, with their types; older logs gain them on open
+_ADDED_COLUMNS = {"original_tokens": "INTEGER", "optimized_tokens": "INTEGER"}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS analyses (
+    id INTEGER PRIMARY KEY,
+    created_at REAL NOT NULL,
+    day TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    session_id TEXT,
+    source TEXT NOT NULL,
+    mode TEXT NOT NULL,
+    llm_size TEXT NOT NULL,
+    original_prompt TEXT NOT NULL,
+    optimized_prompt TEXT NOT NULL,
+    similarity_score REAL,
+    original_complexity REAL,
+    optimized_complexity REAL,
+    original_energy REAL NOT NULL,
+    optimized_energy REAL NOT NULL,
+    energy_saved REAL NOT NULL,
+    request_tokens INTEGER,
+    cache_hit INTEGER,
+    duration_ms REAL,
+    stages_ms TEXT,
+    original_tokens INTEGER,
+    optimized_tokens INTEGER
+);
+CREATE INDEX IF NOT EXISTS analyses_user_day ON analyses (user_id, day);
+CREATE INDEX IF NOT EXISTS analyses_day ON analyses (day);
+CREATE INDEX IF NOT EXISTS analyses_session ON analyses (session_id, id);
+"""
+
+def _day(timestamp: float) -> str:
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime("%Y-%m-%d")
+
+def _where(user_id: str | None = None, session_id: str | None = None,
+           since: str | None = None, until: str | None = None) -> tuple[str, list]:
+    """Builds the WHERE clause shared by queries and exports; since/until are inclusive YYYY-MM-DD days."""
+    clauses, params = [], []
+    for clause, value in (("user_id = ?", user_id), ("session_id = ?", session_id), ("day >= ?", since), ("day <= ?", until)):
+        if value is not None:
+            clauses.append(clause)
+            params.append(value)
+    return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+class AnalysisHistory:
+    """
+    The analysis log in a SQLite file, safe to share between threads and processes.
+
+    record() only appends to an in-memory buffer; the buffer is written in one executemany
+    transaction when it reaches batch_size rows, by a background flusher every
+    flush_seconds, before any query and at interpreter exit. When a write fails (e.g. the
+    file is locked), its rows go back into the buffer for the next attempt, keeping at most
+    max_buffered rows; recording and queries log the failure instead of raising.
+    """
+
+    def __init__(self, path: str = HISTORY_DB_PATH, batch_size: int = HISTORY_BATCH_SIZE,
+                 flush_seconds: float = HISTORY_FLUSH_SECONDS, max_buffered: int = HISTORY_MAX_BUFFERED_ROWS):
+        self.path = path
+        self.batch_size = batch_size
+        self.max_buffered = max_buffered
+        self._local = threading.local()
+        self._buffer = []
+        self._buffer_lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = self._connection()
+        conn.executescript(_SCHEMA)
+        existing = {row["name"] for row in conn.execute("PRAGMA table_info(analyses)")}
+        for column, column_type in _ADDED_COLUMNS.items():
+            if column not in existing:
+                try:
+                    conn.execute(f"ALTER TABLE analyses ADD COLUMN {column} {column_type}")
+                except sqlite3.OperationalError:
+                    pass  # Another process added it first
+
+        self._stop = threading.Event()
+        if flush_seconds > 0:
+            threading.Thread(target=self._flush_loop, args=(flush_seconds,), name="history-flusher", daemon=True).start()
+        atexit.register(self.close)
+
+    def _connection(self) -> sqlite3.Connection:
+        # SQLite connections must not be shared across threads, so keep one per thread
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    # --- Writing ---
+
+    def record(self, result, user_id: str | None = None, session_id: str | None = None, source: str = "app",
+               duration_ms: float | None = None, stages_ms: dict | None = None, cache_hit: bool | None = None):
+        """
+        Buffers one analysis.
+
+        Args:
+            result: An engine AnalysisResult.
+            user_id: Who asked (ANONYMOUS_USER when unknown).
+            session_id: The app session or service connection the analysis belongs to.
+            source: Where the analysis ran ('app', 'service', ...).
+            duration_ms: End-to-end analysis time.
+            stages_ms: Per-stage timings from the request trace.
+            cache_hit: Whether the result came from the result cache.
+        """
+        created_at = time.time()
+        row = (
+            created_at, _day(created_at), user_id or ANONYMOUS_USER, session_id, source, result.mode, result.llm_size,
+            result.original_prompt, result.optimized_prompt, result.similarity_score,
+            result.original_complexity, result.optimized_complexity, result.original_energy, result.optimized_energy,
+            result.original_energy - result.optimized_energy, result.request_tokens,
+            None if cache_hit is None else int(cache_hit), duration_ms, json.dumps(stages_ms) if stages_ms else None,
+            result.original_tokens, result.optimized_tokens,
+        )
+        with self._buffer_lock:
+            self._buffer.append(row)
+            full = len(self._buffer) >= self.batch_size
+        if full:
+            self._try_flush()
+
+    def record_many(self, results: list, **kwargs):
+        """Buffers several analyses that share the same user, session and source."""
+        for result in results:
+            self.record(result, **kwargs)
+
+    def flush(self) -> int:
+        """
+        Writes buffered rows in one transaction and returns how many were written. On a
+        database error the rows are put back at the front of the buffer and the error is raised.
+        """
+        with self._buffer_lock:
+            rows, self._buffer = self._buffer, []
+        if not rows:
+            return 0
+        try:
+            with self._connection() as conn:
+                conn.executemany(
+                    f"INSERT INTO analyses ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})", rows
+                )
+        except sqlite3.Error:
+            with self._buffer_lock:
+                self._buffer[:0] = rows
+                dropped = len(self._buffer) - self.max_buffered
+                if dropped > 0:
+                    del self._buffer[:dropped]
+            if dropped > 0:
+                logger.error("History log %s: dropped the %d oldest unwritten rows", self.path, dropped)
+            raise
+        return len(rows)
+
+    def _try_flush(self) -> bool:
+        try:
+            self.flush()
+            return True
+        except sqlite3.Error as e:
+            logger.warning("History log %s: write failed, rows kept for retry: %s", self.path, e)
+            return False
+
+    def _flush_loop(self, flush_seconds: float):
+        while not self._stop.wait(flush_seconds):
+            try:
+                self._try_flush()
+            except Exception:
+                # The flusher must outlive any one failed write
+                logger.exception("History log %s: unexpected flush failure", self.path)
+
+    def close(self):
+        self._stop.set()
+        self._try_flush()
+
+    # --- Queries ---
+
+    def _query(self, sql: str, params: list) -> list[dict]:
+        # Reads must not fail a request: unwritten rows are simply not visible yet, and a
+        # failed query reads as an empty log
+        self._try_flush()
+        try:
+            return [dict(row) for row in self._connection().execute(sql, params)]
+        except sqlite3.Error as e:
+            logger.warning("History log %s: query failed: %s", self.path, e)
+            return []
+
+    def recent(self, session_id: str | None = None, user_id: str | None = None, limit: int = 20) -> list[dict]:
+        """The latest analyses (newest first), optionally for one session or user; [] if the log cannot be read."""
+        where, params = _where(user_id, session_id)
+        return self._query(f"SELECT * FROM analyses{where} ORDER BY id DESC LIMIT ?", [*params, limit])
+
+    def latest(self, session_id: str | None = None, user_id: str | None = None) -> dict | None:
+        rows = self.recent(session_id, user_id, limit=1)
+        return rows[0] if rows else None
+
+    def totals(self, by: str | None = None, user_id: str | None = None, session_id: str | None = None,
+               since: str | None = None, until: str | None = None) -> list[dict]:
+        """
+        Aggregate energy numbers computed inside SQLite.
+
+        Args:
+            by: Group by 'day', 'user', 'session', 'mode' or 'llm_size'; None for one overall row.
+            user_id, session_id, since, until: Optional filters (since/until are YYYY-MM-DD, inclusive).
+
+        Returns:
+            One dict per group with analyses, original_kwh, optimized_kwh, saved_kwh,
+            input_tokens and mean_duration_ms (plus the group key), ordered by the group key;
+            [] if the log cannot be read.
+        """
+        if by is not None and by not in GROUP_COLUMNS:
+            raise ValueError(f"Unknown grouping '{by}'. Expected one of {', '.join(GROUP_COLUMNS)}.")
+        where, params = _where(user_id, session_id, since, until)
+        key = f"{GROUP_COLUMNS[by]} AS {by}, " if by else ""
+        group = f" GROUP BY {GROUP_COLUMNS[by]} ORDER BY {GROUP_COLUMNS[by]}" if by else ""
+        return self._query(
+            f"SELECT {key}COUNT(*) AS analyses, COALESCE(SUM(original_energy), 0) AS original_kwh, "
+            f"COALESCE(SUM(optimized_energy), 0) AS optimized_kwh, COALESCE(SUM(energy_saved), 0) AS saved_kwh, "
+            f"COALESCE(SUM(original_tokens), 0) AS input_tokens, AVG(duration_ms) AS mean_duration_ms FROM analyses{where}{group}",
+            params,
+        )
+
+    def iter_rows(self, user_id: str | None = None, session_id: str | None = None,
+                  since: str | None = None, until: str | None = None, fetch_rows: int = EXPORT_FETCH_ROWS):
+        """Yields matching analyses oldest first, fetching fetch_rows at a time."""
+        self.flush()
+        where, params = _where(user_id, session_id, since, until)
+        # A dedicated connection keeps the read snapshot open without blocking this thread's other queries
+        conn = sqlite3.connect(self.path, timeout=5.0)
+        conn.row_factory = sqlite3.Row
+        try:
+            cursor = conn.execute(f"SELECT * FROM analyses{where} ORDER BY id", params)
+            while rows := cursor.fetchmany(fetch_rows):
+                for row in rows:
+                    yield dict(row)
+        finally:
+            conn.close()
+
+    def export(self, out, fmt: str = "csv", **filters) -> int:
+        """
+        Streams matching analyses to a text file object as CSV or JSON Lines.
+
+        Returns:
+            The number of rows written.
+        """
+        if fmt not in ("csv", "jsonl"):
+            raise ValueError(f"Unknown export format '{fmt}'. Expected 'csv' or 'jsonl'.")
+        writer = None
+        count = 0
+        for row in self.iter_rows(**filters):
+            if fmt == "jsonl":
+                out.write(json.dumps(row) + "\n")
+            else:
+                if writer is None:
+                    writer = csv.DictWriter(out, fieldnames=list(row))
+                    writer.writeheader()
+                writer.writerow(row)
+            count += 1
+        return count
+
+def open_history(path: str = HISTORY_DB_PATH) -> AnalysisHistory | None:
+    """Opens the history log configured in src/config.py, or None when HISTORY_DB_PATH is empty."""
+    return AnalysisHistory(path) if path else None
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", default=HISTORY_DB_PATH)
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    for name, help_text in (("totals", "Print aggregate energy numbers."), ("export", "Stream analyses to a file.")):
+        command = subcommands.add_parser(name, help=help_text)
+        command.add_argument("--user")
+        command.add_argument("--since", help="First day (YYYY-MM-DD, UTC).")
+        command.add_argument("--until", help="Last day (YYYY-MM-DD, UTC).")
+    subcommands.choices["totals"].add_argument("--by", choices=tuple(GROUP_COLUMNS))
+    subcommands.choices["export"].add_argument("out", help="Output path, or - for stdout.")
+    subcommands.choices["export"].add_argument("--format", choices=("csv", "jsonl"), default="csv")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        parser.error(f"No history log at {args.db}.")
+    history = AnalysisHistory(args.db, flush_seconds=0)
+    filters = {"user_id": args.user, "since": args.since, "until": args.until}
+    if args.command == "totals":
+        print(f"{args.by or '':<24} {'analyses':>9} {'original kWh':>13} {'optimized kWh':>14} {'saved kWh':>10} {'tokens':>10}")
+        for row in history.totals(args.by, **filters):
+            print(f"{str(row.get(args.by, 'all')):<24} {row['analyses']:>9} {row['original_kwh']:>13.4f} "
+                  f"{row['optimized_kwh']:>14.4f} {row['saved_kwh']:>10.4f} {row['input_tokens']:>10}")
+        return
+
+    out = sys.stdout if args.out == "-" else open(args.out, "w", newline="", encoding="utf-8")
+    try:
+        count = history.export(out, args.format, **filters)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    print(f"Exported {count} analyses.", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
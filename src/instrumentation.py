@@ -0,0 +1,271 @@
+# src/instrumentation.py
+"""
+Stage tracing, metrics export and optional profiling (PROFILE_MODE) for the analysis pipeline.
+"""
+
+import atexit
+import contextvars
+import cProfile
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+
+from src.config import (
+    INSTRUMENTATION_ENABLED,
+    INSTRUMENTATION_RECENT_TRACES,
+    PROFILE_DIR,
+    PROFILE_MODE,
+    PROFILE_SAMPLE_INTERVAL_MS,
+)
+
+logger = logging.getLogger(__name__)
+
+# Seconds; spans sub-millisecond index lookups up to multi-second Gemini round-trips
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# --- Metrics ---
+
+class Histogram:
+    """Thread-safe cumulative histogram with Prometheus-style upper bounds."""
+
+    def __init__(self, buckets: tuple = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # Last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        slot = next((i for i, bound in enumerate(self.buckets) if value <= bound), len(self.buckets))
+        with self._lock:
+            self.counts[slot] += 1
+            self.sum += value
+            self.count += 1
+
+    def snapshot(self) -> tuple[list, float, int]:
+        """A consistent (bucket counts, sum, count), copied under the lock."""
+        with self._lock:
+            return list(self.counts), self.sum, self.count
+
+    def quantile(self, q: float, snapshot: tuple | None = None) -> float:
+        """Approximate quantile: the upper bound of the bucket holding the q-th observation."""
+        counts, _, total = snapshot or self.snapshot()
+        if not total:
+            return 0.0
+        rank, seen = q * total, 0
+        for i, c in enumerate(counts):
+            seen += c
+            if seen >= rank:
+                return self.buckets[i] if i < len(self.buckets) else float("inf")
+        return float("inf")
+
+class Metrics:
+    """Registry of per-stage histograms, named counters and the most recent request traces."""
+
+    def __init__(self, recent_traces: int = INSTRUMENTATION_RECENT_TRACES):
+        self.stages = {}
+        self.counters = Counter()
+        self.recent = deque(maxlen=recent_traces)
+        self._lock = threading.Lock()
+
+    def observe_stage(self, name: str, seconds: float):
+        histogram = self.stages.get(name)
+        if histogram is None:
+            with self._lock:
+                histogram = self.stages.setdefault(name, Histogram())
+        histogram.observe(seconds)
+
+    def increment(self, name: str, amount: int = 1):
+        with self._lock:
+            self.counters[name] += amount
+
+    def recent_traces(self, limit: int | None = None) -> list[dict]:
+        traces = list(self.recent)
+        return traces[-limit:] if limit else traces
+
+    def reset(self):
+        with self._lock:
+            self.stages.clear()
+            self.counters.clear()
+            self.recent.clear()
+
+    def _snapshot(self) -> tuple[list, dict]:
+        # Stages and counters are copied under the lock, since other threads add to them while
+        # this iterates; each histogram is then read as one consistent snapshot
+        with self._lock:
+            stages, counters = sorted(self.stages.items()), dict(self.counters)
+        return [(name, h, h.snapshot()) for name, h in stages], counters
+
+    def to_json(self) -> dict:
+        stages, counters = self._snapshot()
+        summary = {}
+        for name, h, snapshot in stages:
+            _, total, count = snapshot
+            summary[name] = {
+                "count": count,
+                "total_ms": total * 1000,
+                "mean_ms": total / count * 1000 if count else 0.0,
+                "p50_ms": h.quantile(0.5, snapshot) * 1000,
+                "p99_ms": h.quantile(0.99, snapshot) * 1000,
+            }
+        return {"stages": summary, "counters": counters}
+
+    def to_prometheus(self, prefix: str = "prompt_optimizer") -> str:
+        stages, counters = self._snapshot()
+        lines = [
+            f"# HELP {prefix}_stage_seconds Time spent in each analysis pipeline stage.",
+            f"# TYPE {prefix}_stage_seconds histogram",
+        ]
+        for name, h, (counts, total, count) in stages:
+            cumulative = 0
+            for bound, c in zip(h.buckets + (float("inf"),), counts):
+                cumulative += c
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f'{prefix}_stage_seconds_bucket{{stage="{name}",le="{le}"}} {cumulative}')
+            lines.append(f'{prefix}_stage_seconds_sum{{stage="{name}"}} {total}')
+            lines.append(f'{prefix}_stage_seconds_count{{stage="{name}"}} {count}')
+        lines.append(f"# TYPE {prefix}_events_total counter")
+        for name, value in sorted(counters.items()):
+            lines.append(f'{prefix}_events_total{{event="{name}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+metrics = Metrics()
+
+# --- Tracing ---
+
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+
+@contextmanager
+def stage(name: str):
+    """Times one pipeline stage, recording it in the stage histogram and the current trace."""
+    if not INSTRUMENTATION_ENABLED:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        metrics.observe_stage(name, elapsed)
+        current = _current_trace.get()
+        if current is not None:
+            current["stages_ms"][name] = current["stages_ms"].get(name, 0.0) + elapsed * 1000
+
+@contextmanager
+def trace(name: str, **labels):
+    """
+    Traces one request. Stages timed inside it are collected into a record appended to
+    metrics.recent: {"name", "labels", "started_at", "total_ms", "stages_ms", "error"}.
+    Nested traces are folded into the outer one.
+    """
+    if not INSTRUMENTATION_ENABLED or _current_trace.get() is not None:
+        yield
+        return
+    record = {"name": name, "labels": labels, "started_at": time.time(), "stages_ms": {}, "error": None}
+    token = _current_trace.set(record)
+    profiler = _start_request_profile()
+    start = time.perf_counter()
+    try:
+        yield record
+    except Exception as e:
+        record["error"] = type(e).__name__
+        raise
+    finally:
+        record["total_ms"] = (time.perf_counter() - start) * 1000
+        _current_trace.reset(token)
+        metrics.observe_stage(name, record["total_ms"] / 1000)
+        metrics.increment(f"{name}_requests")
+        if record["error"]:
+            metrics.increment(f"{name}_errors")
+        metrics.recent.append(record)
+        _finish_request_profile(profiler, name)
+
+def annotate(**labels):
+    """Adds labels (e.g. cache_hit=True) to the current trace, if one is active."""
+    current = _current_trace.get()
+    if current is not None:
+        current["labels"].update(labels)
+
+# --- Profiling hooks ---
+
+def _start_request_profile():
+    if PROFILE_MODE != "cprofile":
+        return None
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # Another profiler is already active on this thread (e.g. a concurrent request)
+        return None
+    return profiler
+
+def _finish_request_profile(profiler, name: str):
+    if profiler is None:
+        return
+    profiler.disable()
+    try:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        profiler.dump_stats(os.path.join(PROFILE_DIR, f"{name}-{time.strftime('%Y%m%d-%H%M%S')}-{time.perf_counter_ns()}.prof"))
+    except OSError as e:
+        # A profiling problem must never fail the request being profiled
+        logger.warning("Could not write request profile: %s", e)
+
+class SamplingProfiler:
+    """
+    Low-overhead statistical profiler: a daemon thread snapshots every other thread's
+    Python stack at a fixed interval and counts identical stacks. collapsed() returns
+    the counts in the "frame;frame;frame count" format flame graph tools read.
+    """
+
+    def __init__(self, interval_ms: float = PROFILE_SAMPLE_INTERVAL_MS):
+        self.interval = interval_ms / 1000
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self) -> "SamplingProfiler":
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+            self._thread.start()
+        return self
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                self.samples[";".join(reversed(stack))] += 1
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def collapsed(self) -> str:
+        return "\n".join(f"{stack} {count}" for stack, count in self.samples.most_common())
+
+    def dump(self, path: str | None = None) -> str:
+        path = path or os.path.join(PROFILE_DIR, f"samples-{time.strftime('%Y%m%d-%H%M%S')}.collapsed")
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(self.collapsed() + "\n")
+        return path
+
+sampling_profiler = None
+if PROFILE_MODE == "sample":
+    sampling_profiler = SamplingProfiler().start()
+
+    @atexit.register
+    def _dump_samples():
+        sampling_profiler.stop()
+        sampling_profiler.dump()
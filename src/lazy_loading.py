@@ -0,0 +1,64 @@
+# src/lazy_loading.py
+
+import threading
+
+# --- Background initialisation ---
+
+class BackgroundLoader:
+    """
+    Runs an expensive factory (e.g. loading the embedding model) on a daemon thread.
+    get() blocks until the value is ready and re-raises the factory's exception, if any.
+    """
+
+    def __init__(self, factory, name: str = "background-loader"):
+        self._factory = factory
+        self._name = name
+        self._done = threading.Event()
+        self._start_lock = threading.Lock()
+        self._thread = None
+        self._value = None
+        self._error = None
+
+    def start(self) -> "BackgroundLoader":
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=self._name, daemon=True)
+                self._thread.start()
+        return self
+
+    def _run(self):
+        try:
+            self._value = self._factory()
+        except BaseException as e:
+            self._error = e
+        finally:
+            self._done.set()
+
+    @property
+    def ready(self) -> bool:
+        return self._done.is_set()
+
+    def get(self, timeout: float | None = None):
+        self.start()
+        if not self._done.wait(timeout):
+            raise TimeoutError(f"{self._name} did not finish within {timeout} seconds.")
+        if self._error is not None:
+            raise self._error
+        return self._value
+
+class WarmingProxy:
+    """
+    Forwards attribute access to the object a BackgroundLoader produces, waiting for it on
+    first use. Lets callers hold "the model" (e.g. inside a BatchEmbeddingService) while it
+    is still warming up.
+    """
+
+    def __init__(self, loader: BackgroundLoader):
+        self._loader = loader.start()
+
+    @property
+    def ready(self) -> bool:
+        return self._loader.ready
+
+    def __getattr__(self, attr: str):
+        return getattr(self._loader.get(), attr)
@@ -0,0 +1,107 @@
+# src/live_preview.py
+
+import re
+from collections import Counter
+from dataclasses import dataclass
+
+import numpy as np
+
+from src.config import LIVE_PREVIEW_CHUNK_CACHE_SIZE
+from src.optimization_logic import complexity_from_features, find_most_similar_example_prompt
+from src.result_cache import LRUCache
+
+# Chunks end at sentence punctuation or line breaks. Splits only ever consume whitespace,
+# which already separates words, so summing per-chunk word statistics gives exactly the
+# whole-prompt complexity features.
+_CHUNK_BOUNDARY = re.compile(r"(?<=[.!?])\s+|\s*\n\s*")
+_WORD_PATTERN = re.compile(r"\b\w+\b")
+
+def split_into_chunks(prompt: str) -> list[str]:
+    """Splits a prompt into sentence-level chunks (empty chunks dropped)."""
+    return [chunk for chunk in _CHUNK_BOUNDARY.split(prompt) if chunk]
+
+@dataclass
+class _Chunk:
+    embedding: np.ndarray  # L2-normalised
+    word_counts: Counter
+    total_word_length: int
+
+@dataclass
+class LivePreview:
+    """A fast local-mode estimate for the text being typed."""
+    prompt: str
+    complexity: float  # 0-100, identical to estimate_local_complexity
+    energy: float  # kWh
+    optimized_prompt: str
+    similarity_score: float  # 0-100, against the chunk-averaged embedding
+    llm_size: str
+    chunks_total: int
+    chunks_encoded: int  # Chunks that missed the cache and were embedded for this update
+
+class IncrementalAnalyzer:
+    """
+    Live-preview engine: re-analyses a prompt as it is edited, paying only for the delta.
+
+    Each sentence chunk's embedding and word statistics are cached by its text, so an edit
+    re-encodes just the chunks it touched. Complexity is rebuilt exactly from the cached
+    per-chunk word counts; the prompt embedding used for the nearest-example match is the
+    word-weighted mean of chunk embeddings, an approximation of the full-prompt embedding
+    that the "Analyze" button computes. The chunk cache is keyed by text only, so one
+    analyzer can be shared by every session.
+    """
+
+    def __init__(self, optimizer, max_cached_chunks: int = LIVE_PREVIEW_CHUNK_CACHE_SIZE):
+        self.optimizer = optimizer
+        self._chunks = LRUCache(max_entries=max_cached_chunks, ttl_seconds=float("inf"))
+
+    def _load_chunks(self, texts: list) -> tuple[list, int]:
+        chunks = [self._chunks.get(text) for text in texts]
+        missing = list(dict.fromkeys(text for text, chunk in zip(texts, chunks) if chunk is None))
+        if not missing:
+            return chunks, 0
+
+        embeddings = np.asarray(self.optimizer.embedding_model.encode(missing), dtype=np.float32)
+        embeddings /= np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+        encoded = {}
+        for text, embedding in zip(missing, embeddings):
+            words = _WORD_PATTERN.findall(text.lower())
+            encoded[text] = _Chunk(embedding, Counter(words), sum(map(len, words)))
+            self._chunks.set(text, encoded[text])
+        return [chunk or encoded[text] for text, chunk in zip(texts, chunks)], len(missing)
+
+    def preview(self, prompt: str, llm_size: str = "medium") -> LivePreview:
+        """
+        Returns the live estimate for `prompt`, reusing cached chunks from earlier calls.
+
+        Args:
+            prompt: The current text.
+            llm_size: The target LLM size ('small', 'medium', 'large').
+
+        Returns:
+            A LivePreview.
+        """
+        texts = split_into_chunks(prompt)
+        chunks, encoded = self._load_chunks(texts)
+
+        word_counts = Counter()
+        for chunk in chunks:
+            word_counts.update(chunk.word_counts)
+        num_words = sum(word_counts.values())
+        total_word_length = sum(chunk.total_word_length for chunk in chunks)
+        features = {
+            "num_words": np.array([num_words]),
+            "num_unique_words": np.array([len(word_counts)]),
+            "avg_word_length": np.array([total_word_length / num_words if num_words else 0.0]),
+        }
+        complexity = float(complexity_from_features(features)[0])
+        energy = float(self.optimizer.estimate_energies([prompt], [complexity], llm_size)[0])
+
+        optimized_prompt, similarity_score = "", 0.0
+        if num_words:
+            weights = np.array([max(1, sum(chunk.word_counts.values())) for chunk in chunks], dtype=np.float32)
+            embedding = weights @ np.stack([chunk.embedding for chunk in chunks])
+            example_prompts, example_index = self.optimizer.example_library
+            optimized_prompt, similarity_score = find_most_similar_example_prompt(embedding, example_index, example_prompts)
+
+        return LivePreview(prompt, complexity, energy, optimized_prompt, similarity_score, llm_size,
+                           chunks_total=len(texts), chunks_encoded=encoded)
@@ -0,0 +1,280 @@
+# src/long_documents.py
+"""
+Chunked, streaming analysis of long prompts and documents.
+
+Analyse a document from the command line:
+    python -m src.long_documents report.txt --llm-size medium
+"""
+
+import argparse
+import heapq
+import itertools
+import json
+import math
+import re
+import sys
+from dataclasses import asdict, dataclass, field
+
+import numpy as np
+
+from src.ann_index import normalise_rows
+from src.config import (
+    LLM_SIZE_MULTIPLIERS,
+    LONG_DOCUMENT_BATCH_CHUNKS,
+    LONG_DOCUMENT_CHUNK_WORDS,
+    LONG_DOCUMENT_OVERLAP_WORDS,
+    LONG_DOCUMENT_TOP_SECTIONS,
+)
+from src.instrumentation import stage, trace
+from src.optimization_logic import complexity_from_features, find_most_similar_example_prompt, local_complexity_features
+
+READ_CHARS = 1 << 16  # Characters read from a stream per block
+UNIQUE_WORDS_SATURATION = 30  # complexity_from_features scores at most this many distinct words
+_WORD = re.compile(r"\S+")
+_COMPLEXITY_WORD = re.compile(r"\b\w+\b")
+
+# --- Chunking ---
+
+@dataclass
+class TextChunk:
+    index: int
+    words: list  # The window's words; the first `overlap` repeat the previous chunk
+    overlap: int
+    start_char: int  # Offset of the first new word
+    end_char: int  # Offset just past the last word
+
+    @property
+    def text(self) -> str:
+        return " ".join(self.words)
+
+    @property
+    def new_text(self) -> str:
+        return " ".join(self.words[self.overlap:])
+
+def iter_words(source, read_chars: int = READ_CHARS):
+    """
+    Yields (offset, word) for every whitespace-separated word of a string, a text file
+    object (read in blocks) or an iterable of text blocks.
+    """
+    if isinstance(source, str):
+        for m in _WORD.finditer(source):
+            yield m.start(), m.group()
+        return
+    blocks = iter(lambda: source.read(read_chars), "") if hasattr(source, "read") else source
+    offset, carry = 0, ""
+    for block in blocks:
+        text = carry + block
+        # A word at the end of the block may continue in the next one
+        cut = len(text)
+        while cut and not text[cut - 1].isspace():
+            cut -= 1
+        if cut == 0 and len(text) > read_chars:
+            cut = len(text)  # One unbroken run longer than a block: let it through as a word
+        for m in _WORD.finditer(text, 0, cut):
+            yield offset + m.start(), m.group()
+        offset += cut
+        carry = text[cut:]
+    for m in _WORD.finditer(carry):
+        yield offset + m.start(), m.group()
+
+def iter_chunks(source, chunk_words: int = LONG_DOCUMENT_CHUNK_WORDS, overlap_words: int = LONG_DOCUMENT_OVERLAP_WORDS):
+    """
+    Yields overlapping TextChunks of chunk_words words; each repeats the last overlap_words
+    words of the previous one.
+
+    Args:
+        source: A string, a text file object or an iterable of text blocks.
+        chunk_words: Words per chunk.
+        overlap_words: Words shared with the previous chunk (less than chunk_words).
+    """
+    if not 0 <= overlap_words < chunk_words:
+        raise ValueError("overlap_words must be at least 0 and less than chunk_words.")
+    words, offsets, overlap, index = [], [], 0, 0
+    for offset, word in iter_words(source):
+        words.append(word)
+        offsets.append(offset)
+        if len(words) == chunk_words:
+            yield TextChunk(index, words, overlap, offsets[overlap], offset + len(word))
+            index += 1
+            keep = len(words) - overlap_words
+            words, offsets, overlap = words[keep:], offsets[keep:], overlap_words
+    if len(words) > overlap:
+        yield TextChunk(index, words, overlap, offsets[overlap], offsets[-1] + len(words[-1]))
+
+def count_chunks(text: str, chunk_words: int = LONG_DOCUMENT_CHUNK_WORDS,
+                 overlap_words: int = LONG_DOCUMENT_OVERLAP_WORDS) -> int:
+    """Roughly how many chunks iter_chunks() cuts a string into (at least 1); used to price a document up front."""
+    words = sum(1 for _ in _WORD.finditer(text))
+    return max(1, math.ceil(words / (chunk_words - overlap_words)))
+
+def _batched(iterable, size: int):
+    iterator = iter(iterable)
+    while batch := list(itertools.islice(iterator, size)):
+        yield batch
+
+def _weighted_embedding(chunks: list, model) -> np.ndarray:
+    # Each chunk counts for the words it adds beyond the overlap
+    weights = np.array([len(chunk.words) - chunk.overlap for chunk in chunks], dtype=np.float32)
+    return weights @ normalise_rows(np.asarray(model.encode([chunk.text for chunk in chunks]), dtype=np.float32))
+
+# --- Analysis ---
+
+@dataclass
+class SectionCost:
+    """One section (a chunk's new words) priced on its own."""
+    index: int
+    start_char: int
+    end_char: int
+    words: int
+    tokens: int
+    complexity: float  # 0-100
+    energy: float  # kWh
+    share_pct: float = 0.0  # Of the summed energy of all sections
+    preview: str = ""
+
+@dataclass
+class DocumentAnalysis:
+    """Aggregate numbers for a long document, with its costliest sections first."""
+    chars: int
+    words: int
+    tokens: int
+    chunks: int
+    complexity: float  # 0-100, identical to estimate_local_complexity on the whole text
+    energy: float  # kWh, from the complexity and token heuristic
+    llm_size: str
+    closest_example: str
+    similarity_score: float  # 0-100, against the chunk-averaged embedding
+    sections: list = field(default_factory=list)
+    # The chunk-averaged embedding, equal to embed_document(); pass it to PromptOptimizer.analyze()
+    # to analyse the same text without encoding it again
+    embedding: np.ndarray | None = field(default=None, repr=False)
+
+    def to_dict(self) -> dict:
+        data = asdict(self)
+        del data["embedding"]
+        return data
+
+def embed_document(source, model, chunk_words: int = LONG_DOCUMENT_CHUNK_WORDS,
+                   overlap_words: int = LONG_DOCUMENT_OVERLAP_WORDS,
+                   batch_chunks: int = LONG_DOCUMENT_BATCH_CHUNKS) -> np.ndarray:
+    """
+    Embeds text of any length as the new-word-weighted mean of its chunk embeddings.
+
+    Returns:
+        An L2-normalised float32 vector, like get_prompt_embedding.
+    """
+    total = None
+    for batch in _batched(iter_chunks(source, chunk_words, overlap_words), batch_chunks):
+        weighted = _weighted_embedding(batch, model)
+        total = weighted if total is None else total + weighted
+    if total is None:
+        return np.asarray(model.encode(""), dtype=np.float32)
+    return normalise_rows(total[None, :])[0]
+
+def analyze_document(optimizer, source, llm_size: str = "medium",
+                     chunk_words: int = LONG_DOCUMENT_CHUNK_WORDS,
+                     overlap_words: int = LONG_DOCUMENT_OVERLAP_WORDS,
+                     batch_chunks: int = LONG_DOCUMENT_BATCH_CHUNKS,
+                     top_sections: int = LONG_DOCUMENT_TOP_SECTIONS) -> DocumentAnalysis:
+    """
+    Streams a long document through the engine's model, tokenizer and energy estimate.
+
+    Args:
+        optimizer: The PromptOptimizer whose embedding model, example library, token counter
+            and energy estimates are used.
+        source: A string, a text file object or an iterable of text blocks.
+        llm_size: The target LLM size ('small', 'medium', 'large').
+        chunk_words, overlap_words: Chunk window and overlap, in words.
+        batch_chunks: Chunks encoded per call.
+        top_sections: How many of the costliest sections to report.
+
+    Returns:
+        A DocumentAnalysis. Sections are priced by optimizer.estimate_energies (the fitted
+        energy model when one is configured); the document total uses the complexity and
+        token heuristic, since a fitted model needs the whole text at once.
+    """
+    if llm_size not in LLM_SIZE_MULTIPLIERS:
+        raise ValueError(f"Unknown LLM size '{llm_size}'. Expected one of {sorted(LLM_SIZE_MULTIPLIERS)}.")
+    with trace("analyze_document", llm_size=llm_size):
+        embedding_sum, distinct_words = None, set()
+        num_words = total_word_length = tokens = chunks = section_energy = end_char = 0
+        costliest = []  # Min-heap of (energy, index, SectionCost)
+        for batch in _batched(iter_chunks(source, chunk_words, overlap_words), batch_chunks):
+            new_texts = [chunk.new_text for chunk in batch]
+            features = local_complexity_features(new_texts)
+            complexities = complexity_from_features(features)
+            with stage("tokens"):
+                counts = optimizer.token_counter.count_many(new_texts, memoise=False)
+            with stage("energy"):
+                energies = optimizer.estimate_energies(new_texts, complexities, llm_size, counts)
+            with stage("embedding"):
+                weighted = _weighted_embedding(batch, optimizer.embedding_model)
+            embedding_sum = weighted if embedding_sum is None else embedding_sum + weighted
+
+            num_words += int(features["num_words"].sum())
+            total_word_length += int(features["total_word_length"].sum())
+            tokens += int(counts.sum())
+            section_energy += float(energies.sum())
+            chunks += len(batch)
+            end_char = batch[-1].end_char
+            for chunk, text, words, complexity, count, energy in zip(batch, new_texts, features["num_words"], complexities, counts, energies):
+                if len(distinct_words) < UNIQUE_WORDS_SATURATION:
+                    distinct_words.update(_COMPLEXITY_WORD.findall(text.lower()))
+                section = SectionCost(chunk.index, chunk.start_char, chunk.end_char, int(words), int(count),
+                                      float(complexity), float(energy), preview=text[:120])
+                if len(costliest) < top_sections:
+                    heapq.heappush(costliest, (section.energy, section.index, section))
+                elif top_sections:
+                    heapq.heappushpop(costliest, (section.energy, section.index, section))
+
+        complexity = float(complexity_from_features({
+            "num_words": np.array([num_words]),
+            "num_unique_words": np.array([min(len(distinct_words), UNIQUE_WORDS_SATURATION)]),
+            "avg_word_length": np.array([total_word_length / num_words if num_words else 0.0]),
+        })[0])
+        closest_example, similarity_score, embedding = "", 0.0, None
+        if embedding_sum is not None:
+            embedding = normalise_rows(embedding_sum[None, :])[0]
+            example_prompts, example_index = optimizer.example_library
+            with stage("similarity_search"):
+                closest_example, similarity_score = find_most_similar_example_prompt(embedding, example_index, example_prompts)
+
+        sections = [section for _, _, section in sorted(costliest, key=lambda item: (-item[0], item[1]))]
+        for section in sections:
+            section.share_pct = section.energy / section_energy * 100 if section_energy else 0.0
+        return DocumentAnalysis(
+            chars=end_char, words=num_words, tokens=tokens, chunks=chunks, complexity=complexity,
+            energy=float(optimizer.estimate_energy(complexity, llm_size, tokens)), llm_size=llm_size,
+            closest_example=closest_example, similarity_score=float(similarity_score), sections=sections,
+            embedding=embedding,
+        )
+
+def main():
+    from src.engine import PromptOptimizer
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("path", help="Text file to analyse, or - for stdin.")
+    parser.add_argument("--llm-size", choices=list(LLM_SIZE_MULTIPLIERS), default="medium")
+    parser.add_argument("--top-sections", type=int, default=LONG_DOCUMENT_TOP_SECTIONS)
+    parser.add_argument("--json", action="store_true", help="Print the analysis as JSON.")
+    args = parser.parse_args()
+
+    optimizer = PromptOptimizer.from_config()
+    source = sys.stdin if args.path == "-" else open(args.path, encoding="utf-8")
+    try:
+        analysis = analyze_document(optimizer, source, args.llm_size, top_sections=args.top_sections)
+    finally:
+        if source is not sys.stdin:
+            source.close()
+    if args.json:
+        print(json.dumps(analysis.to_dict(), indent=2))
+        return
+    print(f"{analysis.chars:,} chars, {analysis.words:,} words, {analysis.tokens:,} tokens in {analysis.chunks} chunks")
+    print(f"Complexity {analysis.complexity:.1f}, estimated energy {analysis.energy:.4f} kWh ({analysis.llm_size} LLM)")
+    print(f"Closest example ({analysis.similarity_score:.0f}%): {analysis.closest_example}")
+    print(f"\n{'section':>8} {'chars':>17} {'tokens':>7} {'kWh':>8} {'share':>7}  preview")
+    for s in analysis.sections:
+        print(f"{s.index:>8} {f'{s.start_char}-{s.end_char}':>17} {s.tokens:>7} {s.energy:>8.4f} {s.share_pct:>6.1f}%  {s.preview[:60]}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,309 @@
+# src/near_duplicates.py
+"""
+Near-duplicate prompt detection with MinHash (text) and SimHash (embedding) LSH signatures.
+"""
+
+import functools
+import hashlib
+import itertools
+import re
+import threading
+from collections import OrderedDict, defaultdict
+
+import numpy as np
+
+from src.ann_index import _GrowableMatrix, normalise_rows
+from src.config import (
+    NEAR_DUPLICATE_ENABLED,
+    NEAR_DUPLICATE_MAX_ENTRIES,
+    NEAR_DUPLICATE_MIN_COSINE,
+    NEAR_DUPLICATE_MIN_JACCARD,
+)
+from src.result_cache import normalise_prompt
+
+MINHASH_SIZE = 64
+MINHASH_BANDS = 16  # 4 hashes (two uint64 words) per band: a pair with Jaccard 0.8 shares a band with probability > 0.999
+SIMHASH_BITS = 64
+SIMHASH_BANDS = 8  # 8 bits per band: cosine 0.95 pairs share a band with probability ~0.99
+DEDUP_PASSES_PER_BAND = 16  # Each pass re-pairs what the last left unmatched; later passes gain little
+SIGNATURE_CHUNK = 2048  # Prompts hashed per vectorised pass
+SIGNATURE_BLOCK = 1 << 15  # Shingles multiplied at once; bounds the (shingles, 64) uint64 temporary at 16 MB
+
+_WORD = re.compile(r"\w+")
+# Numbers, quoted or code spans, and negations: the details a generated rewrite repeats verbatim
+_SPECIFIC = re.compile(
+    r"\d+(?:[.,:/]\d+)*|\"[^\"]*\"|`[^`]*`|\b(?:zero|one|two|three|four|five|six|seven|eight|nine|ten|eleven|twelve"
+    r"|twenty|hundred|thousand|million|first|second|third|half|not|no|never|without|\w+n't)\b",
+    re.IGNORECASE,
+)
+# Modes whose output rewrites the prompt itself ("gemini"): only prompts with the same specifics
+# share results, so "3 bullets" never gets the rewrite of "5 bullets"
+EXACT_SPECIFICS_MODES = ("gemini",)
+_rng = np.random.default_rng(0x5EED)
+# Multiply-shift hash family: h_i(x) = high 32 bits of (a_i * x) mod 2^64, with odd a_i
+_MINHASH_A = _rng.integers(1, 2**63, MINHASH_SIZE, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+
+# --- Signatures ---
+
+@functools.lru_cache(maxsize=1 << 18)
+def _feature_hash(feature: str) -> int:
+    return int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "little")
+
+def shingles(prompt: str) -> list[str]:
+    """The words and adjacent word pairs of the normalised prompt (the text itself if it has no words)."""
+    text = normalise_prompt(prompt)
+    words = _WORD.findall(text)
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])] or [text]
+
+def specifics(prompt: str) -> tuple:
+    """The prompt's numbers, quoted text and negations, in order (case-folded)."""
+    return tuple(match.casefold() for match in _SPECIFIC.findall(prompt))
+
+def minhash_signatures(prompts: list) -> np.ndarray:
+    """Returns a (len(prompts), MINHASH_SIZE) uint32 MinHash matrix, one row per prompt."""
+    rows = []
+    for start in range(0, len(prompts), SIGNATURE_CHUNK):
+        features = [shingles(p) for p in prompts[start:start + SIGNATURE_CHUNK]]
+        counts = np.fromiter((len(f) for f in features), dtype=np.int64, count=len(features))
+        hashes = np.fromiter((_feature_hash(s) for f in features for s in f), dtype=np.uint64, count=int(counts.sum()))
+        offsets = np.concatenate(([0], np.cumsum(counts)))
+        minima = np.empty((len(features), MINHASH_SIZE), dtype=np.uint64)
+        first = 0
+        while first < len(features):
+            # The prompts whose shingles fit in one block; a longer prompt is hashed block by block
+            end = int(np.searchsorted(offsets, offsets[first] + SIGNATURE_BLOCK, side="right")) - 1
+            if end <= first:
+                minima[first] = np.iinfo(np.uint64).max
+                for block in range(offsets[first], offsets[first + 1], SIGNATURE_BLOCK):
+                    block_hashes = hashes[block:min(block + SIGNATURE_BLOCK, offsets[first + 1])]
+                    np.minimum(minima[first], (block_hashes[:, None] * _MINHASH_A).min(axis=0), out=minima[first])
+                first += 1
+                continue
+            products = hashes[offsets[first]:offsets[end], None] * _MINHASH_A
+            minima[first:end] = np.minimum.reduceat(products, offsets[first:end] - offsets[first], axis=0)
+            first = end
+        # Taking the high bits is monotone, so it can follow the minimum (on far fewer values)
+        rows.append((minima >> np.uint64(32)).astype(np.uint32))
+    return np.concatenate(rows) if rows else np.empty((0, MINHASH_SIZE), dtype=np.uint32)
+
+def minhash_similarity(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Estimated Jaccard similarity: the fraction of agreeing MinHash values (row-wise)."""
+    return (a == b).mean(axis=-1)
+
+def minhash_bands(signatures: np.ndarray) -> np.ndarray:
+    """Folds each 4-hash band of an (n, 4 * bands) signature matrix into one uint64 key: (n, bands)."""
+    words = np.ascontiguousarray(signatures).view(np.uint64).reshape(signatures.shape[0], -1, 2)
+    return words[:, :, 0] * np.uint64(0x9E3779B97F4A7C15) ^ words[:, :, 1]
+
+class EmbeddingSimHash:
+    """Random-hyperplane SimHash: bit i is the side of hyperplane i the embedding falls on."""
+
+    def __init__(self, dim: int, bits: int = SIMHASH_BITS, seed: int = 0):
+        self.planes = np.random.default_rng(seed).standard_normal((bits, dim)).astype(np.float32)
+
+    def bands(self, embedding: np.ndarray) -> np.ndarray:
+        """The signature split into SIMHASH_BANDS one-byte band keys."""
+        return np.packbits(self.planes @ embedding > 0)
+
+# --- LSH index ---
+
+class LSHIndex:
+    """
+    Banded LSH buckets: an entry is a candidate for a query when at least one band key
+    matches. Candidates are unverified; callers confirm them with the real similarity.
+    """
+
+    def __init__(self, n_bands: int):
+        self._buckets = [defaultdict(set) for _ in range(n_bands)]
+        self._keys = {}
+
+    def add(self, entry_id: int, band_keys):
+        keys = [int(k) for k in band_keys]
+        self._keys[entry_id] = keys
+        for bucket, key in zip(self._buckets, keys):
+            bucket[key].add(entry_id)
+
+    def remove(self, entry_id: int):
+        for bucket, key in zip(self._buckets, self._keys.pop(entry_id, ())):
+            members = bucket[key]
+            members.discard(entry_id)
+            if not members:
+                del bucket[key]
+
+    def candidates(self, band_keys) -> set:
+        found = set()
+        for bucket, key in zip(self._buckets, band_keys):
+            found.update(bucket.get(int(key), ()))
+        return found
+
+    def clear(self):
+        for bucket in self._buckets:
+            bucket.clear()
+        self._keys.clear()
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+# --- Online reuse ---
+
+class NearDuplicateCache:
+    """
+    Bounded store of recent analysis results, looked up by near-duplicate prompt.
+
+    Results are partitioned by (mode, llm_size), like ResultCache keys, and in
+    EXACT_SPECIFICS_MODES also by the prompt's specifics(). find_text() matches on MinHash
+    similarity >= min_jaccard; find_embedding() matches on cosine >= min_cosine and only sees
+    entries added with their embedding. The oldest entries are evicted first. Call clear()
+    when the example library changes.
+    """
+
+    def __init__(self, max_entries: int = NEAR_DUPLICATE_MAX_ENTRIES, min_jaccard: float = NEAR_DUPLICATE_MIN_JACCARD,
+                 min_cosine: float = NEAR_DUPLICATE_MIN_COSINE):
+        self.max_entries = max_entries
+        self.min_jaccard = min_jaccard
+        self.min_cosine = min_cosine
+        self._entries = OrderedDict()  # id -> (partition, minhash, embedding or None, value)
+        self._text_index = LSHIndex(MINHASH_BANDS)
+        self._embedding_index = LSHIndex(SIMHASH_BANDS)
+        self._simhash = None
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+        self.metrics = {"text_hits": 0, "embedding_hits": 0, "misses": 0, "stores": 0}
+
+    @staticmethod
+    def _partition(prompt: str, llm_size: str, mode: str) -> tuple:
+        return (mode, llm_size, specifics(prompt) if mode in EXACT_SPECIFICS_MODES else None)
+
+    def _best(self, candidates: set, partition: tuple, similarity) -> tuple | None:
+        best = None
+        for entry_id in candidates:
+            entry = self._entries[entry_id]
+            if entry[0] != partition:
+                continue
+            score = similarity(entry)
+            if score is not None and (best is None or score > best[1]):
+                best = (entry[3], score)
+        return best
+
+    def find_text(self, prompt: str, llm_size: str, mode: str) -> tuple[dict, float] | None:
+        """Returns (stored value, estimated Jaccard similarity) of the closest near-duplicate, or None."""
+        signature = minhash_signatures([prompt])[0]
+        with self._lock:
+            best = self._best(self._text_index.candidates(minhash_bands(signature[None])[0]),
+                              self._partition(prompt, llm_size, mode),
+                              lambda entry: float(minhash_similarity(entry[1], signature)))
+            return self._hit(best, self.min_jaccard, "text_hits")
+
+    def find_embedding(self, prompt: str, embedding: np.ndarray, llm_size: str, mode: str) -> tuple[dict, float] | None:
+        """Returns (stored value, cosine similarity) of the closest near-duplicate embedding, or None."""
+        embedding = normalise_rows(embedding)[0]
+        with self._lock:
+            if self._simhash is None:
+                return self._hit(None, self.min_cosine, "embedding_hits")
+            best = self._best(self._embedding_index.candidates(self._simhash.bands(embedding)),
+                              self._partition(prompt, llm_size, mode),
+                              lambda entry: float(entry[2] @ embedding) if entry[2] is not None else None)
+            return self._hit(best, self.min_cosine, "embedding_hits")
+
+    def _hit(self, best, threshold: float, metric: str):
+        if best is None or best[1] < threshold:
+            self.metrics["misses"] += 1
+            return None
+        self.metrics[metric] += 1
+        return best
+
+    def add(self, prompt: str, llm_size: str, mode: str, value: dict, embedding: np.ndarray | None = None):
+        signature = minhash_signatures([prompt])[0]
+        if embedding is not None:
+            embedding = normalise_rows(embedding)[0]
+        with self._lock:
+            entry_id = next(self._ids)
+            self._entries[entry_id] = (self._partition(prompt, llm_size, mode), signature, embedding, value)
+            self._text_index.add(entry_id, minhash_bands(signature[None])[0])
+            if embedding is not None:
+                if self._simhash is None:
+                    self._simhash = EmbeddingSimHash(embedding.shape[0])
+                self._embedding_index.add(entry_id, self._simhash.bands(embedding))
+            while len(self._entries) > self.max_entries:
+                evicted, _ = self._entries.popitem(last=False)
+                self._text_index.remove(evicted)
+                self._embedding_index.remove(evicted)
+            self.metrics["stores"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._text_index.clear()
+            self._embedding_index.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self.metrics, entries=len(self._entries))
+        lookups = stats["text_hits"] + stats["embedding_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["text_hits"] + stats["embedding_hits"]) / lookups if lookups else 0.0
+        return stats
+
+def build_near_duplicate_cache() -> NearDuplicateCache | None:
+    """Creates the near-duplicate cache configured in src/config.py, or None when it is disabled."""
+    return NearDuplicateCache() if NEAR_DUPLICATE_ENABLED else None
+
+# --- Bulk deduplication ---
+
+def _blockwise_similarity(signatures: np.ndarray, a: np.ndarray, b: np.ndarray, block: int = 65536) -> np.ndarray:
+    similarities = np.empty(len(a), dtype=np.float32)
+    for start in range(0, len(a), block):
+        similarities[start:start + block] = minhash_similarity(signatures[a[start:start + block]], signatures[b[start:start + block]])
+    return similarities
+
+def cluster_near_duplicates(prompts, min_jaccard: float = NEAR_DUPLICATE_MIN_JACCARD) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Groups a corpus into clusters of near-duplicate prompts.
+
+    Every prompt is MinHashed, and prompts sharing an LSH band key are checked against the
+    representative of the first prompt holding that key (and, over a few passes, unmatched
+    prompts against the first of the rest). A prompt joins that cluster only when its own
+    estimated Jaccard similarity to the representative reaches min_jaccard, so clusters never
+    chain through intermediate prompts; a prompt that already represents others stays a
+    representative. Each cluster is represented by its earliest prompt, so the first
+    occurrence of each prompt family is the one that gets analysed. About 1M prompts per
+    minute, with ~400 bytes of memory per prompt.
+
+    Args:
+        prompts: Any iterable of prompt strings (consumed once, in chunks).
+        min_jaccard: The estimated Jaccard similarity at which two prompts are merged.
+
+    Returns:
+        (representatives, similarities): for each prompt, the position of its cluster's
+        representative, and its estimated Jaccard similarity to that representative.
+    """
+    signatures = _GrowableMatrix(MINHASH_SIZE, capacity=SIGNATURE_CHUNK, dtype=np.uint32)
+    prompts = iter(prompts)
+    for chunk in iter(lambda: list(itertools.islice(prompts, SIGNATURE_CHUNK)), []):
+        signatures.append(minhash_signatures(chunk))
+    signatures = signatures.view
+    n = signatures.shape[0]
+
+    representatives = np.arange(n)
+    has_members = np.zeros(n, dtype=bool)
+    rows_per_band = MINHASH_SIZE // MINHASH_BANDS
+    for band in range(MINHASH_BANDS):
+        keys = minhash_bands(signatures[:, band * rows_per_band:(band + 1) * rows_per_band])[:, 0]
+        order = np.argsort(keys, kind="stable")
+        # Check each prompt against the representative of the first one sharing its band key;
+        # prompts that fail are re-checked against the first of the remaining ones, for a few
+        # passes per band. The first of a run is its earliest prompt and representatives precede
+        # their members, so clusters stay represented by their earliest prompt. Only unassigned
+        # prompts without members of their own can join a cluster
+        for _ in range(DEDUP_PASSES_PER_BAND):
+            if len(order) < 2:
+                break
+            sorted_keys = keys[order]
+            run_starts = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+            candidates = representatives[order[np.repeat(run_starts, np.diff(np.r_[run_starts, len(order)]))]]
+            pending = (candidates != order) & (representatives[order] == order) & ~has_members[order]
+            a, b = candidates[pending], order[pending]
+            keep = _blockwise_similarity(signatures, a, b) >= min_jaccard
+            representatives[b[keep]] = a[keep]
+            has_members[a[keep]] = True
+            order = b[~keep]
+    return representatives, _blockwise_similarity(signatures, np.arange(n), representatives)
@@ -1,49 +1,100 @@
 # src/optimization_logic.py
 
-import streamlit as st
 import numpy as np
-from sentence_transformers import SentenceTransformer
-from scipy.spatial.distance import cosine
 import re
-import json
-import google.generativeai as genai
-
-from src.config import API_KEY # Import API_KEY from config
-
-# --- Model Initialization ---
-@st.cache_resource(show_spinner="Loading AI model for embeddings...")
-def load_embedding_model():
-    """Caches and loads the SentenceTransformer model."""
-    return SentenceTransformer('all-MiniLM-L6-v2')
-
-# Configure Gemini model for content generation with structured output
-genai.configure(api_key=API_KEY)
-gemini_model = genai.GenerativeModel(
-    'gemini-2.5-flash-preview-05-20',
-    generation_config={
-        "response_mime_type": "application/json",
-        "response_schema": {
-            "type": "OBJECT",
-            "properties": {
-                "generatedOptimizedPrompt": {"type": "STRING"},
-                "similarityScore": {"type": "NUMBER"},
-                "originalPromptComplexity": {"type": "NUMBER"},
-                "optimizedPromptComplexity": {"type": "NUMBER"}
-            },
-        }
-    }
-)
+from collections import defaultdict
+from itertools import count
+from typing import TYPE_CHECKING
+
+from src.config import BASE_ENERGY_PER_COMPLEXITY, ENERGY_PER_INPUT_TOKEN, GEMINI_FEW_SHOT_K, LLM_SIZE_MULTIPLIERS
+from src.ann_index import exact_top_k, normalise_rows
+from src.gemini_client import get_gemini_client
+
+if TYPE_CHECKING:
+    from sentence_transformers import SentenceTransformer
 
 # --- Core Logic Functions ---
 
-def get_prompt_embedding(prompt: str, model: SentenceTransformer) -> np.ndarray:
+def get_prompt_embedding(prompt: str, model: "SentenceTransformer") -> np.ndarray:
     """
     Generates a dense vector embedding for a given prompt using the pre-trained local model.
+    Passing a BatchEmbeddingService instead of the raw model coalesces concurrent requests.
     """
     return model.encode(prompt)
 
+def get_prompt_embeddings(prompts: list, model: "SentenceTransformer") -> np.ndarray:
+    """
+    Generates embeddings for many prompts in one batched call (one row per prompt).
+    """
+    if not prompts:
+        return np.empty((0, 0), dtype=np.float32)
+    return np.asarray(model.encode(list(prompts)))
+
+def build_example_embedding_matrix(example_embeddings) -> np.ndarray:
+    """
+    Packs example embeddings into one contiguous, L2-normalised float32 matrix.
+
+    Args:
+        example_embeddings: Either a (N, D) array whose rows follow the example prompt list,
+            or the legacy dictionary keyed "example_1", "example_2", etc.
+
+    Returns:
+        A C-contiguous float32 matrix of shape (N, D) with unit-length rows, so cosine
+        similarity against a normalised query is a single matrix-vector product.
+    """
+    if isinstance(example_embeddings, dict):
+        # Legacy layout: parse the positional keys once instead of on every lookup
+        ordered = sorted(example_embeddings.items(), key=lambda item: int(item[0].split('_')[1]))
+        matrix = np.vstack([embedding for _, embedding in ordered]) if ordered else np.empty((0, 0))
+    else:
+        matrix = np.asarray(example_embeddings)
+
+    if matrix.ndim != 2:
+        raise ValueError(f"Expected a 2-D embedding matrix, got shape {matrix.shape}.")
+    return normalise_rows(matrix)
+
+def find_top_k_similar_example_prompts(user_embedding: np.ndarray,
+                                       example_store,
+                                       example_prompts_list: list,
+                                       k: int = 5) -> list[tuple[str, float]]:
+    """
+    Finds the k most similar example prompts.
+
+    Args:
+        user_embedding: The vector embedding of the user's input prompt.
+        example_store: Either the normalised matrix from build_example_embedding_matrix (exact
+            scan: one matrix-vector product plus an argpartition) or an index from
+            src.ann_index exposing search(query, k).
+        example_prompts_list: The list of example optimized prompt strings (row-aligned with the store).
+        k: The number of matches to return.
+
+    Returns:
+        A list of (prompt text, cosine similarity score 0-100) tuples, best match first.
+    """
+    if isinstance(example_store, np.ndarray):
+        ids, scores = exact_top_k(example_store, normalise_rows(user_embedding)[0], k)
+    else:
+        ids, scores = example_store.search(user_embedding, k)
+
+    return [(example_prompts_list[i], float(score) * 100) for i, score in zip(ids, scores)]
+
+def select_few_shot_examples(user_embedding: np.ndarray,
+                             example_store,
+                             example_prompts_list: list,
+                             k: int = GEMINI_FEW_SHOT_K) -> list[str]:
+    """
+    Picks the example prompts sent to Gemini as few-shot guidance: the k nearest library
+    entries to the user's prompt, or the whole library when k is 0.
+
+    Returns:
+        A list of example prompt strings, most relevant first.
+    """
+    if k <= 0 or k >= len(example_prompts_list):
+        return list(example_prompts_list)
+    return [text for text, _ in find_top_k_similar_example_prompts(user_embedding, example_store, example_prompts_list, k)]
+
 def find_most_similar_example_prompt(user_embedding: np.ndarray, 
-                                     example_embeddings: dict, 
+                                     example_embeddings, 
                                      example_prompts_list: list) -> tuple[str, float]:
     """
     Finds the most semantically similar example prompt from the database using cosine similarity.
@@ -51,26 +102,20 @@ def find_most_similar_example_prompt(user_embedding: np.ndarray,
     
     Args:
         user_embedding: The vector embedding of the user's input prompt.
-        example_embeddings: A dictionary of pre-computed embeddings for example optimized prompts.
+        example_embeddings: A nearest-neighbour index from src.ann_index, the normalised example
+            matrix from build_example_embedding_matrix, or the legacy dictionary of
+            pre-computed embeddings (normalised on every call).
         example_prompts_list: The list of example optimized prompt strings.
         
     Returns:
         A tuple containing the most similar example prompt text and its cosine similarity score (0-100).
     """
-    most_similar_prompt = ""
-    highest_similarity = -1.0
-    
-    # Iterate through the dictionary of pre-computed embeddings
-    for key, example_embedding in example_embeddings.items():
-        similarity = 1 - cosine(user_embedding, example_embedding)
-        if similarity > highest_similarity:
-            highest_similarity = similarity
-            # Retrieve the prompt string using its index or key from the original list/dict
-            # Assuming keys are like "example_1", "example_2"
-            prompt_index = int(key.split('_')[1]) - 1
-            most_similar_prompt = example_prompts_list[prompt_index]
-            
-    return most_similar_prompt, highest_similarity * 100 # Convert to 0-100 scale
+    if isinstance(example_embeddings, dict):
+        example_embeddings = build_example_embedding_matrix(example_embeddings)
+    matches = find_top_k_similar_example_prompts(user_embedding, example_embeddings, example_prompts_list, k=1)
+    if not matches:
+        return "", -100.0
+    return matches[0]
 
 def estimate_local_complexity(prompt: str) -> float:
     """
@@ -100,40 +145,142 @@ def estimate_local_complexity(prompt: str) -> float:
     
     return max(0.0, min(100.0, complexity))
 
+# Prompts are joined with " \x00 " for one-pass tokenisation. Spaces and NUL are neither word
+# characters nor case-ignorable, so they split words and lower-case context exactly like a
+# prompt boundary, and the NUL token marks where the next prompt starts.
+_BATCH_SEPARATOR = "\x00"
+_BATCH_TOKEN_PATTERN = re.compile(r'\b\w+\b|\x00')
+# ASCII fast path: bytes.translate maps every non-word byte except NUL to a space, so a plain
+# split() yields the same tokens as _BATCH_TOKEN_PATTERN
+_ASCII_WORD_TABLE = bytes(b if chr(b).isalnum() or b in (0, ord("_")) else ord(" ") for b in range(256))
+
+def _tokenise_batch(prompts: list) -> tuple[list, object]:
+    text = f" {_BATCH_SEPARATOR} ".join(p.replace(_BATCH_SEPARATOR, " ") for p in prompts).lower()
+    if text.isascii():
+        return text.encode("ascii").translate(_ASCII_WORD_TABLE).split(), _BATCH_SEPARATOR.encode("ascii")
+    return _BATCH_TOKEN_PATTERN.findall(text), _BATCH_SEPARATOR
+
+def local_complexity_features(prompts: list) -> dict[str, np.ndarray]:
+    """
+    Computes the features behind estimate_local_complexity for many prompts at once.
+
+    All prompts are lower-cased and tokenised in one pass over the joined text; the features
+    are then counted with NumPy.
+
+    Args:
+        prompts: The raw prompt strings.
+
+    Returns:
+        A dict of arrays with one entry per prompt: num_words, num_unique_words,
+        total_word_length (characters in words) and avg_word_length (0 for prompts without words).
+    """
+    num_prompts = len(prompts)
+    tokens, separator = _tokenise_batch(prompts) if num_prompts else ([], _BATCH_SEPARATOR)
+    vocabulary = defaultdict(count().__next__)
+    token_ids = np.fromiter(map(vocabulary.__getitem__, tokens), dtype=np.int64, count=len(tokens))
+    word_lengths = np.fromiter(map(len, vocabulary), dtype=np.int64, count=len(vocabulary))
+
+    # Every separator token starts the next prompt
+    is_separator = token_ids == vocabulary.get(separator, -1)
+    prompt_ids = np.cumsum(is_separator)[~is_separator]
+    token_ids = token_ids[~is_separator]
+
+    num_words = np.bincount(prompt_ids, minlength=num_prompts)
+    total_length = np.bincount(prompt_ids, weights=word_lengths[token_ids], minlength=num_prompts)
+    # Unique (prompt, word) pairs give each prompt's vocabulary size: sort the pair keys and
+    # count the first occurrence of each
+    pairs = np.sort(prompt_ids * len(vocabulary) + token_ids)
+    first_occurrence = np.ones(len(pairs), dtype=bool)
+    np.not_equal(pairs[1:], pairs[:-1], out=first_occurrence[1:])
+    num_unique_words = np.bincount(pairs[first_occurrence] // len(vocabulary), minlength=num_prompts)
+
+    return {
+        "num_words": num_words,
+        "num_unique_words": num_unique_words,
+        "total_word_length": total_length,
+        "avg_word_length": np.divide(total_length, num_words, out=np.zeros(num_prompts), where=num_words > 0),
+    }
+
+def complexity_from_features(features: dict[str, np.ndarray]) -> np.ndarray:
+    """Combines local_complexity_features output into 0-100 complexity scores."""
+    length_score = np.minimum(features["num_words"] / 50, 1.0)
+    unique_word_score = np.minimum(features["num_unique_words"] / 30, 1.0)
+    avg_word_length_score = np.minimum(features["avg_word_length"] / 8, 1.0)
+
+    complexity = (length_score * 0.4 + unique_word_score * 0.3 + avg_word_length_score * 0.3) * 100
+    return np.where(features["num_words"] > 0, np.clip(complexity, 0.0, 100.0), 0.0)
+
+def estimate_local_complexity_batch(prompts: list) -> np.ndarray:
+    """
+    Vectorized estimate_local_complexity for many prompts, with identical scores.
+    
+    Args:
+        prompts: The raw prompt strings.
+        
+    Returns:
+        A float64 array of complexity scores between 0 and 100, one per prompt.
+    """
+    return complexity_from_features(local_complexity_features(prompts))
+
+def estimate_energy(complexity: float, llm_size: str,
+                    base_energy: float = BASE_ENERGY_PER_COMPLEXITY,
+                    size_multipliers: dict = LLM_SIZE_MULTIPLIERS,
+                    input_tokens=0,
+                    energy_per_token: float = ENERGY_PER_INPUT_TOKEN) -> float:
+    """
+    Calculates the mock energy estimate (kWh) for a prompt of the given complexity.
+    
+    Args:
+        complexity: A complexity score between 0 and 100.
+        llm_size: One of the size_multipliers keys ('small', 'medium', 'large').
+        base_energy: kWh per unit of complexity (defaults to BASE_ENERGY_PER_COMPLEXITY).
+        size_multipliers: Per-size energy multipliers (defaults to LLM_SIZE_MULTIPLIERS).
+        input_tokens: The prompt's input token count (see src/token_accounting.py).
+        energy_per_token: kWh per input token (defaults to ENERGY_PER_INPUT_TOKEN).
+        
+    Returns:
+        The estimated energy in kWh.
+    """
+    return ((complexity / 100) * base_energy + input_tokens * energy_per_token) * size_multipliers[llm_size]
+
 def perform_gemini_optimization(user_prompt: str, example_optimized_prompts: list, api_key: str) -> dict:
     """
     Performs prompt optimization and complexity estimation using the Gemini API.
     
     Args:
         user_prompt: The user's original raw prompt string.
-        example_optimized_prompts: A list of example optimized prompts to guide Gemini.
+        example_optimized_prompts: A list of example optimized prompts to guide Gemini
+            (usually the few most relevant ones, see select_few_shot_examples).
         api_key: The Gemini API key.
         
     Returns:
         A dictionary containing generatedOptimizedPrompt, similarityScore, 
-        originalPromptComplexity, and optimizedPromptComplexity.
+        originalPromptComplexity, and optimizedPromptComplexity, plus the payload
+        accounting keys requestBytes, requestTokens, responseBytes and fewShotExamples.
+        
+    Raises:
+        GeminiUnavailableError: If Gemini failed after retries or the circuit breaker is open.
     """
-    # Ensure API key is configured before making the call
-    genai.configure(api_key=api_key)
+    # The shared client configures the API key once and adds timeouts, retries and a circuit breaker
+    client = get_gemini_client(api_key)
+    return client.run_sync(client.optimize(user_prompt, example_optimized_prompts))
 
-    # The prompt now asks Gemini to GENERATE the optimized prompt
-    gemini_prompt_text = f"""Given the user prompt: "{user_prompt}".
-    
-    Your task is to generate a concise and energy-efficient version of this prompt.
-    Also, provide:
-    1.  A 'complexity score' for the user's original prompt (a number between 0 and 100, where higher complexity generally implies more computational effort and thus higher energy consumption).
-    2.  A 'complexity score' for the generated optimized prompt (a number between 0 and 100).
-    3.  A 'similarity score' between the original prompt and your generated optimized prompt (a number between 0 and 100, where 100 is identical).
-    
-    Return the results in JSON format.
-    
-    Example of desired optimized prompts are: {json.dumps(example_optimized_prompts)}.
+def perform_gemini_optimization_many(user_prompts: list, example_optimized_prompts: list, api_key: str,
+                                     examples_per_prompt: list[list] | None = None, pack_slot=None) -> list[dict]:
     """
+    Batch variant of perform_gemini_optimization: packs several user prompts into each
+    structured-output request and runs the requests concurrently. With examples_per_prompt,
+    each request carries only the few-shot examples selected for the prompts packed into it.
+    With pack_slot, each request is admitted separately (see AsyncGeminiClient.optimize_many).
     
-    response = gemini_model.generate_content(gemini_prompt_text)
-    
-    # Extract the JSON string from the response
-    response_text = response.candidates[0].content.parts[0].text
-    parsed_data = json.loads(response_text)
-    
-    return parsed_data
+    Returns:
+        One result dictionary per user prompt, in input order; prompts whose request failed
+        get the error instead.
+
+    Raises:
+        GeminiUnavailableError: If every request failed or the circuit breaker is open.
+        SchedulerRejectedError: If no request got a pack slot.
+    """
+    client = get_gemini_client(api_key)
+    return client.run_sync(client.optimize_many(user_prompts, example_optimized_prompts,
+                                                    examples_per_prompt=examples_per_prompt, pack_slot=pack_slot))
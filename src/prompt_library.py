@@ -0,0 +1,221 @@
+# src/prompt_library.py
+"""
+File-backed, hot-reloadable example prompt library stored as JSONL shards.
+
+Seed a library directory from the built-in prompt list:
+    python -m src.prompt_library export data/library
+"""
+
+import argparse
+import json
+import logging
+import os
+import threading
+from dataclasses import dataclass, field
+
+from src.ann_index import ShardedIndex, build_example_index
+from src.config import EMBEDDING_CACHE_DIR, PROMPT_LIBRARY_DIR, PROMPT_LIBRARY_POLL_SECONDS
+from src.embedding_backends import EMBEDDING_STORE_KEY
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CATEGORY = "general"
+
+@dataclass(frozen=True)
+class LibraryEntry:
+    id: str
+    text: str
+    category: str
+    shard: str
+
+@dataclass(frozen=True)
+class LibrarySnapshot:
+    """An immutable view of the library: entries, their texts and the index over them."""
+    version: int
+    entries: list
+    index: object
+    prompts: list = field(init=False)
+    ids: list = field(init=False)
+
+    def __post_init__(self):
+        object.__setattr__(self, "prompts", [e.text for e in self.entries])
+        object.__setattr__(self, "ids", [e.id for e in self.entries])
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+# --- Shards ---
+
+def list_shards(directory: str) -> list[str]:
+    """Returns the shard paths in the library directory, in load order (sorted by name)."""
+    if not os.path.isdir(directory):
+        return []
+    return sorted(os.path.join(directory, name) for name in os.listdir(directory) if name.endswith(".jsonl"))
+
+def read_shard(path: str) -> list[LibraryEntry]:
+    """Parses one JSONL shard, skipping blank lines."""
+    shard = os.path.basename(path)
+    entries = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+                entries.append(LibraryEntry(str(record["id"]), record["text"], record.get("category", DEFAULT_CATEGORY), shard))
+            except (ValueError, KeyError, TypeError) as e:
+                raise ValueError(f"{shard}:{line_no}: invalid library entry ({e}).") from e
+    return entries
+
+def _shard_signature(path: str) -> tuple:
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+# --- Library ---
+
+class PromptLibrary:
+    """
+    The example prompt library loaded from a shard directory.
+
+    snapshot is always a complete, consistent LibrarySnapshot. reload() (called by the
+    watcher thread, or directly) re-reads only shards whose size or mtime changed, embeds
+    only entries whose text is new, indexes only the changed shards and then swaps the
+    snapshot and notifies subscribers. A failed reload (e.g. a malformed line mid-edit) keeps serving
+    the previous snapshot.
+    """
+
+    def __init__(self, directory: str, embedding_model, model_name: str = EMBEDDING_STORE_KEY,
+                 cache_dir: str = EMBEDDING_CACHE_DIR):
+        self.directory = directory
+        self.embedding_model = embedding_model
+        self.model_name = model_name
+        self.cache_dir = cache_dir
+        self._reload_lock = threading.Lock()
+        self._shards = {}  # path -> (signature, entries, index)
+        self._listeners = []
+        self._snapshot = None
+        self._watcher = None
+        self.last_error = None
+        if not self.reload():
+            raise ValueError(f"No prompt library shards (*.jsonl) found in '{directory}'.")
+
+    @property
+    def snapshot(self) -> LibrarySnapshot:
+        return self._snapshot
+
+    def subscribe(self, callback):
+        """Registers callback(snapshot), called after every successful swap."""
+        self._listeners.append(callback)
+
+    def _load_shard(self, path: str) -> tuple[list, object]:
+        from utils.embedding_store import load_or_build_embeddings
+
+        entries = read_shard(path)
+        if not entries:
+            return entries, None
+        # One store directory per shard keeps reuse lookups proportional to the shard, not the library
+        shard_cache = os.path.join(self.cache_dir, "library", os.path.splitext(os.path.basename(path))[0])
+        embeddings = load_or_build_embeddings([e.text for e in entries], self.embedding_model, self.model_name, shard_cache)
+        # The index wraps the memory-mapped rows, so the pages stay shared between processes
+        return entries, build_example_index(embeddings, assume_normalised=True)
+
+    def reload(self) -> bool:
+        """
+        Picks up shard changes.
+
+        Returns:
+            True if a new snapshot was swapped in, False if nothing changed.
+        """
+        with self._reload_lock:
+            paths = list_shards(self.directory)
+            signatures = {path: _shard_signature(path) for path in paths}
+            changed = [p for p in paths if p not in self._shards or self._shards[p][0] != signatures[p]]
+            removed = [p for p in self._shards if p not in signatures]
+            if not changed and not removed:
+                return False
+
+            shards = {p: v for p, v in self._shards.items() if p in signatures}
+            for path in changed:
+                entries, index = self._load_shard(path)
+                shards[path] = (signatures[path], entries, index)
+
+            entries = [e for path in paths for e in shards[path][1]]
+            seen = set()
+            duplicates = sorted({e.id for e in entries if e.id in seen or seen.add(e.id)})
+            if duplicates:
+                raise ValueError(f"Duplicate prompt library ids: {', '.join(duplicates[:10])}.")
+            if not entries:
+                raise ValueError(f"The prompt library in '{self.directory}' is empty.")
+
+            index = ShardedIndex([shards[path][2] for path in paths if shards[path][1]])
+            version = (self._snapshot.version + 1) if self._snapshot else 1
+
+            self._shards = shards
+            self._snapshot = LibrarySnapshot(version, entries, index)
+            logger.info("Prompt library v%d: %d entries in %d shards (%d reloaded).",
+                        version, len(entries), len(paths), len(changed))
+        for callback in self._listeners:
+            callback(self._snapshot)
+        return True
+
+    # --- Watching ---
+
+    def watch(self, poll_seconds: float = PROMPT_LIBRARY_POLL_SECONDS) -> "PromptLibrary":
+        """Starts a daemon thread that polls the shard directory and reloads on change."""
+        if self._watcher is None:
+            self._stop = threading.Event()
+            self._watcher = threading.Thread(target=self._watch_loop, args=(poll_seconds,),
+                                             name="prompt-library-watcher", daemon=True)
+            self._watcher.start()
+        return self
+
+    def _watch_loop(self, poll_seconds: float):
+        while not self._stop.wait(poll_seconds):
+            try:
+                self.reload()
+                self.last_error = None
+            except Exception as e:
+                # Usually a shard caught mid-write; keep the last good snapshot and retry next poll
+                if str(e) != str(self.last_error):
+                    logger.warning("Prompt library reload failed: %s", e)
+                self.last_error = e
+
+    def stop(self):
+        if self._watcher is not None:
+            self._stop.set()
+            self._watcher.join()
+            self._watcher = None
+
+    def stats(self) -> dict:
+        snapshot = self._snapshot
+        return {
+            "version": snapshot.version,
+            "entries": len(snapshot),
+            "shards": len(self._shards),
+            "last_error": str(self.last_error) if self.last_error else None,
+        }
+
+def has_library(directory: str = PROMPT_LIBRARY_DIR) -> bool:
+    return bool(list_shards(directory))
+
+def export_library(prompts: list, directory: str, shard_name: str = "core.jsonl", id_prefix: str = "core",
+                   category: str = DEFAULT_CATEGORY):
+    """Writes a prompt list as one shard with sequential stable ids."""
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, shard_name), "w", encoding="utf-8") as f:
+        for i, text in enumerate(prompts, 1):
+            f.write(json.dumps({"id": f"{id_prefix}-{i:04d}", "text": text, "category": category}) + "\n")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    export = subcommands.add_parser("export", help="Write the built-in example prompts as a library shard.")
+    export.add_argument("directory", nargs="?", default=PROMPT_LIBRARY_DIR)
+    args = parser.parse_args()
+
+    from data.optimized_prompts import example_optimized_prompts
+    export_library(example_optimized_prompts, args.directory)
+    print(f"Wrote {len(example_optimized_prompts)} entries to {os.path.join(args.directory, 'core.jsonl')}")
+
+if __name__ == "__main__":
+    main()
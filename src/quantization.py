@@ -0,0 +1,251 @@
+# src/quantization.py
+"""
+Compact int8 and product-quantised embedding codes, with exact rescoring of the shortlist.
+"""
+
+import time
+
+import numpy as np
+
+from src.ann_index import _GrowableMatrix, exact_top_k, is_memory_mapped, normalise_rows, rescore_top_k, top_k_positions
+from src.config import ANN_PQ_SUBVECTORS, ANN_RESCORE_CANDIDATES
+
+PQ_CENTROIDS = 256  # One byte per subvector code
+PQ_TRAINING_POINTS = 40 * PQ_CENTROIDS
+PQ_ENCODE_BLOCK_ROWS = 8192  # Bounds the (rows, 256) distance temporary while encoding
+
+def _blockwise(score_block, codes: np.ndarray, block_rows: int) -> np.ndarray:
+    if codes.shape[0] <= block_rows:
+        return score_block(codes)
+    return np.concatenate([score_block(codes[i:i + block_rows]) for i in range(0, codes.shape[0], block_rows)])
+
+# --- Quantizers ---
+
+class ScalarQuantizer:
+    """Per-dimension int8 quantisation over the trained [min, max] range of each dimension."""
+
+    code_dtype = np.int8
+    # Small blocks keep the float32 copy of each block in cache; the scan then runs at matrix-vector speed
+    scan_block_rows = 1024
+
+    def __init__(self):
+        self.offset = None  # Value of code -128 per dimension
+        self.scale = None
+
+    @property
+    def is_trained(self) -> bool:
+        return self.offset is not None
+
+    def code_width(self, dim: int) -> int:
+        return dim
+
+    def train(self, rows: np.ndarray):
+        low, high = rows.min(axis=0), rows.max(axis=0)
+        self.offset = low.astype(np.float32)
+        self.scale = (np.maximum(high - low, 1e-12) / 255).astype(np.float32)
+
+    def encode(self, rows: np.ndarray) -> np.ndarray:
+        codes = np.rint((rows - self.offset) / self.scale) - 128
+        return np.clip(codes, -128, 127).astype(np.int8)
+
+    def scorer(self, query: np.ndarray):
+        """Returns a function mapping (n, D) codes to approximate inner products with query."""
+        # x ~= offset + scale * (code + 128), so q.x ~= q.(offset + 128 * scale) + (q * scale).code
+        weights = query * self.scale
+        bias = np.float32(query @ (self.offset + 128 * self.scale))
+        return lambda codes: _blockwise(lambda block: block.astype(np.float32) @ weights + bias, codes, self.scan_block_rows)
+
+class ProductQuantizer:
+    """
+    Product quantisation: D dimensions split into n_subvectors groups, each encoded as the
+    index of its nearest of 256 k-means centroids. Scores use per-query lookup tables
+    (asymmetric distance), so a scan is n_subvectors table lookups per row.
+    """
+
+    code_dtype = np.uint8
+    scan_block_rows = 16384
+
+    def __init__(self, n_subvectors: int = ANN_PQ_SUBVECTORS, kmeans_iterations: int = 15, seed: int = 0):
+        self.n_subvectors = n_subvectors
+        self.kmeans_iterations = kmeans_iterations
+        self._rng = np.random.default_rng(seed)
+        self.codebooks = None  # (n_subvectors, 256, subvector_dim)
+
+    @property
+    def is_trained(self) -> bool:
+        return self.codebooks is not None
+
+    def code_width(self, dim: int) -> int:
+        return self.n_subvectors
+
+    def _subvectors(self, rows: np.ndarray, m: int) -> np.ndarray:
+        width = rows.shape[1] // self.n_subvectors
+        return np.ascontiguousarray(rows[:, m * width:(m + 1) * width], dtype=np.float32)
+
+    def train(self, rows: np.ndarray):
+        if rows.shape[1] % self.n_subvectors:
+            raise ValueError(f"The embedding size {rows.shape[1]} is not divisible by {self.n_subvectors} PQ subvectors.")
+        sample = rows[np.sort(self._rng.choice(rows.shape[0], min(rows.shape[0], PQ_TRAINING_POINTS), replace=False))]
+        n_centroids = min(PQ_CENTROIDS, sample.shape[0])
+        parts = [self._subvectors(sample, m) for m in range(self.n_subvectors)]
+        seeds = self._rng.choice(sample.shape[0], n_centroids, replace=False)
+        codebooks = np.stack([part[seeds] for part in parts])
+        for _ in range(self.kmeans_iterations):
+            assignment = self._assign(sample, codebooks)
+            for m, part in enumerate(parts):
+                order = np.argsort(assignment[:, m], kind="stable")
+                occupied, starts, counts = np.unique(assignment[order, m], return_index=True, return_counts=True)
+                codebooks[m, occupied] = np.add.reduceat(part[order], starts, axis=0) / counts[:, None]
+                # Re-seed empty centroids with random points so every code stays useful
+                empty = np.setdiff1d(np.arange(n_centroids), occupied)
+                codebooks[m, empty] = part[self._rng.choice(sample.shape[0], len(empty))]
+        if n_centroids < PQ_CENTROIDS:
+            codebooks = np.concatenate([codebooks, np.repeat(codebooks[:, :1], PQ_CENTROIDS - n_centroids, axis=1)], axis=1)
+        self.codebooks = codebooks.astype(np.float32)
+
+    def _assign(self, rows: np.ndarray, codebooks: np.ndarray) -> np.ndarray:
+        # Nearest centroid per subvector: argmin ||x - c||^2 = argmax (x.c - ||c||^2 / 2)
+        half_norms = 0.5 * np.einsum("mcd,mcd->mc", codebooks, codebooks)
+        codes = np.empty((rows.shape[0], self.n_subvectors), dtype=np.uint8)
+        for m in range(self.n_subvectors):
+            part, centroids = self._subvectors(rows, m), np.ascontiguousarray(codebooks[m].T)
+            for start in range(0, rows.shape[0], PQ_ENCODE_BLOCK_ROWS):
+                scores = part[start:start + PQ_ENCODE_BLOCK_ROWS] @ centroids
+                scores -= half_norms[m]
+                codes[start:start + scores.shape[0], m] = scores.argmax(axis=1)
+        return codes
+
+    def encode(self, rows: np.ndarray) -> np.ndarray:
+        return self._assign(rows, self.codebooks)
+
+    def scorer(self, query: np.ndarray):
+        """Returns a function mapping (n, n_subvectors) codes to approximate inner products with query."""
+        tables = np.einsum("mcd,md->mc", self.codebooks, query.reshape(self.n_subvectors, -1))
+
+        def score_block(codes):
+            # One table lookup per subvector; accumulating column by column avoids an (n, subvectors) temporary
+            scores = tables[0].take(codes[:, 0])
+            for m in range(1, self.n_subvectors):
+                scores += tables[m].take(codes[:, m])
+            return scores
+
+        return lambda codes: _blockwise(score_block, codes, self.scan_block_rows)
+
+QUANTIZERS = {"int8": ScalarQuantizer, "pq": ProductQuantizer}
+
+def make_quantizer(kind: str):
+    try:
+        return QUANTIZERS[kind]()
+    except KeyError:
+        raise ValueError(f"Unknown quantization '{kind}'. Expected 'none', 'int8' or 'pq'.") from None
+
+# --- Index ---
+
+class QuantizedIndex:
+    """
+    Exhaustive scan over compact codes with full-precision rescoring.
+
+    The codes live in one contiguous buffer. A search scores every code approximately,
+    keeps the rescore_candidates best and rescores those against the float32 rows, so the
+    returned similarities are exact and the ranking only differs from FlatIndex when the
+    true neighbour misses the shortlist. With rescore_candidates=0 the approximate scores
+    are returned and the float32 rows are never read.
+    """
+
+    def __init__(self, dim: int, quantizer, rescore_candidates: int = ANN_RESCORE_CANDIDATES):
+        self.dim = dim
+        self.quantizer = quantizer
+        self.rescore_candidates = rescore_candidates
+        self._codes = None
+        self._vectors = _GrowableMatrix(dim)
+
+    @classmethod
+    def from_normalised(cls, matrix: np.ndarray, quantizer, rescore_candidates: int = ANN_RESCORE_CANDIDATES) -> "QuantizedIndex":
+        """Encodes an already-normalised matrix, keeping it (e.g. memory-mapped) for rescoring without copying."""
+        index = cls(matrix.shape[1], quantizer, rescore_candidates)
+        if matrix.shape[0]:
+            index._append_codes(matrix)
+        index._vectors = _GrowableMatrix.wrap(matrix)
+        return index
+
+    def _append_codes(self, rows: np.ndarray):
+        if not self.quantizer.is_trained:
+            self.quantizer.train(rows)
+        if self._codes is None:
+            self._codes = _GrowableMatrix(self.quantizer.code_width(self.dim), capacity=max(16, rows.shape[0]),
+                                          dtype=self.quantizer.code_dtype)
+        self._codes.append(self.quantizer.encode(rows))
+
+    def add(self, embeddings: np.ndarray) -> np.ndarray:
+        """Appends embeddings and returns their ids. The first call trains the quantizer on its batch."""
+        rows = normalise_rows(embeddings)
+        start = len(self._vectors)
+        self._append_codes(rows)
+        self._vectors.append(rows)
+        return np.arange(start, start + rows.shape[0], dtype=np.int64)
+
+    def search(self, query: np.ndarray, k: int = 1) -> tuple[np.ndarray, np.ndarray]:
+        """Returns (ids, cosine similarities) of the approximate k nearest stored embeddings."""
+        if not len(self):
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        query = normalise_rows(query)[0]
+        scores = self.quantizer.scorer(query)(self._codes.view)
+        if self.rescore_candidates <= 0:
+            top = top_k_positions(scores, k)
+            return top, scores[top]
+        candidates = top_k_positions(scores, max(k, self.rescore_candidates))
+        return rescore_top_k(self._vectors.view, candidates, query, k)
+
+    @property
+    def code_bytes(self) -> int:
+        """Memory held by the codes (the float32 rows are only read for rescoring)."""
+        return self._codes.view.nbytes if self._codes is not None else 0
+
+    @property
+    def memory_bytes(self) -> int:
+        """code_bytes plus the float32 rows, unless they are memory-mapped (e.g. from the embedding store)."""
+        rows = self._vectors.view
+        return self.code_bytes + (0 if is_memory_mapped(rows) else rows.nbytes)
+
+    def __len__(self) -> int:
+        return len(self._codes) if self._codes is not None else 0
+
+# --- Evaluation ---
+
+def evaluate_recall(index, matrix: np.ndarray, queries: np.ndarray, k: int = 5) -> dict:
+    """
+    Compares an index with an exact scan of `matrix` over the given queries.
+
+    Args:
+        index: Any index with search(query, k).
+        matrix: The normalised (N, D) embeddings the index was built from.
+        queries: A (Q, D) matrix of query embeddings.
+        k: The number of neighbours compared per query.
+
+    Returns:
+        A dict with recall@k, top-1 agreement, mean absolute error of the top-1 similarity,
+        p50/p99 search latency in ms, the bytes of codes the index scans (code_bytes) and
+        the memory it holds (memory_bytes: codes plus any float32 rows not memory-mapped);
+        an index without codes counts the float32 matrix for both.
+    """
+    queries = normalise_rows(queries)
+    hits, top1_hits, similarity_errors, latencies = 0, 0, [], []
+    for query in queries:
+        exact_ids, exact_scores = exact_top_k(matrix, query, k)
+        start = time.perf_counter()
+        ids, scores = index.search(query, k)
+        latencies.append(time.perf_counter() - start)
+        hits += len(np.intersect1d(ids, exact_ids))
+        top1_hits += bool(len(ids)) and ids[0] == exact_ids[0]
+        if len(scores):
+            similarity_errors.append(abs(float(scores[0]) - float(exact_scores[0])))
+    latencies_ms = np.asarray(latencies) * 1000
+    return {
+        "recall_at_k": hits / (len(queries) * min(k, matrix.shape[0])),
+        "top1_agreement": top1_hits / len(queries),
+        "top1_similarity_error": float(np.mean(similarity_errors)) if similarity_errors else 0.0,
+        "p50_ms": float(np.percentile(latencies_ms, 50)),
+        "p99_ms": float(np.percentile(latencies_ms, 99)),
+        "code_bytes": int(getattr(index, "code_bytes", matrix.nbytes)),
+        "memory_bytes": int(getattr(index, "memory_bytes", matrix.nbytes)),
+    }
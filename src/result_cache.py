@@ -0,0 +1,289 @@
+# src/result_cache.py
+
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+from src.config import (
+    BASE_ENERGY_PER_COMPLEXITY,
+    COMPRESSION_REDUNDANCY_THRESHOLD,
+    COMPRESSION_TOKEN_BUDGET,
+    ENERGY_PER_INPUT_TOKEN,
+    GEMINI_MODEL_NAME,
+    LLM_SIZE_MULTIPLIERS,
+    RESULT_CACHE_DB_PATH,
+    RESULT_CACHE_ENABLED,
+    RESULT_CACHE_MAX_ENTRIES,
+    RESULT_CACHE_PRUNE_SECONDS,
+    RESULT_CACHE_TTL_SECONDS,
+)
+
+logger = logging.getLogger(__name__)
+
+# --- Keys ---
+
+def normalise_prompt(prompt: str) -> str:
+    """
+    Canonical form used for cache keys: Unicode NFKC, lower case, collapsed whitespace.
+    The local pipeline is insensitive to these differences (the complexity heuristic lower-cases
+    and the MiniLM tokenizer is uncased), so such prompts share one cached result.
+    """
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFKC", prompt)).strip().lower()
+
+# Bump when AnalysisResult gains, drops or redefines a field, so older entries are not served
+RESULT_SCHEMA_VERSION = 2
+
+def pipeline_fingerprint(embedding_key: str = "", energy_model=None, tokenizer: str = "") -> str:
+    """
+    Short hash of everything besides the example library that a cached result depends on:
+    the result schema, the embedding backend (its store key), the fitted energy model or the
+    heuristic pricing constants, the tokenizer, and the Gemini and compression settings.
+    """
+    parts = [
+        RESULT_SCHEMA_VERSION, embedding_key, energy_model.fingerprint() if energy_model is not None else "heuristic",
+        tokenizer, BASE_ENERGY_PER_COMPLEXITY, ENERGY_PER_INPUT_TOKEN, sorted(LLM_SIZE_MULTIPLIERS.items()),
+        GEMINI_MODEL_NAME, COMPRESSION_REDUNDANCY_THRESHOLD, COMPRESSION_TOKEN_BUDGET,
+    ]
+    return hashlib.sha256(json.dumps(parts).encode("utf-8")).hexdigest()[:16]
+
+def library_fingerprint(example_prompts: list, pipeline: str = "") -> str:
+    """Short hash of the example prompt library and the pipeline fingerprint; cached results are scoped to it."""
+    digest = hashlib.sha256(pipeline.encode("utf-8"))
+    for prompt in example_prompts:
+        digest.update(prompt.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()[:16]
+
+# Modes whose output rewrites the prompt's own wording ("compress", "gemini"): a prompt that
+# differs only in case or spacing must not get another prompt's text back, so they are keyed
+# on the exact prompt
+EXACT_KEY_MODES = ("compress", "gemini")
+
+def make_cache_key(prompt: str, llm_size: str, mode: str) -> str:
+    text = prompt if mode in EXACT_KEY_MODES else normalise_prompt(prompt)
+    return f"{mode}:{llm_size}:{hashlib.sha256(text.encode('utf-8')).hexdigest()}"
+
+# --- Tiers ---
+
+class LRUCache:
+    """Thread-safe in-process LRU cache with a per-entry TTL."""
+
+    def __init__(self, max_entries: int = RESULT_CACHE_MAX_ENTRIES, ttl_seconds: float = RESULT_CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value):
+        with self._lock:
+            self._entries[key] = (time.time() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+class SQLiteCache:
+    """
+    On-disk cache tier shared by every worker process on the host.
+    Values are JSON; WAL mode lets readers proceed while another process writes.
+
+    Expired rows are deleted on open and then every `prune_seconds` by the writer that
+    notices the interval has passed. The tier is best-effort: a locked or failing database
+    turns a lookup into a miss and a store into a no-op (counted in `errors`), never a
+    failed analysis.
+    """
+
+    def __init__(self, path: str = RESULT_CACHE_DB_PATH, ttl_seconds: float = RESULT_CACHE_TTL_SECONDS,
+                 prune_seconds: float = RESULT_CACHE_PRUNE_SECONDS):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.prune_seconds = prune_seconds
+        self.errors = 0
+        self._local = threading.local()
+        self._next_prune = 0.0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                "namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, expires_at REAL NOT NULL, "
+                "PRIMARY KEY (namespace, key))"
+            )
+        self._maybe_prune()
+
+    def _failed(self, action: str, error: sqlite3.Error):
+        self.errors += 1
+        logger.warning("Result cache %s failed on %s: %s", action, self.path, error)
+
+    def _connection(self) -> sqlite3.Connection:
+        # SQLite connections must not be shared across threads, so keep one per thread
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, namespace: str, key: str):
+        try:
+            row = self._connection().execute(
+                "SELECT value, expires_at FROM results WHERE namespace = ? AND key = ?", (namespace, key)
+            ).fetchone()
+        except sqlite3.Error as e:
+            self._failed("lookup", e)
+            return None
+        if row is None or row[1] < time.time():
+            return None
+        return json.loads(row[0])
+
+    def set(self, namespace: str, key: str, value):
+        try:
+            with self._connection() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO results (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)",
+                    (namespace, key, json.dumps(value), time.time() + self.ttl_seconds),
+                )
+        except sqlite3.Error as e:
+            self._failed("store", e)
+            return
+        self._maybe_prune()
+
+    def delete_namespace(self, namespace: str):
+        """Deletes every entry of one namespace. Other namespaces may belong to other processes sharing the file."""
+        try:
+            with self._connection() as conn:
+                conn.execute("DELETE FROM results WHERE namespace = ?", (namespace,))
+        except sqlite3.Error as e:
+            # A namespace that is no longer current is never read again, and expires with the TTL
+            self._failed("invalidation", e)
+
+    def prune_expired(self):
+        with self._connection() as conn:
+            conn.execute("DELETE FROM results WHERE expires_at < ?", (time.time(),))
+
+    def _maybe_prune(self):
+        now = time.monotonic()
+        if now < self._next_prune:
+            return
+        self._next_prune = now + self.prune_seconds
+        try:
+            self.prune_expired()
+        except sqlite3.Error as e:
+            self._failed("prune", e)
+
+# --- Two-tier cache ---
+
+class ResultCache:
+    """
+    Two-tier analysis result cache: an in-process LRU in front of an optional SQLite store.
+
+    Entries are keyed by the prompt hash (normalised in local mode, exact in EXACT_KEY_MODES),
+    LLM size and optimization mode, and are scoped to a namespace (the fingerprint of the
+    example library and the pipeline). Calling invalidate() when the library changes drops
+    what this cache stored against the old library.
+    """
+
+    def __init__(self, namespace: str, memory: LRUCache | None = None, disk: SQLiteCache | None = None,
+                 pipeline: str = ""):
+        self.namespace = namespace
+        self.pipeline = pipeline
+        self.memory = memory or LRUCache()
+        self.disk = disk
+        self._lock = threading.Lock()
+        self.metrics = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0, "invalidations": 0}
+
+    def _count(self, metric: str):
+        with self._lock:
+            self.metrics[metric] += 1
+
+    def get(self, prompt: str, llm_size: str, mode: str):
+        """Returns the cached value (a JSON-compatible dict) or None."""
+        key = make_cache_key(prompt, llm_size, mode)
+        value = self.memory.get(f"{self.namespace}:{key}")
+        if value is not None:
+            self._count("memory_hits")
+            return value
+        if self.disk is not None:
+            value = self.disk.get(self.namespace, key)
+            if value is not None:
+                self._count("disk_hits")
+                self.memory.set(f"{self.namespace}:{key}", value)
+                return value
+        self._count("misses")
+        return None
+
+    def set(self, prompt: str, llm_size: str, mode: str, value):
+        key = make_cache_key(prompt, llm_size, mode)
+        self.memory.set(f"{self.namespace}:{key}", value)
+        if self.disk is not None:
+            self.disk.set(self.namespace, key, value)
+        self._count("stores")
+
+    def invalidate(self, example_prompts: list | None = None):
+        """
+        Invalidation hook for library changes: switches to the new library's namespace
+        (when given) and drops the entries of the previous one. Called with the same library
+        (or none), it flushes the current namespace. Other namespaces in a shared SQLite file
+        (other workers, pipelines or batch runs) are left alone and expire with the TTL.
+        """
+        previous = self.namespace
+        if example_prompts is not None:
+            self.namespace = library_fingerprint(example_prompts, self.pipeline)
+        self.memory.clear()
+        if self.disk is not None:
+            self.disk.delete_namespace(previous)
+        self._count("invalidations")
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self.metrics)
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["memory_hits"] + stats["disk_hits"]) / lookups if lookups else 0.0
+        stats["memory_entries"] = len(self.memory)
+        stats["memory_evictions"] = self.memory.evictions
+        if self.disk is not None:
+            stats["disk_errors"] = self.disk.errors
+        return stats
+
+def build_result_cache(example_prompts: list, pipeline: str = "", db_path: str = RESULT_CACHE_DB_PATH) -> ResultCache | None:
+    """
+    Creates the result cache configured in src/config.py, or None when caching is disabled.
+
+    Args:
+        example_prompts: The example library the results are computed against.
+        pipeline: A pipeline_fingerprint() of the engine's backend, energy model and tokenizer.
+        db_path: The SQLite tier's file; empty for an in-memory cache only.
+    """
+    if not RESULT_CACHE_ENABLED:
+        return None
+    disk = SQLiteCache(db_path) if db_path else None
+    return ResultCache(library_fingerprint(example_prompts, pipeline), LRUCache(), disk, pipeline)
@@ -0,0 +1,511 @@
+# src/scheduler.py
+"""
+Multi-tenant rate limiting, priorities and fair sharing of the optimizer's workers and Gemini budget.
+"""
+
+import asyncio
+import contextvars
+import heapq
+import itertools
+import threading
+import time
+from collections import Counter
+from contextlib import asynccontextmanager, contextmanager
+from dataclasses import dataclass
+
+from src.config import (
+    GEMINI_MAX_CONCURRENCY,
+    SCHEDULER_BURST,
+    SCHEDULER_ENABLED,
+    SCHEDULER_LOCAL_SLOTS,
+    SCHEDULER_MAX_INTERACTIVE_STREAK,
+    SCHEDULER_MAX_WAIT_SECONDS,
+    SCHEDULER_MAX_WAITING,
+    SCHEDULER_RATE_PER_SECOND,
+    SCHEDULER_TENANT_LIMITS,
+)
+from src.instrumentation import Histogram, metrics, stage
+
+INTERACTIVE = 0
+BATCH = 1
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BATCH: "batch"}
+DEFAULT_TENANT = "anonymous"
+
+# Idle tenants' buckets and fair-queuing clocks are dropped once this many are tracked
+MAX_TRACKED_TENANTS = 10_000
+
+class SchedulerRejectedError(RuntimeError):
+    """Raised when a request is not admitted; retry_after is the suggested wait in seconds."""
+
+    def __init__(self, message: str, retry_after: float = 1.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class RateLimitedError(SchedulerRejectedError):
+    """Raised when a tenant is over its rate limit."""
+
+class QueueFullError(SchedulerRejectedError):
+    """Raised when a resource has too many waiting requests, or a wait timed out."""
+
+# --- Request context ---
+
+@dataclass(frozen=True)
+class RequestContext:
+    tenant: str = DEFAULT_TENANT
+    priority: int = INTERACTIVE
+    local_slot: "_HeldSlot | None" = None  # The local slot the request holds, until it turns to Gemini
+
+_current_request = contextvars.ContextVar("current_request", default=RequestContext())
+
+def current_request() -> RequestContext:
+    """The tenant and priority of the request running in this context."""
+    return _current_request.get()
+
+@contextmanager
+def request_context(tenant: str | None, priority: int = INTERACTIVE):
+    """Tags work done inside the block (e.g. Gemini calls deep in the engine) with a tenant and priority."""
+    token = _current_request.set(RequestContext(tenant or DEFAULT_TENANT, priority))
+    try:
+        yield
+    finally:
+        _current_request.reset(token)
+
+# --- Rate limits ---
+
+def parse_tenant_limits(spec: str, default_burst: float = SCHEDULER_BURST) -> dict:
+    """Parses "tenant=rate:burst,..." (burst optional) into {tenant: (rate, burst)}."""
+    limits = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        tenant, _, limit = item.partition("=")
+        rate, _, burst = limit.partition(":")
+        limits[tenant.strip()] = (float(rate), float(burst) if burst else default_burst)
+    return limits
+
+class TokenBucket:
+    """Holds up to `burst` tokens, refilled at `rate` per second. Not thread-safe; RateLimiter locks around it."""
+
+    def __init__(self, rate: float, burst: float, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.limited = 0  # Rejected requests, for stats
+        self._clock = clock
+        self._updated = clock()
+
+    def _refill(self):
+        now = self._clock()
+        self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def take(self, cost: float) -> float:
+        """
+        Takes `cost` tokens and returns 0, or returns the seconds until they can be taken.
+        A cost above the burst is admitted from a full bucket and leaves it in debt, so a
+        large batch is throttled afterwards rather than refused outright.
+        """
+        self._refill()
+        needed = min(cost, self.burst)
+        if self.tokens >= needed:
+            self.tokens -= cost
+            return 0.0
+        return (needed - self.tokens) / self.rate if self.rate > 0 else float("inf")
+
+    def is_full(self) -> bool:
+        self._refill()
+        return self.tokens >= self.burst
+
+class RateLimiter:
+    """One TokenBucket per tenant, created on first use with the tenant's configured limits."""
+
+    def __init__(self, rate: float = SCHEDULER_RATE_PER_SECOND, burst: float = SCHEDULER_BURST,
+                 tenant_limits: dict | None = None, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.tenant_limits = tenant_limits or {}
+        self._clock = clock
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def _bucket(self, tenant: str) -> TokenBucket:
+        bucket = self._buckets.get(tenant)
+        if bucket is None:
+            if len(self._buckets) >= MAX_TRACKED_TENANTS:
+                # A full bucket is indistinguishable from a new one, so it can be dropped
+                self._buckets = {t: b for t, b in self._buckets.items() if not b.is_full()}
+            rate, burst = self.tenant_limits.get(tenant, (self.rate, self.burst))
+            bucket = self._buckets[tenant] = TokenBucket(rate, burst, self._clock)
+        return bucket
+
+    def take(self, tenant: str, cost: float = 1.0) -> float:
+        """Charges `cost` prompts to the tenant; returns 0, or the seconds to wait before retrying."""
+        with self._lock:
+            return self._bucket(tenant).take(cost)
+
+    def record_limited(self, tenant: str):
+        with self._lock:
+            self._bucket(tenant).limited += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            limited = Counter({t: b.limited for t, b in self._buckets.items() if b.limited})
+            return {"tenants": len(self._buckets), "rate_limited": dict(limited.most_common(20))}
+
+# --- Fair resources ---
+
+class _Waiter:
+    __slots__ = ("tenant", "priority", "cost", "slots", "start_tag", "enqueued_at", "granted", "cancelled", "notify")
+
+    def __init__(self, tenant: str, priority: int, cost: float, slots: int, notify):
+        self.tenant = tenant
+        self.priority = priority
+        self.cost = cost
+        self.slots = slots
+        self.notify = notify
+        self.start_tag = 0.0
+        self.enqueued_at = 0.0
+        self.granted = False
+        self.cancelled = False
+
+class FairResource:
+    """
+    A pool of `capacity` slots shared by tenants: INTERACTIVE before BATCH (up to
+    max_interactive_streak grants in a row while batch work waits), start-time fair queuing
+    between the tenants of one priority. A request may take
+    several slots at once; it then waits at the head of its queue until enough are free, so
+    large requests are never starved by small ones.
+
+    Thread-safe: acquire() blocks a worker thread, acquire_async() awaits on an event loop.
+    """
+
+    def __init__(self, name: str, capacity: int, max_waiting: int = SCHEDULER_MAX_WAITING,
+                 max_wait_seconds: float = SCHEDULER_MAX_WAIT_SECONDS, clock=time.monotonic,
+                 max_interactive_streak: int = SCHEDULER_MAX_INTERACTIVE_STREAK):
+        self.name = name
+        self.capacity = max(1, capacity)
+        self.max_waiting = max_waiting
+        self.max_wait_seconds = max_wait_seconds
+        self.max_interactive_streak = max_interactive_streak
+        self._interactive_streak = 0  # Interactive grants in a row while batch work waited
+        self._clock = clock
+        self._queues = {priority: [] for priority in PRIORITY_NAMES}
+        self._seq = itertools.count()
+        self._finish_tags = {}  # tenant -> virtual time at which its granted and queued work ends
+        self._virtual_time = 0.0
+        self._in_use = 0
+        self._waiting = Counter()  # priority -> waiting requests
+        self._waiting_tenants = Counter()
+        self._counters = Counter()
+        self._wait_seconds = {priority: Histogram() for priority in PRIORITY_NAMES}
+        self._lock = threading.Lock()
+
+    # --- Queueing (called with the lock held) ---
+
+    def _enqueue(self, waiter: _Waiter):
+        start = max(self._virtual_time, self._finish_tags.get(waiter.tenant, 0.0))
+        self._finish_tags[waiter.tenant] = start + waiter.cost
+        waiter.start_tag = start
+        waiter.enqueued_at = self._clock()
+        heapq.heappush(self._queues[waiter.priority], (start, next(self._seq), waiter))
+        self._waiting[waiter.priority] += 1
+        self._waiting_tenants[waiter.tenant] += 1
+
+    def _unqueue(self, waiter: _Waiter):
+        self._waiting[waiter.priority] -= 1
+        self._waiting_tenants[waiter.tenant] -= 1
+        if not self._waiting_tenants[waiter.tenant]:
+            del self._waiting_tenants[waiter.tenant]
+
+    def _head(self) -> _Waiter | None:
+        heads = {}
+        for priority, queue in self._queues.items():
+            while queue and queue[0][2].cancelled:
+                heapq.heappop(queue)
+            if queue:
+                heads[priority] = queue[0][2]
+        if BATCH in heads and (INTERACTIVE not in heads or self._interactive_streak >= self.max_interactive_streak):
+            return heads[BATCH]
+        return heads.get(INTERACTIVE)
+
+    def _dispatch(self):
+        while True:
+            waiter = self._head()
+            if waiter is None or waiter.slots > self.capacity - self._in_use:
+                break
+            heapq.heappop(self._queues[waiter.priority])
+            self._unqueue(waiter)
+            self._in_use += waiter.slots
+            self._interactive_streak = self._interactive_streak + 1 if waiter.priority == INTERACTIVE and self._waiting[BATCH] else 0
+            self._virtual_time = max(self._virtual_time, waiter.start_tag)
+            self._wait_seconds[waiter.priority].observe(self._clock() - waiter.enqueued_at)
+            self._counters["granted"] += 1
+            waiter.granted = True
+            waiter.notify()
+        if len(self._finish_tags) > MAX_TRACKED_TENANTS:
+            # Tenants whose clocks have fallen behind would restart at the virtual time anyway
+            self._finish_tags = {t: tag for t, tag in self._finish_tags.items() if tag > self._virtual_time}
+
+    def _submit(self, tenant: str, priority: int, cost: float, slots: int, notify) -> _Waiter:
+        with self._lock:
+            if sum(self._waiting.values()) >= self.max_waiting:
+                self._counters["rejected"] += 1
+                raise QueueFullError(f"Too many requests are waiting for {self.name}; retry shortly.")
+            waiter = _Waiter(tenant or DEFAULT_TENANT, priority, cost, max(1, min(slots, self.capacity)), notify)
+            self._enqueue(waiter)
+            self._dispatch()
+            return waiter
+
+    def _give_up(self, waiter: _Waiter) -> bool:
+        """Withdraws a waiter that stopped waiting; returns False if it was granted in the meantime."""
+        with self._lock:
+            if waiter.granted:
+                return False
+            waiter.cancelled = True
+            self._unqueue(waiter)
+            # Roll back the fair-queuing clock advance for work the tenant never got
+            if waiter.tenant in self._finish_tags:
+                self._finish_tags[waiter.tenant] = max(self._virtual_time, self._finish_tags[waiter.tenant] - waiter.cost)
+            self._counters["abandoned"] += 1
+            self._dispatch()  # A withdrawn head may have been holding back smaller requests
+            return True
+
+    def _timed_out(self) -> QueueFullError:
+        return QueueFullError(f"Timed out waiting for {self.name} capacity; retry shortly.", self.max_wait_seconds)
+
+    # --- Acquiring slots ---
+
+    def acquire(self, tenant: str = DEFAULT_TENANT, priority: int = INTERACTIVE, cost: float = 1.0,
+                slots: int = 1, timeout: float | None = None) -> _Waiter:
+        """
+        Waits for `slots` slots (capped at the capacity) on behalf of a tenant.
+
+        Args:
+            tenant: Who the work is for.
+            priority: INTERACTIVE or BATCH.
+            cost: The work's size in prompts; advances the tenant's fair-queuing clock.
+            slots: Slots held at once.
+            timeout: Longest wait in seconds (default max_wait_seconds).
+
+        Returns:
+            The grant, to pass to release().
+
+        Raises:
+            QueueFullError: Too many requests are waiting, or the wait timed out.
+        """
+        event = threading.Event()
+        with stage(f"{self.name}_queue"):
+            waiter = self._submit(tenant, priority, cost, slots, event.set)
+            if not event.wait(self.max_wait_seconds if timeout is None else timeout) and self._give_up(waiter):
+                raise self._timed_out()
+        return waiter
+
+    async def acquire_async(self, tenant: str = DEFAULT_TENANT, priority: int = INTERACTIVE, cost: float = 1.0,
+                            slots: int = 1, timeout: float | None = None) -> _Waiter:
+        """acquire() for event-loop code: waits without blocking the loop."""
+        loop = asyncio.get_running_loop()
+        granted = loop.create_future()
+
+        def notify():
+            loop.call_soon_threadsafe(lambda: granted.done() or granted.set_result(None))
+
+        with stage(f"{self.name}_queue"):
+            waiter = self._submit(tenant, priority, cost, slots, notify)
+            try:
+                await asyncio.wait_for(granted, self.max_wait_seconds if timeout is None else timeout)
+            except asyncio.TimeoutError:
+                if self._give_up(waiter):
+                    raise self._timed_out()
+            except asyncio.CancelledError:
+                # The client went away: leave the queue, or hand back a grant that just arrived
+                if not self._give_up(waiter):
+                    self.release(waiter)
+                raise
+        return waiter
+
+    def release(self, grant: _Waiter):
+        with self._lock:
+            self._in_use -= grant.slots
+            self._dispatch()
+
+    @contextmanager
+    def slot(self, tenant: str = DEFAULT_TENANT, priority: int = INTERACTIVE, cost: float = 1.0, slots: int = 1):
+        """Holds slots for the duration of the block."""
+        grant = self.acquire(tenant, priority, cost, slots)
+        try:
+            yield grant
+        finally:
+            self.release(grant)
+
+    def resize(self, capacity: int):
+        """Changes the number of slots; waiting requests are granted at once if it grew."""
+        with self._lock:
+            self.capacity = max(1, capacity)
+            self._dispatch()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "capacity": self.capacity,
+                "in_use": self._in_use,
+                "waiting": {name: self._waiting[priority] for priority, name in PRIORITY_NAMES.items()},
+                "waiting_by_tenant": dict(self._waiting_tenants.most_common(10)),
+                **{key: self._counters[key] for key in ("granted", "rejected", "abandoned")},
+                "wait_ms": {
+                    name: {"p50": self._wait_seconds[priority].quantile(0.5) * 1000,
+                           "p99": self._wait_seconds[priority].quantile(0.99) * 1000}
+                    for priority, name in PRIORITY_NAMES.items()
+                },
+            }
+
+class _HeldSlot:
+    """A grant that is released once, by whichever comes first: the request's end or a Gemini call."""
+
+    def __init__(self, resource: FairResource, grant: _Waiter):
+        self._resource = resource
+        self._grant = grant
+        self._lock = threading.Lock()
+
+    def release(self):
+        with self._lock:
+            grant, self._grant = self._grant, None
+        if grant is not None:
+            self._resource.release(grant)
+
+# --- Scheduler ---
+
+class RequestScheduler:
+    """
+    Per-tenant rate limits plus fair, prioritised access to two resources: `gemini` (the
+    Gemini concurrency budget) and `local` (the workers running embedding and local
+    analysis). Callers wrap each request in request() or run_async(); the engine takes
+    Gemini slots with gemini_slot() or, for packed batches, gemini_pack_slots(), which read
+    the tenant and priority from the context. A request gives its local slot back before it
+    waits for Gemini, so slow Gemini calls never keep local-only work off the workers.
+    """
+
+    def __init__(self, gemini_slots: int = GEMINI_MAX_CONCURRENCY, local_slots: int = SCHEDULER_LOCAL_SLOTS,
+                 rate: float = SCHEDULER_RATE_PER_SECOND, burst: float = SCHEDULER_BURST,
+                 tenant_limits: dict | None = None, max_waiting: int = SCHEDULER_MAX_WAITING,
+                 max_wait_seconds: float = SCHEDULER_MAX_WAIT_SECONDS, clock=time.monotonic):
+        self.limiter = RateLimiter(rate, burst, tenant_limits, clock)
+        self.gemini = FairResource("gemini", gemini_slots, max_waiting, max_wait_seconds, clock)
+        self.local = FairResource("local", local_slots, max_waiting, max_wait_seconds, clock)
+        self.max_wait_seconds = max_wait_seconds
+
+    def _admission_delay(self, tenant: str, priority: int, cost: float) -> float:
+        delay = self.limiter.take(tenant, cost)
+        if delay and (priority == INTERACTIVE or delay > self.max_wait_seconds):
+            self.limiter.record_limited(tenant)
+            metrics.increment("rate_limited")
+            raise RateLimitedError(f"Tenant '{tenant}' is over its rate limit; retry in {delay:.1f}s.", delay)
+        if delay:
+            metrics.increment("rate_throttled")
+        return delay
+
+    def admit(self, tenant: str | None, priority: int = INTERACTIVE, cost: float = 1.0):
+        """
+        Charges `cost` prompts to the tenant's rate limit. Interactive requests over the
+        limit raise RateLimitedError; batch requests sleep until their tokens are available.
+        """
+        tenant = tenant or DEFAULT_TENANT
+        while delay := self._admission_delay(tenant, priority, cost):
+            with stage("rate_limit_wait"):
+                time.sleep(delay)
+
+    async def admit_async(self, tenant: str | None, priority: int = INTERACTIVE, cost: float = 1.0):
+        """admit() for event-loop code."""
+        tenant = tenant or DEFAULT_TENANT
+        while delay := self._admission_delay(tenant, priority, cost):
+            with stage("rate_limit_wait"):
+                await asyncio.sleep(delay)
+
+    @contextmanager
+    def request(self, tenant: str | None, priority: int = INTERACTIVE, cost: float = 1.0):
+        """
+        Admits one request and holds a local slot while it runs (or until it turns to
+        Gemini), with the tenant in context.
+        """
+        self.admit(tenant, priority, cost)
+        held = _HeldSlot(self.local, self.local.acquire(tenant, priority, cost))
+        token = _current_request.set(RequestContext(tenant or DEFAULT_TENANT, priority, held))
+        try:
+            yield
+        finally:
+            _current_request.reset(token)
+            held.release()
+
+    async def run_async(self, executor, fn, *args, tenant: str | None = None, priority: int = INTERACTIVE,
+                        cost: float = 1.0):
+        """
+        request() for event-loop code: waits for admission and a local slot on the loop, then
+        runs fn(*args) on the executor with the tenant in context.
+        """
+        await self.admit_async(tenant, priority, cost)
+        held = _HeldSlot(self.local, await self.local.acquire_async(tenant, priority, cost))
+        try:
+            context = contextvars.copy_context()
+            context.run(_current_request.set, RequestContext(tenant or DEFAULT_TENANT, priority, held))
+            return await asyncio.get_running_loop().run_in_executor(executor, context.run, fn, *args)
+        finally:
+            held.release()
+
+    def release_local_slot(self):
+        """
+        Gives back the current request's local slot ahead of Gemini-bound work, which only
+        waits on the network; what follows the call is light enough to run without one.
+        """
+        held = current_request().local_slot
+        if held is not None:
+            held.release()
+
+    @contextmanager
+    def gemini_slot(self, cost: float = 1.0, slots: int = 1):
+        """Holds Gemini concurrency slots for the current request's tenant and priority."""
+        current = current_request()
+        self.release_local_slot()
+        with self.gemini.slot(current.tenant, current.priority, cost, slots):
+            yield
+
+    def gemini_pack_slots(self):
+        """
+        Returns pack_slot(prompts), an async context manager that holds one Gemini slot for
+        one packed request, charged to the current request's tenant and priority (captured
+        now, since the Gemini client runs packs on its own event loop). Each pack queues on
+        its own, so a batch makes progress one pack at a time between interactive requests
+        instead of waiting until all its slots are free at once.
+        """
+        current = current_request()
+
+        @asynccontextmanager
+        async def pack_slot(prompts: int):
+            grant = await self.gemini.acquire_async(current.tenant, current.priority, prompts)
+            try:
+                yield
+            finally:
+                self.gemini.release(grant)
+
+        return pack_slot
+
+    def stats(self) -> dict:
+        return {**self.limiter.stats(), "resources": {"gemini": self.gemini.stats(), "local": self.local.stats()}}
+
+    def to_prometheus(self, prefix: str = "prompt_optimizer") -> str:
+        """Queue depths, slot usage and request outcomes in Prometheus text format."""
+        resources = {"gemini": self.gemini.stats(), "local": self.local.stats()}
+        lines = [f"# TYPE {prefix}_scheduler_waiting gauge"]
+        for name, stats in resources.items():
+            for priority, depth in stats["waiting"].items():
+                lines.append(f'{prefix}_scheduler_waiting{{resource="{name}",priority="{priority}"}} {depth}')
+        for gauge in ("in_use", "capacity"):
+            lines.append(f"# TYPE {prefix}_scheduler_{gauge} gauge")
+            lines.extend(f'{prefix}_scheduler_{gauge}{{resource="{name}"}} {stats[gauge]}' for name, stats in resources.items())
+        lines.append(f"# TYPE {prefix}_scheduler_requests_total counter")
+        for name, stats in resources.items():
+            for outcome in ("granted", "rejected", "abandoned"):
+                lines.append(f'{prefix}_scheduler_requests_total{{resource="{name}",outcome="{outcome}"}} {stats[outcome]}')
+        return "\n".join(lines) + "\n"
+
+def build_scheduler(local_slots: int = SCHEDULER_LOCAL_SLOTS) -> RequestScheduler | None:
+    """Creates the scheduler configured in src/config.py, or None when scheduling is disabled."""
+    if not SCHEDULER_ENABLED:
+        return None
+    return RequestScheduler(local_slots=local_slots, tenant_limits=parse_tenant_limits(SCHEDULER_TENANT_LIMITS))
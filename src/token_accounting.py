@@ -0,0 +1,161 @@
+# src/token_accounting.py
+"""
+Input token counting with a cached local tokenizer, falling back to an approximate count.
+"""
+
+import os
+import re
+
+import numpy as np
+
+from src.config import (
+    EMBEDDING_MODEL_NAME,
+    TOKEN_COUNT_CACHE_SIZE,
+    TOKEN_COUNT_CHUNK_CHARS,
+    TOKENIZER_LOWERCASE,
+    TOKENIZER_VOCAB_PATH,
+)
+from src.gemini_client import approximate_token_count
+from src.result_cache import LRUCache
+
+APPROXIMATE = "approximate"
+
+# Where a long text may be cut: at the whitespace before a word, after the end of a
+# sentence or line, or (for very long sentences) before any word
+_SENTENCE_CUT = re.compile(r"(?<=[.!?\n])\s*?(?=\s\S)")
+_WORD_CUT = re.compile(r"\s(?=\S)")
+
+# --- Loading ---
+
+def resolve_vocab_path(model_name: str = EMBEDDING_MODEL_NAME, vocab_path: str = TOKENIZER_VOCAB_PATH) -> str | None:
+    """
+    Finds the tokenizer file to count with, without downloading anything.
+
+    Args:
+        model_name: The embedding model whose files are used when vocab_path is empty.
+        vocab_path: An explicit vocab.txt or tokenizer.json.
+
+    Returns:
+        The path, or None when the model's files are not available locally.
+    """
+    if vocab_path:
+        return vocab_path
+    for file_name in ("tokenizer.json", "vocab.txt"):
+        if os.path.isdir(model_name):
+            candidate = os.path.join(model_name, file_name)
+        else:
+            try:
+                from huggingface_hub import try_to_load_from_cache
+            except ImportError:
+                return None
+            repo_id = model_name if "/" in model_name else f"sentence-transformers/{model_name}"
+            candidate = try_to_load_from_cache(repo_id, file_name)
+        if isinstance(candidate, str) and os.path.exists(candidate):
+            return candidate
+    return None
+
+def load_tokenizer(path: str, lowercase: bool = TOKENIZER_LOWERCASE):
+    """Loads a tokenizers.Tokenizer from a tokenizer.json or a WordPiece vocab.txt, with truncation and padding off."""
+    from tokenizers import Tokenizer, normalizers, pre_tokenizers
+    from tokenizers.models import WordPiece
+
+    if path.endswith(".json"):
+        tokenizer = Tokenizer.from_file(path)
+    else:
+        # A bare vocab file: rebuild the BERT pipeline around it
+        tokenizer = Tokenizer(WordPiece.from_file(path, unk_token="[UNK]"))
+        tokenizer.normalizer = normalizers.BertNormalizer(lowercase=lowercase)
+        tokenizer.pre_tokenizer = pre_tokenizers.BertPreTokenizer()
+    tokenizer.no_truncation()
+    tokenizer.no_padding()
+    return tokenizer
+
+# --- Counting ---
+
+def split_long_text(text: str, max_chars: int = TOKEN_COUNT_CHUNK_CHARS) -> list[str]:
+    """
+    Cuts text into sentence pieces of at most max_chars; a longer sentence is cut before a
+    word (a single longer word stays whole). Joining the pieces gives back the text exactly.
+    """
+    cuts = [0]
+    for m in _SENTENCE_CUT.finditer(text):
+        if m.end() > cuts[-1]:
+            cuts.append(m.end())
+    cuts.append(len(text))
+
+    pieces = []
+    for start, end in zip(cuts, cuts[1:]):
+        while end - start > max_chars:
+            inside = [m.start() for m in _WORD_CUT.finditer(text, start + 1, start + max_chars + 1)]
+            after = _WORD_CUT.search(text, start + max_chars, end) if not inside else None
+            cut = inside[-1] if inside else (after.start() if after else end)
+            pieces.append(text[start:cut])
+            start = cut
+        if end > start:
+            pieces.append(text[start:end])
+    return pieces
+
+class TokenCounter:
+    """
+    Memoised input token counts for single prompts, batches and long documents.
+
+    Thread-safe; one instance is shared by the engine, the live preview and services.
+    With tokenizer=None the counts use the word-and-punctuation approximation.
+    """
+
+    def __init__(self, tokenizer=None, name: str = APPROXIMATE,
+                 max_cached: int = TOKEN_COUNT_CACHE_SIZE, chunk_chars: int = TOKEN_COUNT_CHUNK_CHARS):
+        self.tokenizer = tokenizer
+        self.name = name if tokenizer is not None else APPROXIMATE
+        self.chunk_chars = chunk_chars
+        self._counts = LRUCache(max_entries=max_cached, ttl_seconds=float("inf"))
+
+    def _encode(self, texts: list) -> list[int]:
+        if self.tokenizer is None:
+            return [approximate_token_count(text) for text in texts]
+        # encode_batch_fast (tokenizers >= 0.20) skips the character offsets, which are never read here
+        encode_batch = getattr(self.tokenizer, "encode_batch_fast", self.tokenizer.encode_batch)
+        return [len(encoding) for encoding in encode_batch(texts, add_special_tokens=False)]
+
+    def count(self, text: str) -> int:
+        """Input tokens in one text."""
+        return int(self.count_many([text])[0])
+
+    def count_many(self, texts: list, memoise: bool = True) -> np.ndarray:
+        """
+        Input tokens per text, tokenising all cache misses in one batch.
+
+        Args:
+            texts: The prompt or document strings.
+            memoise: Whether to store the new counts; streamed document sections, which
+                rarely repeat, pass False so they do not evict prompts from the cache.
+
+        Returns:
+            An int64 array with one count per text; its sum is the batch total.
+        """
+        pieces = [split_long_text(text, self.chunk_chars) if len(text) > self.chunk_chars else [text] for text in texts]
+        counts = {piece: self._counts.get(piece) for text_pieces in pieces for piece in text_pieces}
+        missing = [piece for piece, n in counts.items() if n is None]
+        if missing:
+            for piece, n in zip(missing, self._encode(missing)):
+                counts[piece] = n
+                if memoise:
+                    self._counts.set(piece, n)
+        return np.fromiter((sum(counts[p] for p in text_pieces) for text_pieces in pieces), dtype=np.int64, count=len(texts))
+
+    def cached_texts(self) -> int:
+        return len(self._counts)
+
+def load_token_counter(model_name: str = EMBEDDING_MODEL_NAME, vocab_path: str = TOKENIZER_VOCAB_PATH) -> TokenCounter:
+    """
+    Builds the TokenCounter configured in src/config.py.
+
+    Returns:
+        A counter over the local vocab file, named after the tokenizer type and vocabulary
+        size (e.g. "wordpiece-30522"), or the approximate counter when no vocab file is found.
+    """
+    path = resolve_vocab_path(model_name, vocab_path)
+    if path is None:
+        return TokenCounter()
+    tokenizer = load_tokenizer(path)
+    return TokenCounter(tokenizer, f"{type(tokenizer.model).__name__.lower()}-{tokenizer.get_vocab_size()}")
@@ -1,6 +1,15 @@
 # src/ui_components.py
 
+import os
+import time
+
 import streamlit as st
+import streamlit.components.v1 as components
+
+# Text area that reports keystrokes after a pause (src/components/live_prompt_input/index.html)
+_live_prompt_input = components.declare_component(
+    "live_prompt_input", path=os.path.join(os.path.dirname(__file__), "components", "live_prompt_input")
+)
 
 def set_page_config_and_css():
     """Sets Streamlit page configuration and injects custom CSS for styling."""
@@ -191,14 +200,21 @@ def render_main_header():
         unsafe_allow_html=True
     )
 
-def render_results_section():
+def render_results_section(analysis: dict | None, mode_label: str = "Unknown Mode"):
     """
     Renders the results display section of the application with enhanced visuals.
-    Assumes results are stored in st.session_state.
+
+    Args:
+        analysis: The latest analysis of this session (a row from the history log, or a
+            dict with the same energy, prompt, similarity and llm_size fields), or None.
+        mode_label: The optimization method label shown in the heading.
     """
-    if 'original_energy' in st.session_state and st.session_state['original_energy'] is not None:
+    if analysis is not None:
+        # Rows logged before token accounting have no token counts
+        original_tokens = f" · {analysis['original_tokens']} input tokens" if analysis.get('original_tokens') else ""
+        optimized_tokens = f" ({analysis['optimized_tokens']} input tokens)" if analysis.get('optimized_tokens') else ""
         st.markdown('<div class="results-section-bg">', unsafe_allow_html=True)
-        st.markdown(f'<h2 style="color: #065f46;"><img src="https://api.iconify.design/lucide/trending-up.svg?color=%23065f46" width="32" height="32" /> Analysis Results ({st.session_state.get("optimization_mode_display", "Unknown Mode")})</h2>', unsafe_allow_html=True)
+        st.markdown(f'<h2 style="color: #065f46;"><img src="https://api.iconify.design/lucide/trending-up.svg?color=%23065f46" width="32" height="32" /> Analysis Results ({mode_label})</h2>', unsafe_allow_html=True)
 
         col1, col2 = st.columns(2)
 
@@ -208,11 +224,11 @@ def render_results_section():
                 <div class="metric-card energy-original-card">
                     <h3 style="color: #1f2937;">Original Prompt Energy Estimate:</h3>
                     <p class="metric-value-large blue">
-                        {st.session_state['original_energy']:.4f} kWh
+                        {analysis['original_energy']:.4f} kWh
                         <img src="https://api.iconify.design/lucide/zap.svg?color=%232563eb" width="32" height="32" />
                     </p>
                     <p style="color: #4b5563; font-size: 0.9rem;">
-                        Estimated for a <span style="font-weight: 600; color: #1e40af;">{st.session_state['llm_size_display']}</span> LLM.
+                        Estimated for a <span style="font-weight: 600; color: #1e40af;">{analysis['llm_size']}</span> LLM{original_tokens}.
                     </p>
                 </div>
                 """,
@@ -225,11 +241,11 @@ def render_results_section():
                 <div class="metric-card energy-optimized-card">
                     <h3 style="color: #1f2937;">Optimized Energy Estimate:</h3>
                     <p class="metric-value-large green">
-                        {st.session_state['optimized_energy']:.4f} kWh
+                        {analysis['optimized_energy']:.4f} kWh
                         <img src="https://api.iconify.design/lucide/leaf.svg?color=%2310b981" width="32" height="32" />
                     </p>
                     <p style="color: #4b5563; font-size: 0.9rem;">
-                        Using the suggested optimized prompt.
+                        Using the suggested optimized prompt{optimized_tokens}.
                     </p>
                 </div>
                 """,
@@ -239,7 +255,7 @@ def render_results_section():
         st.markdown("---")
 
         st.markdown('<h3 style="color: #1f2937;"><img src="https://api.iconify.design/lucide/sparkles.svg?color=%23facc15" width="24" height="24" /> Optimized Prompt Suggestion:</h3>', unsafe_allow_html=True)
-        st.info(f"**\"{st.session_state['optimized_prompt']}\"**")
+        st.info(f"**\"{analysis['optimized_prompt']}\"**")
         st.markdown(
             """
             <p style="color: #4b5563; font-size: 0.9rem;">
@@ -253,8 +269,8 @@ def render_results_section():
 
         st.markdown('<h3 style="color: #1f2937;"><img src="https://api.iconify.design/lucide/bar-chart-2.svg?color=%238b5cf6" width="24" height="24" /> Energy Savings Analytics:</h3>', unsafe_allow_html=True)
 
-        energy_savings = st.session_state['original_energy'] - st.session_state['optimized_energy']
-        savings_percentage = (energy_savings / st.session_state['original_energy']) * 100 if st.session_state['original_energy'] else 0
+        energy_savings = analysis['original_energy'] - analysis['optimized_energy']
+        savings_percentage = (energy_savings / analysis['original_energy']) * 100 if analysis['original_energy'] else 0
 
         col_analytics1, col_analytics2, col_analytics3 = st.columns(3)
 
@@ -290,7 +306,7 @@ def render_results_section():
                 <div class="metric-card similarity-card">
                     <p style="font-size: 1.125rem; font-weight: 500; color: #4b5563;">Similarity to Original:</p>
                     <p class="metric-value-large orange">
-                        {st.session_state['similarity_score']:.0f}%
+                        {analysis['similarity_score']:.0f}%
                         <img src="https://api.iconify.design/lucide/check-circle.svg?color=%23f97316" width="32" height="32" />
                     </p>
                 </div>
@@ -298,7 +314,7 @@ def render_results_section():
                 unsafe_allow_html=True
             )
 
-        st.progress(float(st.session_state['similarity_score']) / 100)
+        st.progress(float(analysis['similarity_score']) / 100)
         st.markdown(
             """
             <p style="font-size: 0.9rem; color: #6b7280;">
@@ -308,3 +324,135 @@ def render_results_section():
             unsafe_allow_html=True
         )
         st.markdown('</div>', unsafe_allow_html=True) # Close results-section-bg div
+
+def render_document_sections(document: dict):
+    """
+    Renders the cost breakdown of a long prompt analysed in chunks.
+
+    Args:
+        document: A DocumentAnalysis as a dict (see src/long_documents.py).
+    """
+    with st.expander(f"📄 Long Prompt Breakdown ({document['chunks']} sections)", expanded=True):
+        col1, col2, col3 = st.columns(3)
+        col1.metric("Input Tokens", f"{document['tokens']:,}")
+        col2.metric("Whole-Document Energy", f"{document['energy']:.4f} kWh")
+        col3.metric("Closest Match", f"{document['similarity_score']:.0f}%")
+        st.markdown("**Costliest sections**")
+        st.dataframe(
+            [
+                {
+                    "section": s["index"] + 1,
+                    "characters": f"{s['start_char']}-{s['end_char']}",
+                    "tokens": s["tokens"],
+                    "kWh": round(s["energy"], 4),
+                    "share": f"{s['share_pct']:.1f}%",
+                    "starts with": s["preview"],
+                }
+                for s in document["sections"]
+            ],
+            hide_index=True, width="stretch",
+        )
+        st.caption("Each section is priced on its own; trimming the costliest ones saves the most energy.")
+
+def live_prompt_input(value: str, placeholder: str, height: int, debounce_ms: float, key: str) -> str:
+    """
+    Renders the prompt box used while the live preview is on. Unlike st.text_area, which
+    only sends its text on blur or Ctrl+Enter, it reruns the app once typing has paused
+    for debounce_ms.
+
+    Returns:
+        The latest text reported by the browser (value until the first report).
+    """
+    return _live_prompt_input(value=value, placeholder=placeholder, height=height, debounce_ms=debounce_ms,
+                              key=key, default=value)
+
+def render_live_preview(preview):
+    """
+    Renders the compact live-preview panel shown while typing.
+
+    Args:
+        preview: A src.live_preview.LivePreview, or None while the first estimate is pending.
+    """
+    if preview is None:
+        st.caption("Live preview will appear once you pause typing.")
+        return
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Complexity", f"{preview.complexity:.0f} / 100")
+    col2.metric("Energy Estimate", f"{preview.energy:.4f} kWh")
+    col3.metric("Closest Match", f"{preview.similarity_score:.0f}%")
+    if preview.optimized_prompt:
+        st.caption(f"Closest optimized prompt: \"{preview.optimized_prompt}\"")
+    st.caption(
+        f"Live local estimate for a {preview.llm_size} LLM · "
+        f"{preview.chunks_encoded} of {preview.chunks_total} sentence chunks re-encoded. "
+        "Press Analyze for the full result."
+    )
+
+def render_developer_panel(traces: list, pipeline_stats: dict):
+    """
+    Renders the developer panel (in the sidebar) with per-stage timings of recent analyses.
+
+    Args:
+        traces: Recent request traces from src.instrumentation (oldest first).
+        pipeline_stats: Aggregate stage statistics from metrics.to_json().
+    """
+    with st.sidebar.expander("🛠️ Developer: Pipeline Timings", expanded=False):
+        if not traces:
+            st.caption("No analyses recorded yet.")
+            return
+        stage_names = sorted({name for t in traces for name in t["stages_ms"]})
+        rows = []
+        for t in reversed(traces):
+            row = {
+                "time": time.strftime("%H:%M:%S", time.localtime(t["started_at"])),
+                "request": t["name"],
+                "mode": t["labels"].get("mode", ""),
+                "cached": bool(t["labels"].get("cache_hit")),
+                "total ms": round(t["total_ms"], 2),
+            }
+            row.update({f"{name} ms": round(t["stages_ms"].get(name, 0.0), 2) for name in stage_names})
+            rows.append(row)
+        st.markdown(f"**Last {len(rows)} requests**")
+        st.dataframe(rows, hide_index=True, width="stretch")
+
+        st.markdown("**All requests by stage**")
+        st.dataframe(
+            [
+                {"stage": name, "count": s["count"], "mean ms": round(s["mean_ms"], 2),
+                 "p50 ms ≤": round(s["p50_ms"], 2), "p99 ms ≤": round(s["p99_ms"], 2)}
+                for name, s in pipeline_stats["stages"].items()
+            ],
+            hide_index=True, width="stretch",
+        )
+
+def render_history_section(analyses: list, totals: dict):
+    """
+    Renders this session's analysis history from the history log.
+
+    Args:
+        analyses: The session's recent analyses, newest first.
+        totals: The session's aggregate row from AnalysisHistory.totals().
+    """
+    if not analyses:
+        return
+    with st.expander(f"📜 Session History ({totals['analyses']} analyses)", expanded=False):
+        col1, col2, col3 = st.columns(3)
+        col1.metric("Analyses", totals["analyses"])
+        col2.metric("Total Energy Saved", f"{totals['saved_kwh']:.4f} kWh")
+        col3.metric("Original Energy", f"{totals['original_kwh']:.4f} kWh")
+        st.dataframe(
+            [
+                {
+                    "time": time.strftime("%H:%M:%S", time.localtime(a["created_at"])),
+                    "prompt": a["original_prompt"],
+                    "mode": a["mode"],
+                    "LLM": a["llm_size"],
+                    "original kWh": round(a["original_energy"], 4),
+                    "optimized kWh": round(a["optimized_energy"], 4),
+                    "saved kWh": round(a["energy_saved"], 4),
+                    "ms": round(a["duration_ms"], 1) if a["duration_ms"] is not None else None,
+                }
+                for a in analyses
+            ],
+            hide_index=True, width="stretch",
+        )
@@ -0,0 +1,40 @@
+import pytest
+
+from src.compression import compress_prompt, remove_fillers
+from utils.fake_embedding_model import HashingEmbeddingModel
+
+@pytest.fixture(scope="module")
+def model():
+    return HashingEmbeddingModel()
+
+@pytest.mark.parametrize("sentence", [
+    "hello world program in python",
+    "Write a thank you note to my teacher.",
+    "Thanks to the rain, crops grew.",
+    "Write a please-and-thank-you sign",
+    "The report was not actually finished.",
+    "Make the heading very large.",
+])
+def test_content_words_are_kept(sentence):
+    assert remove_fillers(sentence) == sentence
+
+@pytest.mark.parametrize("sentence, expected", [
+    ("Hi!", ""),
+    ("Hello, can you please summarise this?", "Summarise this?"),
+    ("Summarise this, thanks in advance.", "Summarise this."),
+    ("Thanks in advance.", ""),
+    ("Please, write a poem.", "Write a poem."),
+    ("Explain this in order to teach it.", "Explain this to teach it."),
+])
+def test_fillers_are_removed(sentence, expected):
+    assert remove_fillers(sentence) == expected
+
+def test_compression_keeps_meaning(model):
+    compressed, _ = compress_prompt("Thanks to the rain, crops grew. Explain why.", model)
+    assert compressed == "Thanks to the rain, crops grew. Explain why."
+
+def test_compression_keeps_code_and_lines(model):
+    prompt = "Please fix this function:\n```python\ndef f(x):\n    return x  # please keep\n```\n- Keep the `please` flag"
+    compressed, _ = compress_prompt(prompt, model)
+    assert "def f(x):\n    return x  # please keep" in compressed
+    assert compressed.splitlines()[-1] == "- Keep the `please` flag"
@@ -0,0 +1,34 @@
+import pytest
+
+from data.optimized_prompts import example_optimized_prompts
+from src.ann_index import build_example_index
+from src.engine import MODE_COMPRESS, MODE_LOCAL, PromptOptimizer
+from utils.fake_embedding_model import HashingEmbeddingModel
+
+PROMPTS = [
+    "Can you please explain how the environmental impact of large language models is measured?",
+    "Write a short poem about the sea.",
+    "Summarise the main causes of climate change in three bullet points.",
+    "Write a short poem about the sea.",
+    "Translate 'good morning' into French, Spanish and German.",
+]
+
+@pytest.fixture
+def optimizer():
+    model = HashingEmbeddingModel()
+    index = build_example_index(model.encode(example_optimized_prompts), assume_normalised=True)
+    return PromptOptimizer(model, example_optimized_prompts, index, api_key=None, result_cache=None)
+
+@pytest.mark.parametrize("mode", [MODE_LOCAL, MODE_COMPRESS])
+@pytest.mark.parametrize("llm_size", ["small", "large"])
+def test_batched_and_single_scores_match(optimizer, mode, llm_size):
+    batched = optimizer.analyze_many(PROMPTS, llm_size, mode)
+    single = [optimizer.analyze(prompt, llm_size, mode) for prompt in PROMPTS]
+    assert [r.to_dict() for r in batched] == pytest.approx([r.to_dict() for r in single])
+
+@pytest.mark.parametrize("prompts", [["Write a poem.", "   "], [""]])
+def test_blank_prompts_are_rejected(optimizer, prompts):
+    with pytest.raises(ValueError):
+        optimizer.analyze_many(prompts)
+    with pytest.raises(ValueError):
+        optimizer.analyze(prompts[-1])
@@ -0,0 +1,54 @@
+import sqlite3
+
+import pytest
+
+from src.engine import AnalysisResult
+from src.history import AnalysisHistory
+
+def _result(prompt: str) -> AnalysisResult:
+    return AnalysisResult(prompt, prompt, 100.0, 10.0, 10.0, 0.001, 0.001, "medium", "local")
+
+@pytest.fixture
+def history(tmp_path):
+    history = AnalysisHistory(str(tmp_path / "history.db"), batch_size=100, flush_seconds=0, max_buffered=3)
+    # Fail at once on a locked file instead of waiting out the busy timeout
+    history._connection().execute("PRAGMA busy_timeout = 0")
+    yield history
+    history.close()
+
+@pytest.fixture
+def lock(history):
+    conn = sqlite3.connect(history.path, isolation_level=None)
+    conn.execute("BEGIN IMMEDIATE")
+    yield conn
+    conn.close()
+
+def test_failed_flush_keeps_rows_for_retry(history, lock):
+    history.record(_result("first"))
+    history.record(_result("second"))
+    with pytest.raises(sqlite3.OperationalError):
+        history.flush()
+
+    lock.execute("ROLLBACK")
+    assert history.flush() == 2
+    assert [row["original_prompt"] for row in history.recent(limit=5)] == ["second", "first"]
+
+def test_failed_flush_drops_oldest_rows_past_the_cap(history, lock):
+    for prompt in ("a", "b", "c"):
+        history.record(_result(prompt))
+    with pytest.raises(sqlite3.OperationalError):
+        history.flush()
+    history.record(_result("d"))
+    history.record(_result("e"))
+    with pytest.raises(sqlite3.OperationalError):
+        history.flush()
+
+    lock.execute("ROLLBACK")
+    assert history.flush() == 3
+    assert sorted(row["original_prompt"] for row in history.recent(limit=5)) == ["c", "d", "e"]
+
+def test_queries_survive_a_locked_file(history, lock):
+    history.record(_result("first"))
+    assert history.recent() == []  # Unwritten rows are not visible yet
+    lock.execute("ROLLBACK")
+    assert [row["original_prompt"] for row in history.recent()] == ["first"]
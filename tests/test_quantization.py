@@ -0,0 +1,35 @@
+import numpy as np
+import pytest
+
+from benchmarks.ann_recall import make_clustered_embeddings
+from src.ann_index import build_example_index, normalise_rows
+from src.quantization import evaluate_recall
+
+@pytest.fixture(scope="module")
+def corpus():
+    embeddings = make_clustered_embeddings(2000, 96, num_clusters=16)
+    rng = np.random.default_rng(1)
+    queries = normalise_rows(embeddings[rng.integers(0, len(embeddings), 50)]
+                             + rng.standard_normal((50, 96)).astype(np.float32) * 0.05)
+    return embeddings, queries
+
+@pytest.mark.parametrize("index_type", ["flat", "ivf"])
+@pytest.mark.parametrize("quantization, rescore_candidates, min_recall", [
+    ("int8", 0, 0.9),
+    ("int8", 64, 0.99),
+    ("pq", 0, 0.7),
+    ("pq", 64, 0.99),
+])
+def test_recall_above_threshold(corpus, index_type, quantization, rescore_candidates, min_recall):
+    embeddings, queries = corpus
+    index = build_example_index(embeddings, index_type, assume_normalised=True, quantization=quantization,
+                                rescore_candidates=rescore_candidates)
+    metrics = evaluate_recall(index, embeddings, queries, k=5)
+    assert metrics["recall_at_k"] >= min_recall
+    assert metrics["code_bytes"] < embeddings.nbytes
+
+def test_memory_counts_float32_rows_in_ram(corpus):
+    embeddings, queries = corpus
+    index = build_example_index(embeddings, "flat", assume_normalised=True, quantization="int8", rescore_candidates=64)
+    metrics = evaluate_recall(index, embeddings, queries, k=5)
+    assert metrics["memory_bytes"] == metrics["code_bytes"] + embeddings.nbytes
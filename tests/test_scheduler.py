@@ -0,0 +1,40 @@
+import pytest
+
+from src.scheduler import BATCH, INTERACTIVE, FairResource, QueueFullError
+
+def _grant_order(resource, held, requests):
+    """Queues (label, tenant, priority) requests behind `held`, then releases each grant in turn."""
+    granted, waiters = [], {}
+    for label, tenant, priority in requests:
+        waiters[label] = resource._submit(tenant, priority, 1.0, 1, lambda label=label: granted.append(label))
+    resource.release(held)
+    while len(granted) < len(requests):
+        released = len(granted)
+        resource.release(waiters[granted[-1]])
+        assert len(granted) == released + 1
+    resource.release(waiters[granted[-1]])
+    return granted
+
+def test_tenants_share_fairly():
+    resource = FairResource("test", capacity=1)
+    held = resource.acquire("busy")
+    order = _grant_order(resource, held, [("busy1", "busy", INTERACTIVE), ("busy2", "busy", INTERACTIVE),
+                                          ("busy3", "busy", INTERACTIVE), ("quiet1", "quiet", INTERACTIVE)])
+    # The quiet tenant's one request overtakes the busy tenant's backlog
+    assert order == ["quiet1", "busy1", "busy2", "busy3"]
+
+def test_interactive_before_batch():
+    resource = FairResource("test", capacity=1)
+    held = resource.acquire("a")
+    order = _grant_order(resource, held, [("batch1", "b", BATCH), ("interactive1", "c", INTERACTIVE)])
+    assert order == ["interactive1", "batch1"]
+
+def test_give_up_rolls_back_fair_share():
+    resource = FairResource("test", capacity=1)
+    held = resource.acquire("a")
+    with pytest.raises(QueueFullError):
+        resource.acquire("a", cost=100.0, timeout=0.01)
+    order = _grant_order(resource, held, [("b1", "b", INTERACTIVE), ("b2", "b", INTERACTIVE),
+                                          ("b3", "b", INTERACTIVE), ("a1", "a", INTERACTIVE)])
+    # Without the rollback, tenant a would wait behind 100 prompts of work it never got
+    assert order == ["b1", "b2", "a1", "b3"]
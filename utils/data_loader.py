@@ -1,16 +1,180 @@
 import streamlit as st
+import numpy as np
 from data.optimized_prompts import example_optimized_prompts
+from src.config import PROMPT_LIBRARY_DIR
+from src.embedding_backends import EMBEDDING_STORE_KEY, load_embedding_backend
+from src.embedding_service import BatchEmbeddingService
+from src.lazy_loading import BackgroundLoader, WarmingProxy
+from utils.embedding_store import load_or_build_embeddings
+from src.ann_index import build_example_index
+from src.engine import PromptOptimizer
+from src.result_cache import ResultCache, build_result_cache, pipeline_fingerprint
+from src.near_duplicates import build_near_duplicate_cache
+from src.energy_model import load_energy_model
+from src.history import AnalysisHistory, open_history
+from src.live_preview import IncrementalAnalyzer
+from src.prompt_library import PromptLibrary, has_library
+from src.scheduler import RequestScheduler, build_scheduler
+from src.token_accounting import TokenCounter, load_token_counter
 
-@st.cache_data(show_spinner="Pre-computing example optimized prompt embeddings...")
-def get_example_optimized_embeddings(prompts: list, _model) -> dict:
+# --- Model Initialization ---
+def _load_warm_embedding_model():
+    # The backend imports sentence_transformers (and torch) only here, off the page-render path
+    model = load_embedding_backend()
+    model.encode("warm-up")  # The first forward pass pays one-off kernel and tokenizer setup costs
+    return model
+
+@st.cache_resource(show_spinner=False)
+def load_embedding_service() -> BatchEmbeddingService:
+    """
+    Caches one batching embedding service, shared by all sessions, around the embedding model.
+    Returns immediately: the model is imported and loaded on a background thread, and the
+    first encode() waits for it, so the page can render while the model warms up.
+    """
+    return BatchEmbeddingService(WarmingProxy(BackgroundLoader(_load_warm_embedding_model, name="embedding-model-warmup")))
+
+@st.cache_resource(show_spinner="Loading example optimized prompt embeddings...")
+def get_example_optimized_embeddings(prompts: list, _model) -> np.ndarray:
     """
-    Generates and caches embeddings for the example optimized prompt database.
+    Loads embeddings for the example optimized prompt database from the on-disk store,
+    encoding only prompts that were added or changed since the store was last written.
+    Cached as a resource so the memory-mapped matrix is shared rather than copied per session.
     
     Args:
         prompts: A list of example optimized prompt strings.
-        _model: The SentenceTransformer model (prefixed with _ to avoid hashing issues).
+        _model: The BatchEmbeddingService or SentenceTransformer model (prefixed with _ to avoid hashing issues).
         
     Returns:
-        A dictionary where keys are "example_1", "example_2", etc., and values are their embeddings.
+        A read-only float32 matrix of L2-normalised embeddings; row i belongs to prompts[i].
+    """
+    return load_or_build_embeddings(prompts, _model, EMBEDDING_STORE_KEY)
+
+@st.cache_resource(show_spinner="Building example prompt search index...")
+def get_example_index(prompts: list, _example_embeddings: np.ndarray):
+    """
+    Builds and caches the nearest-neighbour index over the example prompt embeddings.
+    The index type and its recall/latency knobs come from the ANN_* settings in src/config.py.
+
+    Args:
+        prompts: The example optimized prompt strings (used as the cache key).
+        _example_embeddings: The normalised example matrix from get_example_optimized_embeddings.
+
+    Returns:
+        A FlatIndex or IVFIndex whose ids are positions in the example prompt list.
+    """
+    return build_example_index(_example_embeddings, assume_normalised=True)
+
+@st.cache_resource(show_spinner=False)
+def get_token_counter() -> TokenCounter:
+    """
+    Loads the local tokenizer once per process; its memoised counts are shared by all sessions.
+
+    Returns:
+        The TokenCounter (word-and-punctuation counts when no vocab file is available).
+    """
+    return load_token_counter()
+
+@st.cache_resource(show_spinner=False)
+def get_scheduler() -> RequestScheduler | None:
+    """
+    Creates the multi-tenant scheduler once per process, so every session's requests share
+    its rate limits and its fair queues for the local workers and the Gemini budget.
+
+    Returns:
+        The RequestScheduler, or None when SCHEDULER_ENABLED is off.
+    """
+    return build_scheduler()
+
+def _build_result_cache(prompts: list, energy_model) -> ResultCache | None:
+    # Cached results are scoped to the embedding backend, energy model and tokenizer as well as the library
+    return build_result_cache(prompts, pipeline_fingerprint(EMBEDDING_STORE_KEY, energy_model, get_token_counter().name))
+
+@st.cache_resource(show_spinner=False)
+def load_prompt_optimizer(prompts: list, _embedding_model, _example_index) -> PromptOptimizer:
+    """
+    Caches one PromptOptimizer engine shared by all Streamlit sessions.
+
+    Args:
+        prompts: The example optimized prompt strings (used as the cache key).
+        _embedding_model: The cached embedding service or model.
+        _example_index: The cached example prompt index.
+
+    Returns:
+        The warm PromptOptimizer instance.
+    """
+    energy_model = load_energy_model()
+    return PromptOptimizer(_embedding_model, prompts, _example_index,
+                           result_cache=_build_result_cache(prompts, energy_model), energy_model=energy_model,
+                           near_duplicates=build_near_duplicate_cache(), token_counter=get_token_counter(),
+                           scheduler=get_scheduler())
+
+@st.cache_resource(show_spinner="Loading the example prompt library...")
+def load_library_prompt_optimizer(_embedding_model) -> PromptOptimizer | None:
+    """
+    Caches one PromptOptimizer that follows the file-backed prompt library in
+    PROMPT_LIBRARY_DIR. A watcher thread hot-reloads edited shards and swaps the new
+    library into the shared engine without a restart.
+
+    Args:
+        _embedding_model: The cached embedding service or model.
+
+    Returns:
+        The PromptOptimizer, or None when the library directory has no shards.
+    """
+    if not has_library(PROMPT_LIBRARY_DIR):
+        return None
+    library = PromptLibrary(PROMPT_LIBRARY_DIR, _embedding_model)
+    snapshot = library.snapshot
+    energy_model = load_energy_model()
+    optimizer = PromptOptimizer(_embedding_model, snapshot.prompts, snapshot.index,
+                                result_cache=_build_result_cache(snapshot.prompts, energy_model), energy_model=energy_model,
+                                near_duplicates=build_near_duplicate_cache(), token_counter=get_token_counter(),
+                                scheduler=get_scheduler())
+    optimizer.attach_library(library.watch())
+    return optimizer
+
+def get_prompt_optimizer(prompts: list, _embedding_model) -> PromptOptimizer:
+    """
+    Builds (on first call) and returns the shared PromptOptimizer, loading the example
+    embeddings and index on demand rather than before the page renders. The file-backed
+    prompt library is used when present; otherwise `prompts` is the example library.
+
+    Args:
+        prompts: The built-in example optimized prompt strings.
+        _embedding_model: The cached embedding service or model.
+
+    Returns:
+        The warm PromptOptimizer instance.
+    """
+    optimizer = load_library_prompt_optimizer(_embedding_model)
+    if optimizer is not None:
+        return optimizer
+    example_embeddings = get_example_optimized_embeddings(prompts, _embedding_model)
+    example_index = get_example_index(prompts, example_embeddings)
+    return load_prompt_optimizer(prompts, _embedding_model, example_index)
+
+@st.cache_resource(show_spinner=False)
+def get_live_analyzer(prompts: list, _optimizer: PromptOptimizer) -> IncrementalAnalyzer:
+    """
+    Caches one live-preview analyzer shared by all sessions, so sentence chunks typed in
+    one session are already encoded for the next.
+
+    Args:
+        prompts: The example optimized prompt strings (used as the cache key).
+        _optimizer: The shared PromptOptimizer.
+
+    Returns:
+        The IncrementalAnalyzer instance.
+    """
+    return IncrementalAnalyzer(_optimizer)
+
+@st.cache_resource(show_spinner=False)
+def get_analysis_history() -> AnalysisHistory | None:
+    """
+    Opens the analysis history log once per process; all sessions append to the same
+    batched writer.
+
+    Returns:
+        The AnalysisHistory, or None when HISTORY_DB_PATH is empty.
     """
-    return {f"example_{i+1}": _model.encode(p) for i, p in enumerate(prompts)}
+    return open_history()
@@ -0,0 +1,151 @@
+# utils/embedding_store.py
+
+import hashlib
+import json
+import os
+import re
+import time
+import uuid
+
+import numpy as np
+
+from src.ann_index import normalise_rows
+from src.config import EMBEDDING_CACHE_DIR, EMBEDDING_CACHE_KEEP
+
+# Bump when the on-disk layout changes; older files are ignored and rebuilt
+STORE_FORMAT_VERSION = 1
+
+def prompt_hash(prompt: str) -> str:
+    """Stable content hash for a single prompt."""
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+
+def prompt_set_hash(prompt_hashes: list[str]) -> str:
+    """Order-sensitive hash of a whole prompt set (row i of the store belongs to prompt i)."""
+    digest = hashlib.sha256()
+    for h in prompt_hashes:
+        digest.update(h.encode("ascii"))
+    return digest.hexdigest()
+
+def _safe_model_name(model_name: str) -> str:
+    return re.sub(r"[^A-Za-z0-9_.-]", "_", model_name)
+
+def _store_paths(cache_dir: str, model_name: str, set_hash: str) -> tuple[str, str]:
+    stem = os.path.join(cache_dir, f"{_safe_model_name(model_name)}-{set_hash[:16]}")
+    return stem + ".npy", stem + ".json"
+
+def _read_metadata(meta_path: str) -> dict | None:
+    try:
+        with open(meta_path, "r", encoding="utf-8") as f:
+            metadata = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if metadata.get("format_version") != STORE_FORMAT_VERSION:
+        return None
+    return metadata
+
+def _existing_stores(cache_dir: str, model_name: str) -> list[tuple[dict, str]]:
+    """Returns (metadata, .npy path) for every valid store of this model, newest first."""
+    prefix = _safe_model_name(model_name) + "-"
+    stores = []
+    if not os.path.isdir(cache_dir):
+        return stores
+    for name in os.listdir(cache_dir):
+        if not (name.startswith(prefix) and name.endswith(".json")):
+            continue
+        metadata = _read_metadata(os.path.join(cache_dir, name))
+        npy_path = os.path.join(cache_dir, name[:-len(".json")] + ".npy")
+        if metadata and metadata.get("model_name") == model_name and os.path.exists(npy_path):
+            stores.append((metadata, npy_path))
+    stores.sort(key=lambda item: item[0].get("created_at", 0), reverse=True)
+    return stores
+
+def _atomic_write_bytes(path: str, write_fn):
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            write_fn(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def _prune_old_stores(cache_dir: str, model_name: str, keep: int):
+    for metadata, npy_path in _existing_stores(cache_dir, model_name)[keep:]:
+        # Unlinking is safe even if another worker still has the file memory-mapped
+        for path in (npy_path, npy_path[:-len(".npy")] + ".json"):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+def load_or_build_embeddings(prompts: list, model, model_name: str,
+                             cache_dir: str = EMBEDDING_CACHE_DIR) -> np.ndarray:
+    """
+    Returns normalised embeddings for the prompts from a versioned on-disk store,
+    computing only the rows that no existing store for this model already holds.
+
+    The store is a float32 .npy matrix plus a .json metadata header keyed by model name
+    and prompt-set hash. It is memory-mapped read-only, so worker processes share the
+    same pages instead of each holding a private copy.
+
+    Args:
+        prompts: The prompt strings; row i of the result belongs to prompts[i].
+        model: Anything with an encode(list_of_str) method (e.g. a SentenceTransformer).
+        model_name: The embedding model name, part of the store key.
+        cache_dir: Directory holding the store files.
+
+    Returns:
+        A read-only, memory-mapped (N, D) float32 matrix with unit-length rows.
+    """
+    hashes = [prompt_hash(p) for p in prompts]
+    set_hash = prompt_set_hash(hashes)
+    npy_path, meta_path = _store_paths(cache_dir, model_name, set_hash)
+
+    metadata = _read_metadata(meta_path)
+    if metadata and metadata.get("prompt_set_hash") == set_hash and os.path.exists(npy_path):
+        return np.load(npy_path, mmap_mode="r")
+
+    # Reuse rows from earlier stores of the same model; only new or edited prompts are encoded
+    reusable = {}
+    for old_metadata, old_npy_path in _existing_stores(cache_dir, model_name):
+        old_matrix = np.load(old_npy_path, mmap_mode="r")
+        for row, h in enumerate(old_metadata.get("prompt_hashes", [])):
+            reusable.setdefault(h, (old_matrix, row))
+
+    missing = [i for i, h in enumerate(hashes) if h not in reusable]
+    new_rows = None
+    if missing:
+        new_rows = normalise_rows(np.asarray(model.encode([prompts[i] for i in missing])))
+
+    dim = new_rows.shape[1] if new_rows is not None else (
+        next(iter(reusable.values()))[0].shape[1] if reusable else 0
+    )
+    matrix = np.empty((len(prompts), dim), dtype=np.float32)
+    missing_positions = {i: j for j, i in enumerate(missing)}
+    for i, h in enumerate(hashes):
+        if i in missing_positions:
+            matrix[i] = new_rows[missing_positions[i]]
+        else:
+            old_matrix, row = reusable[h]
+            matrix[i] = old_matrix[row]
+
+    os.makedirs(cache_dir, exist_ok=True)
+    _atomic_write_bytes(npy_path, lambda f: np.save(f, matrix))
+    metadata = {
+        "format_version": STORE_FORMAT_VERSION,
+        "model_name": model_name,
+        "prompt_set_hash": set_hash,
+        "prompt_hashes": hashes,
+        "count": len(prompts),
+        "dim": dim,
+        "dtype": "float32",
+        "created_at": time.time(),
+        "recomputed": len(missing),
+    }
+    # The header is written last, so a reader never sees metadata for a half-written matrix
+    _atomic_write_bytes(meta_path, lambda f: f.write(json.dumps(metadata).encode("utf-8")))
+    _prune_old_stores(cache_dir, model_name, EMBEDDING_CACHE_KEEP)
+
+    return np.load(npy_path, mmap_mode="r")
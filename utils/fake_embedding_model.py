@@ -0,0 +1,46 @@
+# utils/fake_embedding_model.py
+"""
+Local stand-in for the sentence-transformers embedding model (hashed bag of words, no download).
+"""
+
+import hashlib
+import time
+
+import numpy as np
+
+class HashingEmbeddingModel:
+    """Implements the encode() and get_sentence_embedding_dimension() calls the engine uses."""
+
+    def __init__(self, dimension: int = 384, latency_ms: float = 0.0):
+        self.dimension = dimension
+        self.latency_ms = latency_ms
+
+    @property
+    def store_key(self) -> str:
+        """Embedding store and result cache key; never the real model's."""
+        return f"hashing-{self.dimension}"
+
+    def _embed(self, text: str) -> np.ndarray:
+        vector = np.zeros(self.dimension, dtype=np.float32)
+        for word in text.lower().split():
+            vector[int.from_bytes(hashlib.blake2b(word.encode("utf-8"), digest_size=4).digest(), "little") % self.dimension] += 1
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _spin(self, texts: int):
+        # Busy-waits rather than sleeping, so the cost competes for the CPU like real inference
+        deadline = time.perf_counter() + texts * self.latency_ms / 1000
+        while time.perf_counter() < deadline:
+            pass
+
+    def encode(self, sentences, batch_size: int = 32, **kwargs) -> np.ndarray:
+        if isinstance(sentences, str):
+            self._spin(1)
+            return self._embed(sentences)
+        self._spin(len(sentences))
+        if not len(sentences):
+            return np.empty((0, self.dimension), dtype=np.float32)
+        return np.vstack([self._embed(text) for text in sentences])
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.dimension
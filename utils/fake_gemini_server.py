@@ -0,0 +1,96 @@
+# utils/fake_gemini_server.py
+"""
+Local stand-in for the Gemini generateContent REST endpoint.
+
+Answers single and packed (ARRAY schema) optimization requests with deterministic results,
+with optional artificial latency and failure rate for exercising timeouts, retries and the
+circuit breaker. Point the app at it with GEMINI_BASE_URL=http://127.0.0.1:8765.
+
+Usage:
+    python -m utils.fake_gemini_server --port 8765 --latency-ms 200 --failure-rate 0.1
+"""
+
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+def _fake_result(prompt: str) -> dict:
+    words = prompt.split()
+    optimized = " ".join(words[:12]).rstrip(".,;:") + "."
+    original_complexity = min(100.0, 10.0 + 1.5 * len(words))
+    optimized_complexity = min(100.0, 10.0 + 1.5 * len(optimized.split()))
+    return {
+        "generatedOptimizedPrompt": optimized,
+        "similarityScore": 100.0 * len(optimized.split()) / max(1, len(words)),
+        "originalPromptComplexity": original_complexity,
+        "optimizedPromptComplexity": optimized_complexity,
+    }
+
+def _extract_prompts(text: str, is_batch: bool) -> list[str]:
+    if is_batch:
+        return [json.loads(m.group(1)) for m in re.finditer(r"^\s*\d+\. (\".*\")\s*$", text, re.MULTILINE)]
+    match = re.search(r'Given the user prompt: "(.*)"\.', text, re.DOTALL)
+    return [match.group(1) if match else text]
+
+class FakeGeminiHandler(BaseHTTPRequestHandler):
+    latency_ms = 0.0
+    failure_rate = 0.0
+    request_count = 0
+    _count_lock = threading.Lock()
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status: int, payload: dict):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        with FakeGeminiHandler._count_lock:
+            FakeGeminiHandler.request_count += 1
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+        if random.random() < self.failure_rate:
+            self._reply(503, {"error": {"code": 503, "message": "Fake overload"}})
+            return
+
+        text = request["contents"][0]["parts"][0]["text"]
+        is_batch = request.get("generationConfig", {}).get("responseSchema", {}).get("type") == "ARRAY"
+        prompts = _extract_prompts(text, is_batch)
+        if is_batch:
+            result = [{"index": i, **_fake_result(p)} for i, p in enumerate(prompts)]
+        else:
+            result = _fake_result(prompts[0])
+        self._reply(200, {"candidates": [{"content": {"parts": [{"text": json.dumps(result)}]}}]})
+
+def start_fake_server(port: int = 0, latency_ms: float = 0.0, failure_rate: float = 0.0) -> ThreadingHTTPServer:
+    """Starts the fake server on a background thread and returns it (server.server_port has the port)."""
+    handler = type("ConfiguredFakeGeminiHandler", (FakeGeminiHandler,), {"latency_ms": latency_ms, "failure_rate": failure_rate})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    threading.Thread(target=server.serve_forever, name="fake-gemini", daemon=True).start()
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    args = parser.parse_args()
+    server = start_fake_server(args.port, args.latency_ms, args.failure_rate)
+    print(f"Fake Gemini endpoint on http://127.0.0.1:{server.server_port}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()